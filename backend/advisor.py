@@ -0,0 +1,267 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import urllib.parse
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+from catalog import quote_identifier, referenced_tables
+from database import get_db_connection
+from file_process import FileProcessor
+from rollups import ADVISOR_TABLE, build_rollup, filter_columns, parse_shape, rollup_name
+from sql_guard import QUERY_TIMEOUT
+from utils import run_blocking
+
+# 同一模式（过滤列或分组维度）至少在多少条历史查询中出现才建索引或汇总表
+ADVISOR_MIN_QUERIES = int(os.environ.get("ADVISOR_MIN_QUERIES", 3))
+# 同一数据集两次分析之间的最小间隔（秒）
+ADVISOR_INTERVAL = float(os.environ.get("ADVISOR_INTERVAL", 60))
+# 每个数据集分析的最近查询条数
+ADVISOR_HISTORY = int(os.environ.get("ADVISOR_HISTORY", 500))
+# 每张表最多的汇总表数
+ADVISOR_MAX_ROLLUPS = int(os.environ.get("ADVISOR_MAX_ROLLUPS", 4))
+# 汇总表行数超过原表的该比例时不保留（预聚合收益太小）
+ADVISOR_MAX_ROLLUP_RATIO = float(os.environ.get("ADVISOR_MAX_ROLLUP_RATIO", 0.2))
+# 在物化库上建索引和汇总表时写连接的页缓存（MB），新建的对象不超过该大小时提交前不阻塞查询
+ADVISOR_CACHE_MB = int(os.environ.get("ADVISOR_CACHE_MB", 256))
+# 提交时等待正在进行的查询释放读锁的最长时间（秒），查询至多执行 QUERY_TIMEOUT 秒
+ADVISOR_LOCK_TIMEOUT = float(os.environ.get("ADVISOR_LOCK_TIMEOUT", QUERY_TIMEOUT + 10))
+
+
+class QueryAdvisor:
+    """
+    根据查询历史为物化库建索引和汇总表的后台任务。
+    从 messages 中读取在该数据集上成功执行过的 SQL，统计 WHERE 中常用的列和
+    GROUP BY 的维度组合：常用的过滤列建索引（之后由 SQLite 查询优化器选用），
+    常见的分组维度建预聚合的汇总表，匹配的查询由 rollups.route 改写到汇总表上。
+    物化库重建（文件变化）时这些对象随之丢弃，之后按新的历史重新生成。
+    """
+
+    def __init__(self, socketio, processor: Optional[FileProcessor] = None,
+                 interval: float = ADVISOR_INTERVAL):
+        self.socketio = socketio
+        self.processor = processor or FileProcessor()
+        self.interval = interval
+        # 物化库路径 -> 上次分析的时间
+        self._last_run: Dict[str, float] = {}
+        self._running: set = set()
+        self._lock = threading.Lock()
+
+    def schedule(self, files: Sequence[Union[str, Tuple[str, str]]]) -> None:
+        """查询成功后调用：距离上次分析超过 interval 的数据集在后台重新分析"""
+        file_paths = [item if isinstance(item, str) else item[0] for item in files]
+        now = time.time()
+        with self._lock:
+            due = [
+                path for path in file_paths
+                if path not in self._running and now - self._last_run.get(path, 0) >= self.interval
+            ]
+            self._running.update(due)
+            for path in due:
+                self._last_run[path] = now
+        if due:
+            self.socketio.start_background_task(self._run, due)
+
+    def _run(self, file_paths: List[str]) -> None:
+        try:
+            self.advise(file_paths)
+        except Exception as e:
+            print(f"Query advisor failed for {file_paths}: {e}")
+        finally:
+            with self._lock:
+                self._running.difference_update(file_paths)
+
+    def _history(self, file_paths: Sequence[str]) -> List[Tuple[List[Tuple[str, str]], str]]:
+        """关联了这些文件的会话中成功执行过的 SQL：[(会话的文件列表, SQL)]"""
+        placeholders = ",".join("?" * len(file_paths))
+        conn = get_db_connection()
+        try:
+            rows = conn.execute(f"""
+                SELECT m.session_id, m.text FROM messages m
+                WHERE m.role = 'assistant'
+                  AND m.session_id IN (SELECT session_id FROM session_files WHERE file_path IN ({placeholders}))
+                  AND EXISTS (SELECT 1 FROM query_results q WHERE q.message_id = m.id)
+                ORDER BY m.id DESC LIMIT ?
+            """, (*file_paths, ADVISOR_HISTORY * len(file_paths))).fetchall()
+            session_files: Dict[Any, List[Tuple[str, str]]] = {}
+            for session_id in {row["session_id"] for row in rows}:
+                session_files[session_id] = [
+                    (f["file_path"], f["file_name"]) for f in conn.execute(
+                        "SELECT file_path, file_name FROM session_files WHERE session_id = ? ORDER BY id",
+                        (session_id,),
+                    )
+                ]
+        finally:
+            conn.close()
+        return [(session_files[row["session_id"]], row["text"]) for row in rows]
+
+    def advise(self, file_paths: Sequence[str]) -> Dict[str, Any]:
+        """分析一次并在物化库上建索引和汇总表，返回各物化库新建的对象"""
+        # (物化库路径, 表) -> 统计
+        filters: Dict[Tuple[str, str], Counter] = defaultdict(Counter)
+        shapes: Dict[Tuple[str, str], Counter] = defaultdict(Counter)
+        measures: Dict[Tuple[str, str], Dict[frozenset, set]] = defaultdict(lambda: defaultdict(set))
+        profiles: Dict[Tuple[str, str], Dict[str, Any]] = {}
+
+        tables_by_session: Dict[tuple, Dict[str, Dict[str, Any]]] = {}
+        for files, text in self._history(file_paths):
+            key = tuple(files)
+            if key not in tables_by_session:
+                tables_by_session[key] = self.processor.catalog_tables(files)
+            tables = tables_by_session[key]
+            sql = self.processor.extract_sql(text)
+            names = referenced_tables(sql, tables)
+            # 多表查询中的列无法可靠地对应到表，只统计单表查询
+            if len(names) != 1:
+                continue
+            name = names.pop()
+            entry = tables[name]
+            if entry["file_path"] not in file_paths:
+                continue
+            target = (entry["store_path"], entry["table"])
+            profiles[target] = entry["profile"]
+            columns = [col["name"] for col in entry["profile"]["columns"]]
+            filters[target].update(filter_columns(sql, columns))
+            shape = parse_shape(sql, name, columns)
+            if shape is not None:
+                dims = frozenset(shape["dims"])
+                shapes[target][dims] += 1
+                measures[target][dims] |= shape["measures"]
+
+        created: Dict[str, Any] = {}
+        for target, profile in profiles.items():
+            store_path, table = target
+            index_columns = [col for col, count in filters[target].most_common() if count >= ADVISOR_MIN_QUERIES]
+            rollup_dims = [dims for dims, count in shapes[target].most_common() if count >= ADVISOR_MIN_QUERIES]
+            if not index_columns and not rollup_dims:
+                continue
+            # 汇总表的度量覆盖所有能由它回答的查询（维度为其子集）
+            rollup_specs = [
+                (dims, set().union(*(m for d, m in measures[target].items() if d <= dims)))
+                for dims in rollup_dims
+            ]
+            with self.processor.store_lock(store_path):
+                # 等待期间物化库可能已被删除或重建
+                if not os.path.exists(store_path):
+                    continue
+                # 建索引和汇总表需要扫描整张表，在线程池中执行，不阻塞事件循环
+                result = run_blocking(
+                    self._apply, store_path, table, profile["row_count"], index_columns, rollup_specs
+                )
+            if result["indexes"] or result["rollups"]:
+                created.setdefault(store_path, {"indexes": [], "rollups": []})
+                for kind in ("indexes", "rollups"):
+                    created[store_path][kind] += result[kind]
+        return created
+
+    @staticmethod
+    def _existing(store_path: str, table: str) -> Tuple[Dict[str, Tuple[str, Dict[str, Any]]], set]:
+        """只读地读取已有的对象：(_advisor 中的记录 {名称: (类型, 定义)}, 已作为某个索引首列的列)"""
+        store_uri = f"file:{urllib.parse.quote(os.path.abspath(store_path))}?mode=ro"
+        conn = sqlite3.connect(store_uri, uri=True)
+        try:
+            known = {}
+            if conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (ADVISOR_TABLE,)).fetchone():
+                known = {name: (kind, json.loads(definition)) for name, kind, definition in conn.execute(
+                    f"SELECT name, kind, definition FROM {ADVISOR_TABLE} WHERE base_table = ?", (table,)
+                )}
+            indexed = set()
+            for index in conn.execute(f"PRAGMA index_list({quote_identifier(table)})").fetchall():
+                first = conn.execute(f"PRAGMA index_info({quote_identifier(index[1])})").fetchone()
+                if first is not None:
+                    indexed.add(first[2])
+        finally:
+            conn.close()
+        return known, indexed
+
+    @staticmethod
+    def _plan_rollups(table: str, known: Dict[str, Tuple[str, Dict[str, Any]]],
+                      rollup_specs: List[Tuple[frozenset, set]]) -> List[Tuple[frozenset, set]]:
+        """需要新建或补充度量列的汇总表：[(维度, 度量列)]"""
+        rollups = {
+            name: (set(d["dims"]), set(d["measures"])) for name, (kind, d) in known.items() if kind == "rollup"
+        }
+        builds = []
+        for dims, measure_cols in rollup_specs:
+            name = rollup_name(table, dims)
+            previous = known.get(name)
+            # 已有汇总表覆盖该模式，或之前建过但行数太多
+            if any(dims <= d and measure_cols <= m for d, m in rollups.values()):
+                continue
+            # 同一维度的汇总表需要更多度量列时原地重建，不占用新的名额
+            if name not in rollups and len(rollups) >= ADVISOR_MAX_ROLLUPS:
+                continue
+            if previous is not None and previous[0] == "rejected" \
+                    and measure_cols <= set(previous[1]["measures"]):
+                continue
+            if name in rollups:
+                measure_cols = measure_cols | rollups[name][1]
+            builds.append((dims, measure_cols))
+            # 按建成计入名额，建成后行数太多的在下次分析时补上其他模式
+            rollups[name] = (set(dims), set(measure_cols))
+        return builds
+
+    @classmethod
+    def _apply(cls, store_path: str, table: str, row_count: int,
+               index_columns: List[str], rollup_specs: List[Tuple[frozenset, set]]) -> Dict[str, List[Any]]:
+        """
+        在物化库上直接建索引和汇总表，全部放在一个事务中，失败时回滚，不复制整个物化库。
+        写连接只在提交时需要独占锁：写入前先取 RESERVED 锁（BEGIN IMMEDIATE），
+        查询进程以只读方式挂载的连接在此期间照常读取；页缓存容得下新建的对象时，
+        不会在提交前把脏页写回文件而提前阻塞读取。提交后物化库的 mtime 变化，
+        已挂载的连接和汇总表定义的缓存随之刷新。调用方持有该物化库的锁；没有需要新建的对象时不写入。
+        """
+        created: Dict[str, List[Any]] = {"indexes": [], "rollups": []}
+        known, indexed = cls._existing(store_path, table)
+        # 已作为某个索引首列的列不再重复建索引
+        index_columns = [col for col in index_columns if col not in indexed]
+        builds = cls._plan_rollups(table, known, rollup_specs)
+        if not index_columns and not builds:
+            return created
+
+        # isolation_level=None：事务由下面的 BEGIN/COMMIT 显式控制
+        conn = sqlite3.connect(store_path, timeout=ADVISOR_LOCK_TIMEOUT, isolation_level=None)
+        try:
+            conn.execute(f"PRAGMA cache_size = -{ADVISOR_CACHE_MB * 1024}")
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {ADVISOR_TABLE} "
+                "(name TEXT PRIMARY KEY, kind TEXT, base_table TEXT, definition TEXT)"
+            )
+            for col in index_columns:
+                index_key = f"{table}.{col}".encode("utf-8")
+                index_name = f"idx_adv_{hashlib.sha1(index_key).hexdigest()[:12]}"
+                conn.execute(f"CREATE INDEX IF NOT EXISTS {quote_identifier(index_name)} "
+                             f"ON {quote_identifier(table)} ({quote_identifier(col)})")
+                conn.execute(f"INSERT OR REPLACE INTO {ADVISOR_TABLE} VALUES (?, 'index', ?, ?)",
+                             (index_name, table, json.dumps({"columns": [col]}, ensure_ascii=False)))
+                created["indexes"].append(col)
+
+            for dims, measure_cols in builds:
+                name, rows = build_rollup(conn, table, dims, measure_cols)
+                definition = {"dims": sorted(dims), "measures": sorted(measure_cols), "rows": rows}
+                if rows > max(row_count * ADVISOR_MAX_ROLLUP_RATIO, 1):
+                    # 记录下来，之后的分析不再重复尝试
+                    conn.execute(f"DROP TABLE {quote_identifier(name)}")
+                    conn.execute(f"INSERT OR REPLACE INTO {ADVISOR_TABLE} VALUES (?, 'rejected', ?, ?)",
+                                 (name, table, json.dumps(definition, ensure_ascii=False)))
+                    continue
+                conn.execute(f"INSERT OR REPLACE INTO {ADVISOR_TABLE} VALUES (?, 'rollup', ?, ?)",
+                             (name, table, json.dumps(definition, ensure_ascii=False)))
+                created["rollups"].append(definition)
+
+            if created["indexes"] or created["rollups"]:
+                # 更新统计信息，查询优化器据此决定是否使用新索引
+                conn.execute("ANALYZE")
+                print(f"Query advisor on {store_path}: {created}")
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        return created
@@ -1,20 +1,39 @@
-from flask import Flask, request, jsonify
+import os
+
+# Socket.IO 异步模式，eventlet 下需要尽早 monkey patch，使网络 IO 变为协作式
+SOCKETIO_ASYNC_MODE = os.environ.get("SOCKETIO_ASYNC_MODE", "eventlet")
+if SOCKETIO_ASYNC_MODE == "eventlet":
+    import eventlet
+    eventlet.monkey_patch()
+
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
-from flask_socketio import SocketIO, emit
-from database import get_db_connection, init_db
-import requests
-import json
+from flask_socketio import SocketIO, join_room
+from database import get_db_connection, get_pool_stats, init_db
 from datetime import datetime, timezone
-import os
-from werkzeug.utils import secure_filename
 import pandas as pd
-from file_process import FileProcessor
-import numpy as np
-from typing import Tuple
+from file_process import FileProcessor, result_cache
+from result_store import (
+    ResultSetStore, RESULT_PAGE_SIZE, window, encode_frame, decode_frame
+)
+from ingest import IngestionManager, session_room
+from advisor import QueryAdvisor
+from blob_store import BlobStore
+from llm_client import llm_client
+from intent import classify_by_keywords, classify_with_llm
+from context import build_context, CONTEXT_MAX_MESSAGES
+from query_pool import QueryPool
+from streaming import ResultStreamer
+from chart_data import build_chart_data
+from cache import TranslationCache
+from serialization import OrjsonProvider, SocketJSON, dumps
 import urllib.parse
+import re
 
 app = Flask(__name__)
 app.config['JSON_AS_ASCII'] = False  # 确保JSON响应支持中文
+# JSON 响应和 Socket.IO 事件统一由 orjson 编码，表格数据按列直接编码为字节
+app.json = OrjsonProvider(app)
 CORS(
     app,
     resources={
@@ -23,10 +42,45 @@ CORS(
 )
 
 socketio = SocketIO(
-    app, cors_allowed_origins=["http://localhost:3000", "http://192.168.0.28:3000"]
+    app,
+    cors_allowed_origins=["http://localhost:3000", "http://192.168.0.28:3000"],
+    async_mode=SOCKETIO_ASYNC_MODE,
+    json=SocketJSON,
 )
 
-OLLAMA_API_URL = "http://localhost:11434/api/chat"
+# 上传文件的后台导入任务
+ingestion = IngestionManager(socketio)
+
+# 按查询历史为数据集建索引和汇总表的后台任务
+advisor = QueryAdvisor(socketio)
+
+# 自然语言 -> SQL 翻译缓存
+sql_cache = TranslationCache()
+
+# 查询执行进程池，等待结果时让出协程
+query_pool = QueryPool(wait=socketio.sleep)
+
+
+def load_result_frame(message_id: int):
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT result_format, result_blob FROM query_results WHERE message_id = ?",
+            (message_id,),
+        )
+        row = cursor.fetchone()
+    finally:
+        conn.close()
+    return decode_frame(row["result_format"], row["result_blob"]) if row else None
+
+
+# 会话历史分页大小
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 200
+
+# 服务端保存的结果集，客户端分页获取
+result_sets = ResultSetStore(load_result_frame)
 
 # 配置上传文件夹
 UPLOAD_FOLDER = "uploads"
@@ -36,6 +90,17 @@ ALLOWED_EXTENSIONS = {"csv", "xlsx", "xls"}
 if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
 
+# 上传文件按内容寻址存储，内容相同的上传共用一个文件和物化库
+blob_store = BlobStore()
+
+
+def release_files(conn, file_paths) -> None:
+    """会话不再引用这些文件后重新计数，删除已无会话引用的上传文件及其物化库"""
+    unreferenced = blob_store.sync_refs(conn, file_paths)
+    conn.commit()
+    if unreferenced:
+        blob_store.collect(conn, unreferenced, on_remove=FileProcessor().invalidate)
+
 
 def allowed_file(filename):
     return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -82,6 +147,12 @@ def start_session():
         conn.close()
 
 
+@socketio.on("join_session")
+def handle_join_session(data):
+    # 加入会话房间，以接收数据集导入进度
+    join_room(session_room(data["session_id"]))
+
+
 @socketio.on("send_message")
 def handle_send_message(data):
     session_id = data["session_id"]
@@ -97,14 +168,15 @@ def handle_send_message(data):
         cursor = conn.cursor()
         processor = FileProcessor()
 
-        # 1. 检查文件
+        # 1. 检查文件，一个会话可以关联多个数据集
         cursor.execute(
-            "SELECT file_path, file_name FROM session_files WHERE session_id = ?",
+            "SELECT file_path, file_name FROM session_files WHERE session_id = ? ORDER BY id",
             (session_id,),
         )
-        file_info = cursor.fetchone()
+        files = [(row["file_path"], row["file_name"]) for row in cursor.fetchall()]
+        file_paths = [file_path for file_path, _ in files]
 
-        if not file_info:
+        if not file_paths:
             socketio.emit(
                 "receive_message",
                 {"text": "Error: No file associated with this session.", "done": True},
@@ -112,8 +184,26 @@ def handle_send_message(data):
             )
             return
 
-        # 2. 分析表结构
-        table_info = processor.get_table_info(file_info["file_path"])
+        # 数据集仍在后台导入时，不在消息处理中重复解析
+        jobs = ingestion.jobs_for_session(session_id)
+        for job in (jobs[path] for path in file_paths if path in jobs):
+            if job["status"] in ("pending", "running"):
+                socketio.emit(
+                    "receive_message",
+                    {"text": f"The dataset {job['file_name']} is still being prepared ({job['percent']}%). Please try again shortly.", "done": True},
+                    room=request.sid,
+                )
+                return
+            if job["status"] == "failed":
+                socketio.emit(
+                    "receive_message",
+                    {"text": f"Error: Failed to process the uploaded file {job['file_name']}: {job['error']}", "done": True},
+                    room=request.sid,
+                )
+                return
+
+        # 2. 分析表结构（会话中所有的表）
+        table_info = processor.get_table_info(files)
 
         # 3. 保存消息
         cursor.execute(
@@ -122,53 +212,60 @@ def handle_send_message(data):
         )
         conn.commit()
 
-        # 4. 准备历史消息
-        cursor.execute("SELECT * FROM messages WHERE session_id = ?", (session_id,))
-        previous_messages = cursor.fetchall()
-        messages = [
-            {"role": msg["role"], "content": msg["text"]} for msg in previous_messages
-        ]
+        # 4. 准备历史消息：只读取最近的若干条，由 build_context 控制 token 预算
+        cursor.execute(
+            "SELECT role, text FROM messages WHERE session_id = ? ORDER BY id DESC LIMIT ?",
+            (session_id, CONTEXT_MAX_MESSAGES),
+        )
+        history = [dict(row) for row in reversed(cursor.fetchall())]
+        # LLM 生成期间不占用连接池中的连接
+        cursor.close()
+        conn.close()
 
-        # 5. 准备SQL转换提示
-        intent, system_prompt = get_prompt_by_intent(text, table_info)
-        
+        # 5. 相同数据集上的相同问题直接复用已生成的 SQL
+        dataset_version = processor.get_dataset_version(files)
+        cached = sql_cache.get(
+            dataset_version["content_hash"], text, dataset_version["schema_hash"]
+        )
 
-        # 6. LLM请求
-        payload = {
-            "model": "qwen2.5-coder:7b",
-            "stream": True,
-            "messages": [{"role": "system", "content": system_prompt}, *messages],
-        }
-
-        # 7. 流式处理LLM响应
-        with requests.post(
-            OLLAMA_API_URL,
-            json=payload,
-            headers={"Content-Type": "application/json"},
-            stream=True,
-        ) as response:
-            response.raise_for_status()
-
-            for line in response.iter_lines():
-                if line:
-                    json_data = json.loads(line.decode("utf-8"))
-                    if "message" in json_data and not json_data["done"]:
-                        if "content" in json_data["message"]:
-                            chunk = json_data["message"]["content"]
-                            sql_query += chunk
-                            socketio.emit(
-                                "receive_message",
-                                {"text": chunk, "done": False},
-                                room=request.sid,
-                            )
-                            socketio.sleep(0)
-                    elif json_data["done"]:
-                        break
+        if cached:
+            print(f"SQL cache hit: {text}")
+            wait_for_intent = lambda: cached["chart_type"]
+            # 命中缓存时仍通过同样的 receive_message 事件逐行发送
+            for chunk in re.findall(r".*?\n|.+$", cached["sql"]):
+                sql_query += chunk
+                socketio.emit(
+                    "receive_message",
+                    {"text": chunk, "done": False},
+                    room=request.sid,
+                )
+                socketio.sleep(0)
+        else:
+            # 准备SQL转换提示，意图判断与 SQL 生成并行
+            wait_for_intent = start_intent_classification(text)
+            system_prompt = get_sql_prompt(table_info)
+
+            # 6. LLM请求
+            llm_messages = build_context(system_prompt, history)
+
+            # 7. 流式处理LLM响应
+            for chunk in llm_client.stream_chat(
+                "qwen2.5-coder:7b", llm_messages, yield_control=lambda: socketio.sleep(0)
+            ):
+                sql_query += chunk
+                socketio.emit(
+                    "receive_message",
+                    {"text": chunk, "done": False},
+                    room=request.sid,
+                )
 
         # 8. 执行查询并生成结果
         sql_query = sql_query.strip()
+        intent = wait_for_intent()
         
         # 先保存助手消息以获取 message_id
+        conn = get_db_connection()
+        cursor = conn.cursor()
         cursor.execute(
             "INSERT INTO messages (session_id, role, text, type) VALUES (?, ?, ?, ?)",
             (session_id, "assistant", sql_query, intent),
@@ -176,28 +273,65 @@ def handle_send_message(data):
         conn.commit()
         message_id = cursor.lastrowid  # 获取新插入消息的ID
 
-        success, result = processor.execute_query(sql_query, file_info["file_path"])
-        print("result", result)
+        # 表格只发送第一页，图表数据在服务端聚合/降采样
+        page_size = RESULT_PAGE_SIZE
+        # 查询在独立进程中执行，客户端断开时取消；第一页边查询边推送
+        sid = request.sid
+        streamer = ResultStreamer(socketio, sid, message_id, intent)
+        success, result = processor.execute_query(
+            sql_query, files, page_size=page_size,
+            runner=query_pool.runner(
+                session_id, is_cancelled=lambda: not socketio.server.manager.is_connected(sid, "/")
+            ),
+            on_batch=streamer.send,
+        )
+        app.logger.debug("Query result: %s", result["table_data"]["total"] if success else result)
+        streamer.finish(
+            total=result["table_data"]["total"] if success else None,
+            error=None if success else result,
+        )
 
         if success:
+            # 只缓存能成功执行的 SQL
+            if not cached:
+                sql_cache.put(
+                    dataset_version["content_hash"],
+                    text,
+                    dataset_version["schema_hash"],
+                    sql_query,
+                    intent,
+                )
+
             # 存储查询结果
+            result_format, result_blob = encode_frame(result["frame"])
             cursor.execute("""
                 INSERT INTO query_results 
-                (message_id, session_id, query_data) 
-                VALUES (?, ?, ?)
-            """, (message_id, session_id, json.dumps(result["raw_data"])))
+                (message_id, session_id, query_data, row_count, result_format, result_blob) 
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (
+                message_id,
+                session_id,
+                dumps(result["raw_data"]).decode("utf-8"),
+                result["raw_data"]["row_count"],
+                result_format,
+                result_blob,
+            ))
             conn.commit()
-            
-            socketio.emit(
-                "receive_message",
-                {
-                    "table_data": result["table_data"],
-                    "chart_type": intent,  # 发送图表类型
-                    "message_id": message_id,
-                    "done": False,
-                },
-                room=request.sid,
-            )
+            result_sets.put(message_id, result["frame"])
+            # 新的查询计入历史，在后台为常见的过滤和分组建索引、汇总表
+            advisor.schedule(file_paths)
+            result["table_data"]["result_id"] = message_id
+            payload = {
+                "table_data": result["table_data"],
+                "chart_type": intent,  # 发送图表类型
+                "message_id": message_id,
+                "done": False,
+            }
+            if intent != "query":
+                # 图表数据（降采样/聚合后）单独发送，表格仍是结果的第一页
+                payload["chart_data"] = build_chart_data(result["frame"], intent)
+
+            socketio.emit("receive_message", payload, room=request.sid)
         else:
             socketio.emit(
                 "receive_message",
@@ -221,33 +355,103 @@ def handle_send_message(data):
 
 @app.route("/sessions/<int:session_id>/messages", methods=["GET"])
 def get_messages(session_id):
+    # 游标分页：从最新消息往前取，before_id 为上一页最早一条消息的ID
+    before_id = request.args.get("before_id", type=int)
+    limit = max(1, min(request.args.get("limit", HISTORY_PAGE_SIZE, type=int), HISTORY_MAX_PAGE_SIZE))
+
     conn = get_db_connection()
     cursor = conn.cursor()
     
-    # 获取消息和查询结果
+    # 获取消息，查询结果只返回引用，由客户端按需获取
     cursor.execute("""
-        SELECT m.*, qr.query_data 
+        SELECT m.id, m.session_id, m.role, m.text, m.type, m.created_at,
+               qr.message_id AS result_id, qr.row_count
         FROM messages m 
         LEFT JOIN query_results qr ON m.id = qr.message_id 
-        WHERE m.session_id = ?
-        ORDER BY m.id
-    """, (session_id,))
+        WHERE m.session_id = ? AND (? IS NULL OR m.id < ?)
+        ORDER BY m.id DESC
+        LIMIT ?
+    """, (session_id, before_id, before_id, limit + 1))
+    
+    rows = cursor.fetchall()
+    cursor.close()
+    conn.close()
+    
+    has_more = len(rows) > limit
+    rows = rows[:limit]
     
     messages = []
-    for row in cursor.fetchall():
+    for row in reversed(rows):  # 页内按时间顺序返回
         message = dict(row)
-        if message['query_data']:
-            # 重构表格数据
-            raw_data = json.loads(message['query_data'])
-            df = pd.DataFrame(
-                data=raw_data['result']['data'],
-                columns=raw_data['result']['columns']
-            )
-            message['table_data'] = FileProcessor()._to_antd_format(df)
-            
+        result_id = message.pop('result_id')
+        row_count = message.pop('row_count')
+        if result_id is not None:
+            message['table_ref'] = {"result_id": result_id, "total": row_count}
         messages.append(message)
     
-    return jsonify({"messages": messages})
+    return jsonify({
+        "messages": messages,
+        "has_more": has_more,
+        "next_before_id": rows[-1]["id"] if has_more else None,
+    })
+
+
+@app.route("/results/<int:message_id>", methods=["GET"])
+def get_result_page(message_id):
+    # 分页获取结果集，支持排序和筛选
+    df = result_sets.get(message_id)
+    if df is None:
+        return jsonify({"error": "Result not found"}), 404
+
+    args = request.args
+    page = window(
+        df,
+        offset=args.get("offset", 0, type=int),
+        limit=args.get("limit", RESULT_PAGE_SIZE, type=int),
+        sort=args.get("sort"),
+        order=args.get("order", "asc"),
+        search=args.get("search"),
+        search_column=args.get("search_column"),
+    )
+    page["result_id"] = message_id
+    return jsonify(page)
+
+
+@app.route("/results/<int:message_id>/chart", methods=["GET"])
+def get_result_chart(message_id):
+    # 图表数据：折线/散点降采样，饼图/条形图保留前 N 类，数据量有上限
+    df = result_sets.get(message_id)
+    if df is None:
+        return jsonify({"error": "Result not found"}), 404
+
+    chart = build_chart_data(df, request.args.get("type", "line"))
+    chart["result_id"] = message_id
+    return jsonify(chart)
+
+
+@app.route("/results/<int:message_id>/csv", methods=["GET"])
+def export_result_csv(message_id):
+    # 导出完整结果集
+    df = result_sets.get(message_id)
+    if df is None:
+        return jsonify({"error": "Result not found"}), 404
+    return Response(
+        df.to_csv(index=False),
+        mimetype="text/csv",
+        headers={"Content-Disposition": f"attachment; filename=result-{message_id}.csv"},
+    )
+
+
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    # 运行指标：连接池等待时间等
+    return jsonify({
+        "db_pool": get_pool_stats(),
+        "sql_cache": sql_cache.stats(),
+        "result_cache": result_cache.stats(),
+        "result_sets": result_sets.stats(),
+        "query_pool": query_pool.stats(),
+    })
 
 
 #  delete session
@@ -256,10 +460,15 @@ def delete_session(session_id):
     conn = get_db_connection()
     try:
         cursor = conn.cursor()
+        cursor.execute("SELECT file_path FROM session_files WHERE session_id = ?", (session_id,))
+        file_paths = [row["file_path"] for row in cursor.fetchall()]
         cursor.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+        cursor.execute("DELETE FROM session_files WHERE session_id = ?", (session_id,))
         cursor.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
         conn.commit()
         cursor.close()
+        # 最后一个引用被删除时回收上传文件
+        release_files(conn, file_paths)
     except Exception as e:
         print(f"Error deleting session: {e}")
         return jsonify({"error": "Failed to delete session"}), 500
@@ -309,20 +518,33 @@ def upload_file():
                 "final_filename": filename
             })
             
-            # 确保文件名使用UTF-8编码
-            file_path = os.path.join(UPLOAD_FOLDER, filename)
-            file.save(file_path)
+            # 边保存边计算内容哈希，内容相同的文件只保存一份，
+            # 原始文件名只作为会话中的表名，同名上传不再互相覆盖
+            blob = blob_store.save(file.stream, extension)
+            file_path = blob["file_path"]
+            print(f"Stored upload as {file_path} ({'new' if blob['created'] else 'duplicate'})")
 
             # 处理文件
             processor = FileProcessor()
             conn = get_db_connection()
             try:
-                success, result = processor.handle_file_upload(
-                    file_path, session_id, conn
-                )
+                try:
+                    blob_store.register(conn, blob)
+                    success, result = processor.handle_file_upload(
+                        file_path, session_id, conn, file_name=os.path.splitext(filename)[0]
+                    )
+                finally:
+                    # 会话的引用已写入 session_files（或上传失败），之后按引用数回收
+                    blob_store.unpin(file_path)
+                # 更新引用数，校验失败且没有其他会话引用时回收刚保存的文件
+                release_files(conn, [file_path])
 
                 if success:
-                    return jsonify(result), 201
+                    # 在后台分块导入数据集，立即返回任务ID
+                    job = ingestion.submit(session_id, file_path, result["file_name"])
+                    result["job_id"] = job["job_id"]
+                    result["status"] = job["status"]
+                    return jsonify(result), 202
                 else:
                     return jsonify(result), 500
             finally:
@@ -335,36 +557,74 @@ def upload_file():
     return jsonify({"error": "File type not allowed"}), 400
 
 
-@app.route("/sessions/<int:session_id>/file", methods=["GET"])
-def get_session_file(session_id):
+@app.route("/sessions/<int:session_id>/files", methods=["GET"])
+def get_session_files(session_id):
+    # 会话关联的所有数据集（按上传顺序）及其导入状态
     conn = get_db_connection()
     try:
         cursor = conn.cursor()
         cursor.execute(
-            "SELECT file_path, file_name FROM session_files WHERE session_id = ?",
+            "SELECT file_path, file_name FROM session_files WHERE session_id = ? ORDER BY id",
             (session_id,),
         )
-        file_info = cursor.fetchone()
-
-        if file_info:
-            return jsonify(
-                {
-                    "file": {
-                        "file_path": file_info["file_path"],
-                        "file_name": file_info["file_name"],
-                    }
-                }
-            )
-        else:
-            return jsonify({"file": None}), 200
+        rows = cursor.fetchall()
+
+        jobs = ingestion.jobs_for_session(session_id)
+        files = []
+        for row in rows:
+            job = jobs.get(row["file_path"])
+            files.append({
+                "file_path": row["file_path"],
+                "file_name": row["file_name"],
+                "job_id": job["job_id"] if job else None,
+                "status": job["status"] if job else "ready",
+                "percent": job["percent"] if job else 100,
+            })
+        return jsonify({"files": files}), 200
 
     except Exception as e:
-        print(f"Error fetching session file: {e}")
-        return jsonify({"error": "Failed to fetch session file"}), 500
+        print(f"Error fetching session files: {e}")
+        return jsonify({"error": "Failed to fetch session files"}), 500
     finally:
         conn.close()
 
 
+@app.route("/sessions/<int:session_id>/files", methods=["DELETE"])
+def remove_session_file(session_id):
+    # 从会话中移除一个数据集，仍被其他会话引用时文件和物化库继续保留
+    file_path = (request.json or {}).get("file_path")
+    if not file_path:
+        return jsonify({"error": "No file path provided"}), 400
+
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            "DELETE FROM session_files WHERE session_id = ? AND file_path = ?",
+            (session_id, file_path),
+        )
+        conn.commit()
+        removed = cursor.rowcount
+        release_files(conn, [file_path])
+    except Exception as e:
+        print(f"Error removing session file: {e}")
+        return jsonify({"error": "Failed to remove session file"}), 500
+    finally:
+        conn.close()
+
+    if not removed:
+        return jsonify({"error": "File not found"}), 404
+    return jsonify({"message": "File removed from session"}), 200
+
+
+@app.route("/ingestion/<job_id>", methods=["GET"])
+def get_ingestion_job(job_id):
+    job = ingestion.get(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify({"job": job})
+
+
 @app.route("/preview_csv", methods=["POST"])
 def preview_csv():
     try:
@@ -374,36 +634,13 @@ def preview_csv():
         if not file_path or not os.path.exists(file_path):
             return jsonify({"error": "File not found"}), 404
 
-        # 读取CSV文件（限制预览行数）
-        df = pd.read_csv(file_path, nrows=50)  # 限制预览50行
-        
-        # 处理特殊值（NaN, Infinity等）
-        df = df.replace({
-            np.nan: None,  # 将 NaN 转换为 None (会被JSON序列化为null)
-            np.inf: None,  # 将 Infinity 转换为 None
-            -np.inf: None  # 将 -Infinity 转换为 None
-        })
-        
-        # 确保所有数值都能被JSON序列化
-        for col in df.select_dtypes(include=[np.number]).columns:
-            df[col] = df[col].astype(float).apply(lambda x: None if pd.isna(x) else float(x))
-        
-        # 构建表格数据
-        preview_data = {
-            "columns": [
-                {"title": str(col), "dataIndex": str(col), "key": str(col)} 
-                for col in df.columns
-            ],
-            "dataSource": df.to_dict('records')
-        }
-        
-        # 验证JSON序列化是否成功
-        try:
-            json.dumps(preview_data)
-        except TypeError as e:
-            app.logger.error(f"JSON serialization error: {str(e)}")
-            return jsonify({"error": "Data serialization failed"}), 500
-        
+        # 第一页为上传时生成的预览，分页和随机抽样按行号从物化库读取
+        preview_data = FileProcessor().get_preview(
+            file_path,
+            offset=int(data.get('offset', 0)),
+            limit=int(data.get('limit', 50)),
+            sample=bool(data.get('sample', False)),
+        )
         return jsonify(preview_data)
 
     except pd.errors.EmptyDataError:
@@ -415,65 +652,9 @@ def preview_csv():
         return jsonify({"error": str(e)}), 500
 
 
-def get_prompt_by_intent(text: str, table_info: str) -> Tuple[str, str]:
-    try:
-        # 首先判断用户意图和图表类型
-        intent_prompt = f"""Analyze the user's request and determine:
-        1. If it's a visualization request or a regular query
-        2. What type of chart would be most suitable
-        
-        User request: "{text}"
-        
-        Return ONLY one of these options:
-        - "query" for regular data queries
-        - "line" for time series or trend analysis
-        - "bar" for comparisons between categories
-        - "pie" for showing proportions
-        - "scatter" for correlation analysis
-        - "column" for grouped comparisons
-        """
-        
-        # 获取意图
-        payload = {
-            "model": "qwen2.5-coder:3b",
-            "messages": [{"role": "user", "content": intent_prompt}],
-            "stream": False
-        }
-        
-        response = requests.post(OLLAMA_API_URL, json=payload)
-        response_data = response.json()
-        
-        # 安全地获取意图并清理
-        raw_type = response_data.get("message", {}).get("content", "query").strip().lower()
-        
-        # 清理和标准化图表类型
-        def normalize_chart_type(raw_type: str) -> str:
-            # 移除常见的额外字符
-            cleaned = raw_type.replace('"', '').replace("'", "").replace("-", "").replace(":", "").strip()
-            
-            # 定义有效的图表类型
-            valid_types = {
-                "query": "query",
-                "line": "line",
-                "bar": "bar",
-                "pie": "pie",
-                "scatter": "scatter",
-                "column": "column"
-            }
-            
-            # 查找最匹配的图表类型
-            for valid_type in valid_types:
-                if valid_type in cleaned:
-                    return valid_types[valid_type]
-            
-            # 如果没有匹配到任何有效类型，返回默认值
-            return "query"
-        
-        chart_type = normalize_chart_type(raw_type)
-        print(f"Raw intent: {raw_type} -> Normalized: {chart_type}")
-        
-        # 统一的 SQL 生成 prompt
-        sql_prompt = f"""You are a SQL expert. Convert the request into a SQL query.
+def get_sql_prompt(table_info: str) -> str:
+    # 统一的 SQL 生成 prompt
+    return f"""You are a SQL expert. Convert the request into a SQL query.
         Current table structure:
         {table_info}
         
@@ -491,14 +672,32 @@ def get_prompt_by_intent(text: str, table_info: str) -> Tuple[str, str]:
         
         Remember: Your ONLY task is to generate one SQL query. Data processing and visualization will be handled elsewhere.
         """
-        
-        return chart_type, sql_prompt
-            
-    except Exception as e:
-        print(f"Error in get_prompt_by_intent: {e}")
-        return "query", sql_prompt
 
 
+def start_intent_classification(text: str):
+    """
+    判断图表类型：关键词规则足够可信时直接返回，
+    否则在后台调用小模型，与 SQL 生成并行进行。
+    返回一个可调用对象，调用时得到最终的图表类型。
+    """
+    chart_type = classify_by_keywords(text)
+    if chart_type:
+        print(f"Keyword intent: {chart_type}")
+        return lambda: chart_type
+
+    result = {"chart_type": "query"}
+
+    def classify():
+        result["chart_type"] = classify_with_llm(text)
+
+    task = socketio.start_background_task(classify)
+
+    def wait():
+        task.join()
+        return result["chart_type"]
+
+    return wait
+
 
 if __name__ == "__main__":
     with app.app_context():
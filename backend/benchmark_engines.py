@@ -0,0 +1,63 @@
+"""
+对比各查询引擎在同一数据集、同一组 SQL 上的耗时。
+
+用法：
+    python benchmark_engines.py data.csv
+    python benchmark_engines.py data.csv "SELECT count(*) FROM data" --repeat 10
+
+未指定 SQL 时根据数据集概要生成几条典型查询（计数、分组聚合、排序取前 N）。
+"""
+import argparse
+import statistics
+import time
+from typing import Any, Dict, List
+
+from engines import ENGINES
+from file_process import FileProcessor
+
+
+def default_queries(profile: Dict[str, Any]) -> List[str]:
+    table = profile["tables"][0]
+    name = table["table_name"]
+    columns = table["columns"]
+    numeric = [c["name"] for c in columns if c["type"].startswith(("int", "float"))]
+    categorical = [c["name"] for c in columns if c["type"] == "object"]
+
+    queries = [f'SELECT COUNT(*) FROM "{name}"']
+    if categorical and numeric:
+        queries.append(
+            f'SELECT "{categorical[0]}", COUNT(*), AVG("{numeric[0]}") FROM "{name}" '
+            f'GROUP BY "{categorical[0]}" ORDER BY 2 DESC'
+        )
+    if numeric:
+        queries.append(f'SELECT * FROM "{name}" ORDER BY "{numeric[0]}" DESC LIMIT 100')
+    return queries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark query engines on the same dataset")
+    parser.add_argument("file_path")
+    parser.add_argument("queries", nargs="*")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    processor = FileProcessor()
+    dataset = processor._dataset(processor.catalog_tables(args.file_path))
+    queries = args.queries or default_queries(processor.get_profile(args.file_path))
+
+    print(f"{'engine':<8} {'rows':>8} {'min ms':>10} {'median ms':>10}  query")
+    for sql in queries:
+        for engine in ENGINES.values():
+            if not engine.supports(dataset):
+                print(f"{engine.name:<8} {'-':>8} {'-':>10} {'-':>10}  (unsupported) {sql}")
+                continue
+            timings = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                df = engine.execute(sql, dataset)
+                timings.append((time.perf_counter() - start) * 1000)
+            print(f"{engine.name:<8} {len(df):>8} {min(timings):>10.1f} {statistics.median(timings):>10.1f}  {sql}")
+
+
+if __name__ == "__main__":
+    main()
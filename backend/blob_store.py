@@ -0,0 +1,123 @@
+import hashlib
+import os
+import threading
+import uuid
+from collections import Counter
+from typing import Any, BinaryIO, Dict, Iterable, List
+
+# 上传文件按内容寻址存放的目录
+BLOB_DIR = os.environ.get("BLOB_DIR", os.path.join("uploads", "blobs"))
+# 保存上传文件时每次读取的字节数
+BLOB_CHUNK_SIZE = 1024 * 1024
+
+
+class BlobStore:
+    """
+    按内容寻址的上传文件存储：保存时边写入边计算 SHA-256，
+    文件存放在 <前两位>/<哈希><扩展名>，内容相同的上传共用同一个文件，
+    因此也共用同一个物化库和表概要。
+    blobs 表记录每个文件被多少个会话引用（ref_count，由 session_files 重新计数），
+    引用数降为 0 的文件由 collect 删除。
+    save 返回的文件在会话登记引用（写入 session_files）之前还没有被计数，
+    因此保持锁定，直到调用 unpin；判断文件是否存在和 collect 删除文件在同一把锁内进行，
+    锁定的文件不会被回收。锁只在当前进程内有效，上传和删除会话都在 Web 进程中处理。
+    """
+
+    def __init__(self, root: str = BLOB_DIR):
+        self.root = root
+        self._lock = threading.Lock()
+        # 文件路径 -> 正在处理的上传数
+        self._pins: Counter = Counter()
+
+    def path_for(self, content_hash: str, extension: str) -> str:
+        return os.path.join(self.root, content_hash[:2], f"{content_hash}{extension.lower()}")
+
+    def save(self, stream: BinaryIO, extension: str) -> Dict[str, Any]:
+        """
+        流式保存上传内容，返回 {content_hash, file_path, size, created}。
+        内容已存在时丢弃临时文件，created 为 False。
+        返回的文件保持锁定，登记引用后（或放弃上传时）需调用 unpin。
+        """
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = os.path.join(self.root, f".upload-{uuid.uuid4().hex}.tmp")
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with open(tmp_path, "wb") as f:
+                for block in iter(lambda: stream.read(BLOB_CHUNK_SIZE), b""):
+                    digest.update(block)
+                    f.write(block)
+                    size += len(block)
+
+            content_hash = digest.hexdigest()
+            file_path = self.path_for(content_hash, extension)
+            with self._lock:
+                created = not os.path.exists(file_path)
+                if created:
+                    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+                    os.replace(tmp_path, file_path)
+                self._pins[file_path] += 1
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        return {"content_hash": content_hash, "file_path": file_path, "size": size, "created": created}
+
+    def unpin(self, file_path: str) -> None:
+        with self._lock:
+            self._pins[file_path] -= 1
+            if self._pins[file_path] <= 0:
+                del self._pins[file_path]
+
+    @staticmethod
+    def register(db_conn, blob: Dict[str, Any]) -> None:
+        db_conn.execute(
+            "INSERT OR IGNORE INTO blobs (file_path, content_hash, size, ref_count) VALUES (?, ?, ?, 0)",
+            (blob["file_path"], blob["content_hash"], blob["size"]),
+        )
+
+    @staticmethod
+    def sync_refs(db_conn, file_paths: Iterable[str]) -> List[str]:
+        """按 session_files 重新计算这些文件的引用数，返回已不再被引用的文件"""
+        unreferenced = []
+        for file_path in set(file_paths):
+            db_conn.execute(
+                """
+                UPDATE blobs SET ref_count = (
+                    SELECT COUNT(*) FROM session_files WHERE session_files.file_path = blobs.file_path
+                ) WHERE file_path = ?
+                """,
+                (file_path,),
+            )
+            row = db_conn.execute("SELECT ref_count FROM blobs WHERE file_path = ?", (file_path,)).fetchone()
+            # 不在 blobs 表中的文件（如示例数据）不参与回收
+            if row is not None and row["ref_count"] == 0:
+                unreferenced.append(file_path)
+        return unreferenced
+
+    def collect(self, db_conn, file_paths: Iterable[str], on_remove=None) -> int:
+        """
+        删除引用数为 0 的文件及其 blobs 记录；on_remove(file_path) 用于清理派生数据（如物化库）。
+        在 save 的锁内再次确认引用数，正在上传（已锁定）的文件不删除。
+        """
+        removed = 0
+        for file_path in file_paths:
+            with self._lock:
+                if self._pins[file_path] > 0:
+                    continue
+                cursor = db_conn.execute(
+                    "DELETE FROM blobs WHERE file_path = ? AND ref_count = 0 AND NOT EXISTS "
+                    "(SELECT 1 FROM session_files WHERE session_files.file_path = blobs.file_path)",
+                    (file_path,),
+                )
+                db_conn.commit()
+                if cursor.rowcount == 0:
+                    continue
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+            # 物化库的删除需要等待正在进行的构建，不在锁内进行
+            if on_remove is not None:
+                on_remove(file_path)
+            removed += 1
+            print(f"Removed unreferenced upload {file_path}")
+        return removed
@@ -0,0 +1,260 @@
+import difflib
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+import pandas as pd
+
+# 自然语言 -> SQL 翻译缓存配置
+SQL_CACHE_SIZE = int(os.environ.get("SQL_CACHE_SIZE", 1024))
+SQL_CACHE_TTL = float(os.environ.get("SQL_CACHE_TTL", 24 * 3600))
+SQL_CACHE_FUZZY = os.environ.get("SQL_CACHE_FUZZY", "0") == "1"
+SQL_CACHE_FUZZY_THRESHOLD = float(os.environ.get("SQL_CACHE_FUZZY_THRESHOLD", 0.95))
+
+# 查询结果缓存配置
+RESULT_CACHE_SIZE = int(os.environ.get("RESULT_CACHE_SIZE", 256))
+RESULT_CACHE_MAX_ROWS = int(os.environ.get("RESULT_CACHE_MAX_ROWS", 100_000))
+# 内存层所有结果合计占用的内存上限（MB），按 DataFrame 实际占用（含字符串对象）计算
+RESULT_CACHE_MAX_MB = int(os.environ.get("RESULT_CACHE_MAX_MB", 256))
+RESULT_CACHE_DISK = os.environ.get("RESULT_CACHE_DISK", "0") == "1"
+RESULT_CACHE_DIR = os.environ.get("RESULT_CACHE_DIR", os.path.join("data", "result_cache"))
+RESULT_CACHE_DISK_FILES = int(os.environ.get("RESULT_CACHE_DISK_FILES", 2048))
+
+
+def frame_bytes(df: pd.DataFrame) -> int:
+    """DataFrame 占用的内存字节数，object 列按其中的 Python 对象实际大小计算"""
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+class LRUCache:
+    """
+    线程安全的 LRU 缓存，支持 TTL 过期，并统计命中/未命中次数。
+    给出 max_bytes 和 sizeof 时同时按条目大小之和限制，单个超过 max_bytes 的条目不缓存。
+    """
+
+    def __init__(self, max_size: int, ttl: Optional[float] = None,
+                 max_bytes: Optional[int] = None, sizeof: Optional[Callable[[Any], int]] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_bytes = max_bytes if sizeof is not None else None
+        self.sizeof = sizeof
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._sizes: Dict[Hashable, int] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _remove(self, key: Hashable) -> None:
+        del self._data[key]
+        self._bytes -= self._sizes.pop(key, 0)
+
+    def _expired(self, stored_at: float) -> bool:
+        return self.ttl is not None and time.time() - stored_at > self.ttl
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or self._expired(entry[0]):
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        size = self.sizeof(value) if self.sizeof is not None else 0
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            if self.max_bytes is not None and size > self.max_bytes:
+                return
+            self._data[key] = (time.time(), value)
+            if self.sizeof is not None:
+                self._sizes[key] = size
+                self._bytes += size
+            while len(self._data) > self.max_size or (
+                    self.max_bytes is not None and self._bytes > self.max_bytes):
+                self._remove(next(iter(self._data)))
+                self.evictions += 1
+
+    def items(self):
+        """未过期条目的快照，不影响 LRU 顺序和统计"""
+        with self._lock:
+            return [(k, v) for k, (stored_at, v) in self._data.items() if not self._expired(stored_at)]
+
+    def record_hit(self) -> None:
+        with self._lock:
+            self.hits += 1
+            self.misses -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            stats = {
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+            if self.sizeof is not None:
+                stats["bytes"] = self._bytes
+                stats["max_bytes"] = self.max_bytes
+            return stats
+
+
+def normalize_question(text: str) -> str:
+    """统一大小写、标点和空白，使措辞上的细微差别命中同一缓存"""
+    text = text.lower().strip()
+    text = re.sub(r"[^\w\s]", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class TranslationCache:
+    """
+    自然语言问题 -> SQL 的缓存，键为 (数据集指纹, 标准化问题, 表结构哈希)。
+    可选地在同一数据集内按文本相似度模糊匹配。
+    """
+
+    def __init__(self, max_size: int = SQL_CACHE_SIZE, ttl: float = SQL_CACHE_TTL,
+                 fuzzy: bool = SQL_CACHE_FUZZY, fuzzy_threshold: float = SQL_CACHE_FUZZY_THRESHOLD):
+        self._cache = LRUCache(max_size, ttl)
+        self.fuzzy = fuzzy
+        self.fuzzy_threshold = fuzzy_threshold
+        self.fuzzy_hits = 0
+
+    def get(self, dataset_hash: str, question: str, schema_hash: str) -> Optional[Dict[str, Any]]:
+        normalized = normalize_question(question)
+        entry = self._cache.get((dataset_hash, normalized, schema_hash))
+        if entry is not None or not self.fuzzy:
+            return entry
+
+        # 模糊匹配：只在同一数据集、同一表结构的条目中查找最相似的问题
+        best, best_ratio = None, 0.0
+        for (d_hash, cached_question, s_hash), value in self._cache.items():
+            if d_hash != dataset_hash or s_hash != schema_hash:
+                continue
+            ratio = difflib.SequenceMatcher(None, normalized, cached_question).ratio()
+            if ratio > best_ratio:
+                best, best_ratio = value, ratio
+
+        if best is not None and best_ratio >= self.fuzzy_threshold:
+            self._cache.record_hit()
+            self.fuzzy_hits += 1
+            return best
+        return None
+
+    def put(self, dataset_hash: str, question: str, schema_hash: str, sql: str, chart_type: str) -> None:
+        self._cache.put(
+            (dataset_hash, normalize_question(question), schema_hash),
+            {"sql": sql, "chart_type": chart_type},
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self._cache.stats()
+        stats["fuzzy_hits"] = self.fuzzy_hits
+        return stats
+
+
+def canonicalize_sql(sql: str) -> str:
+    """
+    规范化 SQL 文本：去掉注释和结尾分号，合并空白，
+    引号外的内容统一小写，引号内（字符串和标识符）保持原样。
+    """
+    parts = re.split(r"""('(?:[^']|'')*'|"(?:[^"]|"")*")""", sql)
+    canonical = []
+    for i, part in enumerate(parts):
+        if i % 2:
+            canonical.append(part)
+            continue
+        part = re.sub(r"--[^\n]*", " ", part)
+        part = re.sub(r"/\*.*?\*/", " ", part, flags=re.DOTALL)
+        part = re.sub(r"\s+", " ", part.lower())
+        canonical.append(re.sub(r"\s*([(),=<>+\-*/])\s*", r"\1", part))
+    return "".join(canonical).strip().rstrip(";").strip()
+
+
+class ResultCache:
+    """
+    查询结果缓存，键为 (数据集内容哈希, 规范化 SQL)，不区分会话。
+    内存中保存最近使用的结果（按条数和合计字节数限制），可选的磁盘层在进程重启后仍可复用。
+    """
+
+    def __init__(self, max_size: int = RESULT_CACHE_SIZE, max_rows: int = RESULT_CACHE_MAX_ROWS,
+                 disk: bool = RESULT_CACHE_DISK, disk_dir: str = RESULT_CACHE_DIR,
+                 disk_files: int = RESULT_CACHE_DISK_FILES, max_mb: int = RESULT_CACHE_MAX_MB):
+        self._memory = LRUCache(max_size, max_bytes=max_mb * 1024 * 1024, sizeof=frame_bytes)
+        self.max_rows = max_rows
+        self.disk = disk
+        self.disk_dir = disk_dir
+        self.disk_files = disk_files
+        self.disk_hits = 0
+
+    def _disk_path(self, key: Tuple[str, str]) -> str:
+        digest = hashlib.sha1("\0".join(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.disk_dir, f"{digest}.pkl")
+
+    def get(self, dataset_hash: str, sql: str) -> Optional[pd.DataFrame]:
+        key = (dataset_hash, canonicalize_sql(sql))
+        result = self._memory.get(key)
+        if result is not None or not self.disk:
+            return result
+
+        path = self._disk_path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            result = pd.read_pickle(path)
+        except Exception as e:
+            print(f"Failed to load cached result {path}: {e}")
+            return None
+
+        # 磁盘命中后提升到内存层
+        self._memory.record_hit()
+        self._memory.put(key, result)
+        self.disk_hits += 1
+        return result
+
+    def put(self, dataset_hash: str, sql: str, result: pd.DataFrame) -> None:
+        # 过大的结果不缓存，避免挤占内存
+        if len(result) > self.max_rows:
+            return
+        key = (dataset_hash, canonicalize_sql(sql))
+        self._memory.put(key, result)
+
+        if self.disk:
+            try:
+                os.makedirs(self.disk_dir, exist_ok=True)
+                path = self._disk_path(key)
+                result.to_pickle(f"{path}.tmp")
+                os.replace(f"{path}.tmp", path)
+                self._trim_disk()
+            except Exception as e:
+                print(f"Failed to write cached result: {e}")
+
+    def _trim_disk(self) -> None:
+        """磁盘层超过上限时删除最早写入的文件"""
+        entries = [e for e in os.scandir(self.disk_dir) if e.name.endswith(".pkl")]
+        if len(entries) <= self.disk_files:
+            return
+        entries.sort(key=lambda e: e.stat().st_mtime)
+        for entry in entries[:len(entries) - self.disk_files]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self._memory.stats()
+        stats["disk_enabled"] = self.disk
+        stats["disk_hits"] = self.disk_hits
+        return stats
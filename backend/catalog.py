@@ -0,0 +1,119 @@
+import hashlib
+import os
+import re
+import sqlite3
+import urllib.parse
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Set, Tuple
+
+from sql_guard import QUERY_TIMEOUT
+
+# 同一连接上同时 ATTACH 的物化库上限（SQLite 默认最多 10 个）
+CATALOG_MAX_ATTACHED = int(os.environ.get("CATALOG_MAX_ATTACHED", 10))
+# 每个挂载的物化库以内存映射方式读取的最大字节数（MB），页面由系统页缓存提供、可随时回收，不占用 SQLite 堆内存
+CATALOG_MMAP_MB = int(os.environ.get("CATALOG_MMAP_MB", 256))
+
+IDENTIFIER_PATTERN = re.compile(r'"((?:[^"]|"")+)"|`([^`]+)`|\[([^\]]+)\]|([^\W\d]\w*)')
+STRING_PATTERN = re.compile(r"'(?:[^']|'')*'")
+
+
+def quote_identifier(name: str) -> str:
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def referenced_tables(sql: str, table_names: Iterable[str]) -> Set[str]:
+    """
+    SQL 中出现的目录表名（不区分大小写，忽略字符串常量）。
+    只按标识符匹配，列名与表名相同时会多挂载一个数据集，不影响结果。
+    """
+    by_lower = {name.lower(): name for name in table_names}
+    found = set()
+    for match in IDENTIFIER_PATTERN.finditer(STRING_PATTERN.sub("''", sql)):
+        identifier = next(group for group in match.groups() if group is not None).replace('""', '"')
+        name = by_lower.get(identifier.lower())
+        if name is not None:
+            found.add(name)
+    return found
+
+
+class QueryCatalog:
+    """
+    共享的查询目录：一个 SQLite 连接，每个物化库作为独立的 schema 按需 ATTACH（只读），
+    查询用到的表以 TEMP VIEW 的形式注册为会话中的表名。
+    TEMP 中的名称优先于已挂载的库，不同会话中的同名表不会互相冲突。
+    readable 为本次查询可以读取的 (schema, 表)，交给授权回调，
+    其他仍挂载着的库（之前的会话用过的）不能直接读取。
+    同一时间只供一个查询使用。
+    """
+
+    def __init__(self, max_attached: int = CATALOG_MAX_ATTACHED, mmap_mb: int = CATALOG_MMAP_MB):
+        self.max_attached = max_attached
+        self.mmap_size = mmap_mb * 1024 * 1024
+        # 以 URI 方式打开，ATTACH 时才能使用只读的 URI 文件名。
+        # 顾问在物化库上提交新建的索引和汇总表时，要等正在进行的查询结束（至多 QUERY_TIMEOUT），
+        # 其间开始的查询等待同样长的时间，而不是立即因 database is locked 失败
+        self.conn = sqlite3.connect("file::memory:", uri=True, check_same_thread=False, timeout=QUERY_TIMEOUT)
+        # 排序、分组、DISTINCT 使用的临时 B 树放在磁盘上，不随数据量占用内存。
+        # 修改 temp_store 会删除所有 TEMP 对象，只能在注册视图之前设置
+        self.conn.execute("PRAGMA temp_store = FILE")
+        # 物化库路径 -> (schema 名, 挂载时的 mtime)
+        self._attached: "OrderedDict[str, tuple]" = OrderedDict()
+        self._views: Set[str] = set()
+        self.readable: Set[Tuple[str, str]] = set()
+        self.attaches = 0
+
+    @staticmethod
+    def _schema_name(store_path: str) -> str:
+        return "ds_" + hashlib.sha1(os.path.abspath(store_path).encode("utf-8")).hexdigest()[:12]
+
+    def _detach(self, store_path: str) -> None:
+        schema, _ = self._attached.pop(store_path)
+        self.conn.execute(f"DETACH DATABASE {quote_identifier(schema)}")
+
+    def _attach(self, store_path: str, keep: Set[str]) -> str:
+        mtime = os.stat(store_path).st_mtime_ns
+        attached = self._attached.get(store_path)
+        if attached is not None and attached[1] == mtime:
+            self._attached.move_to_end(store_path)
+            return attached[0]
+        if attached is not None:
+            # 物化库已被重建（os.replace），重新挂载新文件
+            self._detach(store_path)
+
+        # 超过上限时卸载最久未使用、本次查询不需要的库
+        for stale in list(self._attached):
+            if len(self._attached) < self.max_attached:
+                break
+            if stale not in keep:
+                self._detach(stale)
+
+        schema = self._schema_name(store_path)
+        store_uri = f"file:{urllib.parse.quote(os.path.abspath(store_path))}?mode=ro"
+        self.conn.execute(f"ATTACH DATABASE ? AS {quote_identifier(schema)}", (store_uri,))
+        self.conn.execute(f"PRAGMA {quote_identifier(schema)}.mmap_size = {self.mmap_size}")
+        self._attached[store_path] = (schema, mtime)
+        self.attaches += 1
+        return schema
+
+    def bind(self, tables: Dict[str, Dict[str, Any]]) -> None:
+        """
+        注册本次查询用到的表：tables 为 {表名: {"store_path", "table"}}，
+        table 为物化库中的表名。只挂载这些表所在的库。
+        """
+        for view in self._views:
+            self.conn.execute(f"DROP VIEW IF EXISTS temp.{quote_identifier(view)}")
+        self._views = set()
+        self.readable = set()
+
+        keep = {table["store_path"] for table in tables.values()}
+        for name, table in tables.items():
+            schema = self._attach(table["store_path"], keep)
+            self.conn.execute(
+                f"CREATE TEMP VIEW {quote_identifier(name)} AS "
+                f"SELECT * FROM {quote_identifier(schema)}.{quote_identifier(table['table'])}"
+            )
+            self._views.add(name)
+            self.readable.add((schema, table["table"]))
+
+    def close(self) -> None:
+        self.conn.close()
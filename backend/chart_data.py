@@ -0,0 +1,147 @@
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from serialization import table_payload
+
+# 折线图/散点图最多发送的点数
+CHART_MAX_POINTS = int(os.environ.get("CHART_MAX_POINTS", 1000))
+# 饼图/条形图最多显示的类别数（含 "Other"）
+CHART_MAX_CATEGORIES = int(os.environ.get("CHART_MAX_CATEGORIES", 12))
+OTHER_LABEL = "Other"
+
+
+def split_fields(df: pd.DataFrame) -> Tuple[List[str], List[str]]:
+    """与前端 ChartRenderer 一致：数值列作为度量，其余列作为类别"""
+    numeric, category = [], []
+    for col in df.columns:
+        dtype = df[col].dtype
+        if pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype):
+            numeric.append(col)
+        else:
+            category.append(col)
+    return numeric, category
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets 降采样，返回保留点的下标。
+    每个桶中选取与前一个保留点、下一个桶均值构成三角形面积最大的点，保留曲线形状。
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    every = (n - 2) / (threshold - 2)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    a = 0
+    for i in range(threshold - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+
+        xs, ys = x[start:end], y[start:end]
+        area = np.abs((x[a] - avg_x) * (ys - y[a]) - (x[a] - xs) * (avg_y - y[a]))
+        a = start + int(area.argmax())
+        selected[i + 1] = a
+    selected[-1] = n - 1
+    return selected
+
+
+def minmax_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    按 x 排序后分桶，每桶保留 y 最小和最大的点，保留散点的上下包络和离群点；
+    x 最小和最大的点总是保留，横轴范围不变。
+    """
+    n = len(x)
+    if threshold >= n:
+        return np.arange(n)
+    order = np.argsort(x, kind="stable")
+    if threshold < 4:
+        return np.sort(order[np.linspace(0, n - 1, max(threshold, 1)).astype(np.int64)])
+    buckets = np.arange(n) * ((threshold - 2) // 2) // n
+    sorted_y = pd.Series(y[order])
+    grouped = sorted_y.groupby(buckets)
+    keep = np.union1d(grouped.idxmin().to_numpy(), grouped.idxmax().to_numpy())
+    keep = np.union1d(keep, [0, n - 1])
+    return np.sort(order[keep])
+
+
+def _numeric_axis(series: pd.Series) -> np.ndarray:
+    """折线图横轴：数值或日期直接使用，否则按行序"""
+    if pd.api.types.is_numeric_dtype(series.dtype):
+        return series.to_numpy(dtype=float)
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        return series.astype("int64").to_numpy(dtype=float)
+    return np.arange(len(series), dtype=float)
+
+
+def top_categories(df: pd.DataFrame, category: str, value: str, series: Optional[str] = None,
+                   max_categories: int = CHART_MAX_CATEGORIES) -> pd.DataFrame:
+    """
+    按数值总和保留前 max_categories - 1 个类别，其余合并为 "Other"。
+    有分组字段（series）时在每个分组内分别合并。
+    """
+    totals = df.groupby(category, sort=False, dropna=False)[value].sum().sort_values(ascending=False)
+    key_columns = [category] if series is None else [category, series]
+    if len(totals) <= max_categories and not df.duplicated(subset=key_columns).any():
+        return df
+
+    keep = set(totals.index[:max_categories - 1]) if len(totals) > max_categories else set(totals.index)
+    labels = df[category].where(df[category].isin(keep), OTHER_LABEL)
+    keys = [labels] if series is None else [labels, df[series]]
+    grouped = df[value].groupby(keys, sort=False, dropna=False).sum().reset_index()
+    grouped.columns = [category, value] if series is None else [category, series, value]
+
+    # 按类别总和排序，"Other" 放在最后
+    order = {name: rank for rank, name in enumerate(totals.index)}
+    grouped["_order"] = grouped[category].map(lambda name: order.get(name, len(order)))
+    return grouped.sort_values("_order", kind="stable").drop(columns="_order")
+
+
+def build_chart_data(df: pd.DataFrame, chart_type: str,
+                     max_points: int = CHART_MAX_POINTS,
+                     max_categories: int = CHART_MAX_CATEGORIES) -> Dict[str, Any]:
+    """
+    生成有上限的图表数据：折线图用 LTTB、散点图用分桶 min/max 降采样，
+    饼图/条形图保留前 N 个类别并把其余合并为 "Other"。
+    返回与 table_data 相同结构的 {columns, data, total}，并标明采用的方法。
+    """
+    numeric, category = split_fields(df)
+    method = None
+    out = df
+
+    if chart_type == "line" and numeric and len(df) > max_points:
+        x_col = category[0] if category else None
+        y_col = numeric[0]
+        points = df
+        if x_col and pd.api.types.is_datetime64_any_dtype(df[x_col].dtype):
+            # NaT 转为整数是 int64 最小值，会把其余的点挤到横轴一端，先去掉
+            points = df[df[x_col].notna()]
+        x = _numeric_axis(points[x_col]) if x_col else np.arange(len(points), dtype=float)
+        y = np.nan_to_num(points[y_col].to_numpy(dtype=float))
+        out = points.iloc[lttb_indices(x, y, max_points)]
+        method = "lttb"
+    elif chart_type == "scatter" and len(numeric) >= 2 and len(df) > max_points:
+        x = np.nan_to_num(df[numeric[0]].to_numpy(dtype=float))
+        y = np.nan_to_num(df[numeric[1]].to_numpy(dtype=float))
+        out = df.iloc[minmax_indices(x, y, max_points)]
+        method = "minmax"
+    elif chart_type in ("pie", "bar", "column") and numeric and category:
+        series = category[1] if chart_type != "pie" and len(category) > 1 else None
+        grouped = top_categories(df, category[0], numeric[0], series, max_categories)
+        if grouped is not df:
+            out = grouped
+            method = "top_n"
+
+    # 其余情况（如缺少数值列）只截取前 max_points 行，保证数据量有上限
+    if len(out) > max_points:
+        out = out.head(max_points)
+        method = method or "head"
+
+    return table_payload(out, total=len(df), downsampled=method)
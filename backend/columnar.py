@@ -0,0 +1,104 @@
+import os
+import sqlite3
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# 列式副本每个行组的行数，行组是按统计信息（min/max）跳过数据的最小单位
+PARQUET_ROW_GROUP_ROWS = int(os.environ.get("PARQUET_ROW_GROUP_ROWS", 65_536))
+PARQUET_COMPRESSION = os.environ.get("PARQUET_COMPRESSION", "snappy")
+
+
+def arrow_type(dtype: str) -> pa.DataType:
+    """表概要中合并后的类型（见 TableProfiler._merge_type）对应的 Arrow 类型，分块推断不一致时已取更宽的类型"""
+    if dtype.startswith("int") or dtype.startswith("uint"):
+        return pa.int64()
+    if dtype.startswith("float"):
+        return pa.float64()
+    if dtype == "bool":
+        return pa.bool_()
+    if dtype.startswith("datetime64"):
+        return pa.timestamp("ns")
+    return pa.string()
+
+
+def _coerce(series: pd.Series, target: pa.DataType) -> pd.Series:
+    """把从 SQLite 读回的列转换为固定的类型，无法转换的值视为缺失"""
+    if pa.types.is_integer(target):
+        return series.astype("Int64") if series.isna().any() else series.astype("int64")
+    if pa.types.is_floating(target):
+        return pd.to_numeric(series, errors="coerce").astype("float64")
+    if pa.types.is_boolean(target):
+        return series.astype("boolean")
+    if pa.types.is_timestamp(target):
+        return pd.to_datetime(series, errors="coerce")
+    return series.astype("string")
+
+
+def export_table(conn: sqlite3.Connection, table_name: str, columns: List[Dict[str, Any]],
+                 path: str, row_group_rows: int = PARQUET_ROW_GROUP_ROWS) -> None:
+    """
+    把物化库中的一张表按行组写成 Parquet（标准化列名、固定类型，每个行组带 min/max 统计），
+    供列式引擎做列裁剪和谓词下推。先写临时文件再原子替换。
+    """
+    schema = pa.schema([(col["name"], arrow_type(col["type"])) for col in columns])
+    tmp_path = f"{path}.tmp"
+    writer = pq.ParquetWriter(tmp_path, schema, compression=PARQUET_COMPRESSION)
+    try:
+        for chunk in pd.read_sql_query(
+            f'SELECT * FROM "{table_name}" ORDER BY rowid', conn, chunksize=row_group_rows
+        ):
+            chunk = chunk.apply(lambda s: _coerce(s, schema.field(s.name).type))
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False),
+                               row_group_size=row_group_rows)
+    finally:
+        writer.close()
+    os.replace(tmp_path, path)
+
+
+def _open(path: str) -> pq.ParquetFile:
+    # 内存映射打开，重复读取由系统页缓存直接提供，不经过额外的读缓冲
+    return pq.ParquetFile(path, memory_map=True)
+
+
+def _row_group_offsets(parquet_file: pq.ParquetFile) -> np.ndarray:
+    """各行组起始行号，最后一项为总行数"""
+    metadata = parquet_file.metadata
+    sizes = [metadata.row_group(i).num_rows for i in range(metadata.num_row_groups)]
+    return np.concatenate([[0], np.cumsum(sizes, dtype=np.int64)])
+
+
+def read_rows(path: str, offset: int, limit: int, columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
+    """按行号读取一段行，只解码覆盖这段行的行组和所需的列"""
+    parquet_file = _open(path)
+    bounds = _row_group_offsets(parquet_file)
+    groups = [
+        i for i in range(len(bounds) - 1)
+        if bounds[i] < offset + limit and bounds[i + 1] > offset
+    ]
+    if not groups:
+        return parquet_file.schema_arrow.empty_table().select(columns or parquet_file.schema_arrow.names).to_pandas()
+    table = parquet_file.read_row_groups(groups, columns=columns)
+    start = offset - int(bounds[groups[0]])
+    return table.slice(start, limit).to_pandas()
+
+
+def take_rows(path: str, indices: Sequence[int], columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
+    """读取指定行号（从 0 开始、升序）的行，只解码包含这些行的行组"""
+    parquet_file = _open(path)
+    bounds = _row_group_offsets(parquet_file)
+    indices = np.asarray(indices, dtype=np.int64)
+    group_of = np.searchsorted(bounds, indices, side="right") - 1
+    groups = sorted(set(group_of.tolist()))
+    if not groups:
+        return parquet_file.schema_arrow.empty_table().select(columns or parquet_file.schema_arrow.names).to_pandas()
+    table = parquet_file.read_row_groups(groups, columns=columns)
+    # 行号换算为所读行组拼接后的位置
+    group_start = {group: start for group, start in zip(groups, np.cumsum([0] + [
+        int(bounds[g + 1] - bounds[g]) for g in groups[:-1]
+    ]))}
+    positions = [int(group_start[g] + i - bounds[g]) for g, i in zip(group_of.tolist(), indices.tolist())]
+    return table.take(pa.array(positions, type=pa.int64())).to_pandas()
@@ -0,0 +1,119 @@
+import os
+import re
+from typing import Any, Dict, List, Optional
+
+# 发送给模型的上下文预算（估算的 token 数，包含 system prompt）
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", 4096))
+# 从数据库读取的最近消息条数上限，更早的消息不参与构建上下文
+CONTEXT_MAX_MESSAGES = int(os.environ.get("CONTEXT_MAX_MESSAGES", 40))
+# 单条历史消息压缩后的 token 上限
+CONTEXT_MESSAGE_MAX_TOKENS = int(os.environ.get("CONTEXT_MESSAGE_MAX_TOKENS", 256))
+# 较早问题摘要的 token 上限
+CONTEXT_SUMMARY_MAX_TOKENS = int(os.environ.get("CONTEXT_SUMMARY_MAX_TOKENS", 256))
+
+SQL_BLOCK_PATTERN = re.compile(r"```sql\s*(.*?)```", re.DOTALL | re.IGNORECASE)
+CJK_PATTERN = re.compile(r"[\u3000-\u9fff\uac00-\ud7af\uff00-\uffef]")
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：中日韩字符按一个 token 计，其余约 4 个字符一个 token"""
+    if not text:
+        return 0
+    cjk = len(CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """按估算的 token 数截断文本"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if estimate_tokens(text[:mid]) <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    return text[:low].rstrip() + " ..."
+
+
+def compact_message(role: str, text: str, max_tokens: int = CONTEXT_MESSAGE_MAX_TOKENS) -> str:
+    """
+    压缩单条历史消息：助手消息只保留生成的 SQL，
+    不含 SQL 的长回答（如示例中的 Markdown 表格）按 token 上限截断。
+    """
+    text = (text or "").strip()
+    if role == "assistant":
+        blocks = SQL_BLOCK_PATTERN.findall(text)
+        if blocks:
+            text = "```sql\n" + blocks[-1].strip() + "\n```"
+    return truncate_to_tokens(text, max_tokens)
+
+
+def summarize_questions(questions: List[str], max_tokens: int = CONTEXT_SUMMARY_MAX_TOKENS) -> Optional[str]:
+    """把超出预算的较早问题压缩成一条简短摘要，从最近的问题开始保留"""
+    if not questions:
+        return None
+    header = "Earlier questions in this conversation (oldest first):"
+    budget = max_tokens - estimate_tokens(header)
+    kept = []
+    for question in reversed(questions):
+        line = "- " + truncate_to_tokens(" ".join(question.split()), 40)
+        cost = estimate_tokens(line) + 1
+        if cost > budget:
+            break
+        kept.append(line)
+        budget -= cost
+    if not kept:
+        return None
+    return "\n".join([header, *reversed(kept)])
+
+
+def build_context(system_prompt: str, history: List[Dict[str, Any]],
+                  budget: int = CONTEXT_TOKEN_BUDGET) -> List[Dict[str, str]]:
+    """
+    构建发送给模型的消息列表，总量控制在 budget 以内。
+
+    - system prompt 原样放在最前面，不混入随对话变化的内容，
+      使 Ollama 能复用相同前缀的 KV 缓存；
+    - 从最新的消息往前保留压缩后的最近几轮；
+    - 放不下的较早问题压缩成一条摘要，放在 system prompt 之后。
+    history 为按时间顺序排列的 {"role", "text"}，最后一条是当前问题。
+    """
+    if not history:
+        return [{"role": "system", "content": system_prompt}]
+
+    remaining = budget - estimate_tokens(system_prompt) - CONTEXT_SUMMARY_MAX_TOKENS
+
+    # 当前问题无论如何都要发送
+    current = history[-1]
+    recent = [{"role": current["role"], "content": current["text"]}]
+    remaining -= estimate_tokens(recent[0]["content"])
+
+    cutoff = len(history) - 1
+    while cutoff > 0:
+        msg = history[cutoff - 1]
+        content = compact_message(msg["role"], msg["text"])
+        cost = estimate_tokens(content)
+        if cost > remaining:
+            break
+        recent.append({"role": msg["role"], "content": content})
+        remaining -= cost
+        cutoff -= 1
+    recent.reverse()
+
+    # 保留的部分不以助手消息开头，避免孤立的 SQL 回答
+    while len(recent) > 1 and recent[0]["role"] == "assistant":
+        recent.pop(0)
+        cutoff += 1
+
+    llm_messages = [{"role": "system", "content": system_prompt}]
+    # 摘要使用预留的额度；system prompt 和当前问题已占满预算时相应缩短或省略
+    summary = summarize_questions(
+        [m["text"] for m in history[:cutoff] if m["role"] == "user"],
+        max_tokens=min(CONTEXT_SUMMARY_MAX_TOKENS, remaining + CONTEXT_SUMMARY_MAX_TOKENS),
+    )
+    if summary:
+        llm_messages.append({"role": "system", "content": summary})
+    llm_messages.extend(recent)
+    return llm_messages
@@ -2,27 +2,172 @@ import sqlite3
 import os
 from datetime import datetime
 import time
+import threading
+import queue
 
-def get_db_connection():
-    # 确保数据目录存在
-    os.makedirs('data', exist_ok=True)
-    
-    # 添加超时和错误处理
-    for _ in range(3):  # 最多重试3次
+DB_PATH = 'data/chat.db'
+
+# 连接池配置
+POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 8))
+POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 5))
+
+# 每个新连接都会执行的 PRAGMA
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",     # 读写互不阻塞
+    "PRAGMA synchronous = NORMAL",   # WAL 模式下 NORMAL 已足够安全
+    "PRAGMA cache_size = -20000",    # 约 20MB 页缓存
+    "PRAGMA mmap_size = 268435456",  # 256MB 内存映射读取
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA busy_timeout = 20000",
+)
+
+
+class PooledConnection:
+    """
+    连接池中的连接代理，用法与 sqlite3.Connection 相同，
+    close() 时归还到连接池而不是真正关闭。
+    """
+
+    def __init__(self, pool, conn, overflow=False):
+        self._pool = pool
+        self._conn = conn
+        self._overflow = overflow
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        if self._conn is not None:
+            self._pool.release(self._conn, self._overflow)
+            self._conn = None
+
+
+class ConnectionPool:
+    """线程安全的 SQLite 连接池，启用 WAL，并记录获取连接的等待时间"""
+
+    def __init__(self, db_path, size=POOL_SIZE, timeout=POOL_TIMEOUT):
+        self.db_path = db_path
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._stats = {
+            "acquired": 0,
+            "overflow": 0,
+            "discarded": 0,
+            "wait_total_ms": 0.0,
+            "wait_max_ms": 0.0,
+        }
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=20,  # 设置超时时间
+            isolation_level=None,  # 自动提交模式
+            check_same_thread=False,  # 连接会在不同线程间复用
+        )
+        conn.row_factory = sqlite3.Row
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    @staticmethod
+    def _is_healthy(conn):
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def acquire(self):
+        start = time.perf_counter()
+        conn = None
+        overflow = False
+
+        while conn is None:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    can_create = self._created < self.size
+                    if can_create:
+                        self._created += 1
+                if can_create:
+                    conn = self._connect()
+                    break
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    # 连接池耗尽时临时创建额外连接，归还时直接关闭
+                    conn = self._connect()
+                    overflow = True
+                    break
+
+            # 健康检查，失效的连接丢弃后重新获取
+            if not self._is_healthy(conn):
+                self._discard(conn)
+                conn = None
+
+        waited_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self._stats["acquired"] += 1
+            self._stats["overflow"] += int(overflow)
+            self._stats["wait_total_ms"] += waited_ms
+            self._stats["wait_max_ms"] = max(self._stats["wait_max_ms"], waited_ms)
+
+        return PooledConnection(self, conn, overflow)
+
+    def release(self, conn, overflow=False):
+        if overflow:
+            conn.close()
+            return
+        try:
+            # 归还前回滚未提交的事务
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+        self._idle.put(conn)
+
+    def _discard(self, conn):
         try:
-            conn = sqlite3.connect(
-                'data/chat.db',
-                timeout=20,  # 设置超时时间
-                isolation_level=None  # 自动提交模式
-            )
-            conn.row_factory = sqlite3.Row
-            return conn
-        except sqlite3.OperationalError as e:
-            if 'database is locked' in str(e):
-                time.sleep(1)  # 等待1秒后重试
-                continue
-            raise
-    raise sqlite3.OperationalError("Could not connect to database after 3 retries")
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._created -= 1
+            self._stats["discarded"] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = self.size
+            stats["open"] = self._created
+        stats["idle"] = self._idle.qsize()
+        stats["wait_avg_ms"] = stats["wait_total_ms"] / stats["acquired"] if stats["acquired"] else 0.0
+        return stats
+
+
+_pool = ConnectionPool(DB_PATH)
+
+
+def get_db_connection():
+    # 从连接池获取连接，调用 close() 即归还
+    return _pool.acquire()
+
+
+def get_pool_stats():
+    return _pool.stats()
+
 
 def dict_factory(cursor, row):
     d = {}
@@ -42,6 +187,7 @@ def init_db():
     cursor.execute("DROP TABLE IF EXISTS messages")
     cursor.execute("DROP TABLE IF EXISTS sessions")
     cursor.execute("DROP TABLE IF EXISTS session_files")
+    cursor.execute("DROP TABLE IF EXISTS blobs")
     
     # 创建表
     cursor.execute("""
@@ -70,23 +216,55 @@ def init_db():
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             message_id INTEGER NOT NULL,
             session_id INTEGER NOT NULL,
-            query_data TEXT NOT NULL,
+            query_data TEXT NOT NULL,  -- SQL、列名、类型等元数据 (JSON)
+            row_count INTEGER,
+            result_format TEXT,  -- 'parquet-zstd' 或 'json'
+            result_blob BLOB,  -- 压缩后的结果数据
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY (message_id) REFERENCES messages(id) ON DELETE CASCADE,
             FOREIGN KEY (session_id) REFERENCES sessions(id) ON DELETE CASCADE
         )
     """)
     
+    # 会话历史按 (session_id, id) 分页，结果按 message_id 关联
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_messages_session_id
+        ON messages (session_id, id)
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_query_results_message_id
+        ON query_results (message_id, row_count)
+    """)
+    
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS session_files (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
             session_id INTEGER,
             file_path TEXT,
             file_name TEXT COLLATE NOCASE,  -- 添加COLLATE NOCASE支持大小写不敏感
-            PRIMARY KEY (session_id),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE (session_id, file_path),  -- 一个会话可关联多个文件
             FOREIGN KEY (session_id) REFERENCES sessions(id) ON DELETE CASCADE
         )
     ''')
     
+    # 按文件统计引用它的会话数
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_session_files_file_path
+        ON session_files (file_path)
+    """)
+    
+    # 按内容寻址保存的上传文件，ref_count 为引用它的会话数
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS blobs (
+            file_path TEXT PRIMARY KEY,  -- <哈希前两位>/<哈希><扩展名>
+            content_hash TEXT NOT NULL,
+            size INTEGER,
+            ref_count INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
     # 插入示例会话
     sample_sessions = [
         ("Python Programming Help", "2024-11-19 02:00:00"),
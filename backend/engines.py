@@ -0,0 +1,294 @@
+import os
+import sqlite3
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+import pandas as pd
+import pyarrow as pa
+
+from catalog import QueryCatalog
+from sql_guard import (
+    QueryRejected, QUERY_MAX_ROWS, QUERY_MEMORY_LIMIT_MB, QUERY_SPILL_DIR, QUERY_TIMEOUT,
+    check_query, install_memory_limit, install_timeout, is_timeout, limit_rows, validate_sql,
+)
+
+try:
+    import duckdb
+except ImportError:  # DuckDB 为可选依赖，未安装时只能使用 SQLite
+    duckdb = None
+
+try:
+    # eventlet 会把 threading 换成协程实现，超时计时需要真正的系统线程
+    from eventlet.patcher import original as _original
+    _threading = _original("threading")
+except ImportError:
+    import threading as _threading
+
+# 查询引擎，按部署选择：sqlite（默认）或 duckdb
+QUERY_ENGINE = os.environ.get("QUERY_ENGINE", "sqlite").lower()
+# 保持打开的数据集连接数（仅 keep_open 的引擎，如查询进程中的引擎）
+ENGINE_HANDLE_CACHE_SIZE = int(os.environ.get("ENGINE_HANDLE_CACHE_SIZE", 8))
+# 推送前几行时第一批的行数，之后逐批翻倍，让客户端尽早看到结果
+STREAM_BATCH_ROWS = int(os.environ.get("STREAM_BATCH_ROWS", 50))
+
+
+class QueryEngine:
+    """
+    查询引擎接口。dataset 描述本次查询用到的表（可来自多个已物化的数据集）：
+    - tables: {表名: {"store_path": 物化库路径, "table": 物化库中的表名}}
+    - row_counts: {表名: 行数}
+    - sources: {表名: {"path", "format", "columns": {原始列名: 标准化列名}}}
+    execute 返回的结果被截断时 attrs["truncated"] 为 True。
+    on_batch 不为空时，前 stream_rows 行在读取过程中分批回调，不必等待查询全部完成。
+    """
+
+    name = ""
+
+    def __init__(self, keep_open: bool = False, max_handles: int = ENGINE_HANDLE_CACHE_SIZE):
+        # keep_open 时复用已打开的连接（常驻的查询进程），否则每次查询新建并关闭
+        self.keep_open = keep_open
+        self.max_handles = max_handles
+        self._handles: "OrderedDict[Hashable, Any]" = OrderedDict()
+
+    def supports(self, dataset: Dict[str, Any]) -> bool:
+        return True
+
+    def _open(self, dataset: Dict[str, Any]):
+        raise NotImplementedError
+
+    def _handle_key(self, dataset: Dict[str, Any]) -> Hashable:
+        raise NotImplementedError
+
+    def _acquire(self, dataset: Dict[str, Any]):
+        """获取数据集连接，keep_open 时按数据集版本缓存，文件变化后自动重新打开"""
+        if not self.keep_open:
+            return self._open(dataset)
+        key = self._handle_key(dataset)
+        conn = self._handles.get(key)
+        if conn is None:
+            conn = self._open(dataset)
+            self._handles[key] = conn
+            while len(self._handles) > self.max_handles:
+                _, stale = self._handles.popitem(last=False)
+                stale.close()
+        self._handles.move_to_end(key)
+        return conn
+
+    def _release(self, conn, broken: bool = False) -> None:
+        if not self.keep_open:
+            conn.close()
+        elif broken:
+            for key, cached in list(self._handles.items()):
+                if cached is conn:
+                    del self._handles[key]
+            conn.close()
+
+    def execute(self, sql: str, dataset: Dict[str, Any],
+                max_rows: int = QUERY_MAX_ROWS, timeout: float = QUERY_TIMEOUT,
+                on_batch: Optional[Callable[[pd.DataFrame], None]] = None,
+                stream_rows: int = 0) -> pd.DataFrame:
+        raise NotImplementedError
+
+    @staticmethod
+    def _mark_truncated(df: pd.DataFrame, max_rows: int) -> pd.DataFrame:
+        truncated = len(df) > max_rows
+        if truncated:
+            df = df.iloc[:max_rows]
+        df.attrs["truncated"] = truncated
+        return df
+
+
+class SQLiteEngine(QueryEngine):
+    """
+    在物化的 SQLite 库上执行，支持所有上传格式。
+    各数据集通过查询目录（catalog.QueryCatalog）按需以只读方式挂载，支持跨表 JOIN；
+    keep_open 时目录常驻，已挂载的库在之后的查询中复用。
+    """
+
+    name = "sqlite"
+
+    def __init__(self, keep_open: bool = False, max_handles: int = ENGINE_HANDLE_CACHE_SIZE,
+                 heap_limit_mb: Optional[int] = None):
+        super().__init__(keep_open, max_handles)
+        # SQLite 的堆内存上限作用于整个进程，只在专门执行查询的进程中设置（见 query_pool），
+        # 在 Web 进程中设置会同时限制聊天记录等其他连接
+        self.heap_limit_mb = heap_limit_mb
+        self._catalog: Optional[QueryCatalog] = None
+
+    def _acquire(self, dataset: Dict[str, Any]) -> QueryCatalog:
+        if not self.keep_open:
+            catalog = QueryCatalog()
+        else:
+            if self._catalog is None:
+                self._catalog = QueryCatalog()
+            catalog = self._catalog
+        catalog.bind(dataset["tables"])
+        return catalog
+
+    def _release(self, catalog: QueryCatalog, broken: bool = False) -> None:
+        if not self.keep_open or broken:
+            catalog.close()
+            if catalog is self._catalog:
+                self._catalog = None
+
+    def execute(self, sql: str, dataset: Dict[str, Any],
+                max_rows: int = QUERY_MAX_ROWS, timeout: float = QUERY_TIMEOUT,
+                on_batch: Optional[Callable[[pd.DataFrame], None]] = None,
+                stream_rows: int = 0) -> pd.DataFrame:
+        catalog = self._acquire(dataset)
+        conn = catalog.conn
+        try:
+            # 在安装只读授权回调之前设置，PRAGMA 会被授权回调拒绝
+            if self.heap_limit_mb:
+                install_memory_limit(conn, self.heap_limit_mb)
+            statement = check_query(conn, sql, dataset.get("row_counts") or {}, readable=catalog.readable)
+            install_timeout(conn, timeout)
+            cursor = conn.execute(limit_rows(statement, max_rows))
+            columns = [col[0] for col in cursor.description]
+            rows = []
+            # 需要推送的前几行按小批次读取，之后一次读完
+            batch_rows = STREAM_BATCH_ROWS
+            while on_batch is not None and len(rows) < stream_rows:
+                batch = cursor.fetchmany(min(batch_rows, stream_rows - len(rows)))
+                if not batch:
+                    break
+                rows.extend(batch)
+                on_batch(pd.DataFrame.from_records(batch, columns=columns, coerce_float=True))
+                batch_rows *= 2
+            rows.extend(cursor.fetchall())
+            df = pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+        except sqlite3.OperationalError as e:
+            if is_timeout(e):
+                raise QueryRejected(f"Query exceeded the {timeout:g}s time limit") from e
+            raise
+        except MemoryError as e:
+            if self.heap_limit_mb:
+                raise QueryRejected(f"Query exceeded the {self.heap_limit_mb} MB memory limit") from e
+            raise QueryRejected("Query ran out of memory") from e
+        finally:
+            conn.set_progress_handler(None, 0)
+            conn.set_authorizer(None)
+            self._release(catalog)
+        return self._mark_truncated(df, max_rows)
+
+
+class DuckDBEngine(QueryEngine):
+    """
+    直接扫描文件（CSV/Parquet）的列式引擎，按标准化列名建立视图，
+    与 SQLite 物化库中的表结构保持一致。物化后的数据集提供各表的 Parquet 副本，
+    列裁剪和按行组统计的谓词下推由 DuckDB 完成。
+    """
+
+    name = "duckdb"
+    formats = ("csv", "parquet")
+
+    def supports(self, dataset: Dict[str, Any]) -> bool:
+        sources = dataset.get("sources") or {}
+        return duckdb is not None and bool(sources) and all(
+            source["format"] in self.formats for source in sources.values()
+        )
+
+    @staticmethod
+    def _quote_identifier(name: str) -> str:
+        return '"' + str(name).replace('"', '""') + '"'
+
+    @staticmethod
+    def _quote_literal(value: str) -> str:
+        return "'" + str(value).replace("'", "''") + "'"
+
+    def _create_views(self, conn, sources: Dict[str, Dict[str, Any]]) -> None:
+        for table_name, source in sources.items():
+            path = source["path"].replace("'", "''")
+            scan = f"read_parquet('{path}')" if source["format"] == "parquet" \
+                else f"read_csv_auto('{path}', header = true)"
+            columns = ", ".join(
+                f"{self._quote_identifier(original)} AS {self._quote_identifier(normalized)}"
+                for original, normalized in source["columns"].items()
+            ) or "*"
+            conn.execute(f"CREATE VIEW {self._quote_identifier(table_name)} AS SELECT {columns} FROM {scan}")
+
+    def _handle_key(self, dataset: Dict[str, Any]) -> Hashable:
+        return tuple(
+            (table_name, source["path"], os.stat(source["path"]).st_mtime_ns)
+            for table_name, source in sorted(dataset["sources"].items())
+        )
+
+    def _open(self, dataset: Dict[str, Any]):
+        conn = duckdb.connect(database=":memory:")
+        # 每个连接是独立的数据库实例，内存上限即单个查询的上限，超出部分溢出到磁盘
+        os.makedirs(QUERY_SPILL_DIR, exist_ok=True)
+        spill_dir = self._quote_literal(os.path.abspath(QUERY_SPILL_DIR))
+        conn.execute(f"SET memory_limit = '{QUERY_MEMORY_LIMIT_MB}MB'")
+        conn.execute(f"SET temp_directory = {spill_dir}")
+        self._create_views(conn, dataset["sources"])
+        # 建好视图后关闭外部访问：只允许读取本数据集的源文件和写溢出目录，
+        # 生成的 SQL 无法再通过表函数或直接写文件路径（替换扫描）读取其他文件，也不能改回配置
+        allowed_paths = ", ".join(
+            self._quote_literal(os.path.abspath(source["path"])) for source in dataset["sources"].values()
+        )
+        conn.execute(f"SET allowed_paths = [{allowed_paths}]")
+        conn.execute(f"SET allowed_directories = [{spill_dir}]")
+        conn.execute("SET enable_external_access = false")
+        conn.execute("SET lock_configuration = true")
+        return conn
+
+    def execute(self, sql: str, dataset: Dict[str, Any],
+                max_rows: int = QUERY_MAX_ROWS, timeout: float = QUERY_TIMEOUT,
+                on_batch: Optional[Callable[[pd.DataFrame], None]] = None,
+                stream_rows: int = 0) -> pd.DataFrame:
+        statement = validate_sql(sql)
+        conn = self._acquire(dataset)
+        timer: Optional[Any] = None
+        broken = False
+        try:
+            # 超时后从计时线程中断正在执行的查询
+            timer = _threading.Timer(timeout, conn.interrupt)
+            timer.daemon = True
+            timer.start()
+            rows_per_batch = STREAM_BATCH_ROWS if on_batch is not None else 1_000_000
+            reader = conn.execute(limit_rows(statement, max_rows)).fetch_record_batch(rows_per_batch)
+            batches, pending = [], []
+            streamed, target = 0, STREAM_BATCH_ROWS
+            for batch in reader:
+                batches.append(batch)
+                if on_batch is None or streamed >= stream_rows:
+                    continue
+                # 攒够一批再推送，批次大小逐次翻倍
+                pending.append(batch)
+                pending_rows = sum(b.num_rows for b in pending)
+                if pending_rows >= min(target, stream_rows - streamed):
+                    chunk = pa.Table.from_batches(pending).slice(0, stream_rows - streamed)
+                    on_batch(chunk.to_pandas())
+                    streamed += chunk.num_rows
+                    pending, target = [], target * 2
+            if pending and streamed < stream_rows:
+                on_batch(pa.Table.from_batches(pending).slice(0, stream_rows - streamed).to_pandas())
+            df = pa.Table.from_batches(batches, schema=reader.schema).to_pandas()
+        except duckdb.InterruptException as e:
+            broken = True
+            raise QueryRejected(f"Query exceeded the {timeout:g}s time limit") from e
+        except duckdb.OutOfMemoryException as e:
+            broken = True
+            raise QueryRejected(f"Query exceeded the {QUERY_MEMORY_LIMIT_MB} MB memory limit") from e
+        except duckdb.PermissionException as e:
+            raise QueryRejected("Queries may only reference the dataset tables") from e
+        finally:
+            if timer is not None:
+                timer.cancel()
+            self._release(conn, broken)
+        return self._mark_truncated(df, max_rows)
+
+
+ENGINES = {engine.name: engine for engine in (SQLiteEngine(), DuckDBEngine())}
+
+
+def get_engine(name: str = QUERY_ENGINE) -> QueryEngine:
+    """按名称获取查询引擎，未知或不可用时退回 SQLite"""
+    engine = ENGINES.get(name)
+    if engine is None:
+        print(f"Unknown query engine '{name}', falling back to sqlite")
+        return ENGINES["sqlite"]
+    if engine.name == "duckdb" and duckdb is None:
+        print("duckdb is not installed, falling back to sqlite")
+        return ENGINES["sqlite"]
+    return engine
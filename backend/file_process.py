@@ -1,137 +1,685 @@
 import pandas as pd
 import sqlite3
 import json
-import requests
 import re
-from typing import Dict, Any, List, Tuple
+import hashlib
+import threading
+import random
+import glob
+from collections import OrderedDict
+from typing import Dict, Any, List, Tuple, Optional, Callable, Iterator, Sequence, Union
 import os
+from catalog import QueryCatalog, referenced_tables
+from columnar import PARQUET_ROW_GROUP_ROWS, export_table, read_rows, take_rows
+from profiler import TableProfiler
+from rollups import route
+from cache import LRUCache, ResultCache
+from result_store import RESULT_PAGE_SIZE, window
+from serialization import dumps, loads, slice_columns, table_payload
+from utils import run_blocking
+from engines import QueryEngine, get_engine, ENGINES
+
+# 物化库结构版本，结构变化时旧的物化库会被重建
+STORE_VERSION = "7"
+
+# 物化数据集的存放目录（每个上传文件对应一个 SQLite 文件，每张表另有一份 Parquet 列式副本）
+DATASET_DIR = os.path.join("data", "datasets")
+
+# 分块读取源文件时每块的最大行数，以及每块在内存中的目标大小（MB），
+# 实际行数按样本的行宽估算，宽表每块读取的行数更少，内存占用与文件大小无关
+CHUNK_ROWS = int(os.environ.get("CHUNK_ROWS", 50_000))
+CHUNK_MB = int(os.environ.get("CHUNK_MB", 32))
+# 估算行宽时读取的样本行数
+CHUNK_SAMPLE_ROWS = 1_000
+
+# 上传时预先生成的预览行数，以及预览分页单页的最大行数
+PREVIEW_ROWS = 50
+PREVIEW_MAX_ROWS = 500
+
+# 查询结果缓存，进程内所有会话共享
+result_cache = ResultCache()
+
+# 解析后的预览，键为 (物化库路径, 物化库 mtime)，文件变化后自动失效
+_preview_cache = LRUCache(256)
+
+# 同一文件的物化过程互斥，避免并发请求重复构建
+_materialize_locks: Dict[str, threading.Lock] = {}
+_materialize_locks_guard = threading.Lock()
+
+
+def _lock_for(key: str) -> threading.Lock:
+    with _materialize_locks_guard:
+        if key not in _materialize_locks:
+            _materialize_locks[key] = threading.Lock()
+        return _materialize_locks[key]
+
 
 class FileProcessor:
-    def __init__(self, db_path: str = "database.db"):
+    def __init__(self, db_path: str = "database.db", store_dir: str = DATASET_DIR,
+                 engine: Optional[QueryEngine] = None):
         self.db_path = db_path
+        self.store_dir = store_dir
+        self.engine = engine or get_engine()
+
+    @staticmethod
+    def _normalize_columns(df: pd.DataFrame) -> pd.DataFrame:
+        """标准化列名：转小写，替换空格为下划线，移除特殊字符"""
+        df.columns = df.columns.str.lower()\
+            .str.replace(' ', '_')\
+            .str.replace(r'[\(\)\$\%\:]', '', regex=True)\
+            .str.replace(r'\.', '_', regex=True)\
+            .str.replace(r'/', '_', regex=True)
+        return df
+
+    @staticmethod
+    def _table_name(file_path: str) -> str:
+        return os.path.splitext(os.path.basename(file_path))[0]
+
+    @staticmethod
+    def _file_hash(file_path: str) -> str:
+        """流式计算文件内容哈希"""
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _store_path(self, file_path: str) -> str:
+        """每个源文件路径对应一个固定的物化库文件"""
+        key = hashlib.sha1(os.path.abspath(file_path).encode("utf-8")).hexdigest()
+        return os.path.join(self.store_dir, f"{key}.db")
+
+    @staticmethod
+    def _parquet_path(store_path: str, index: int) -> str:
+        """物化库中第 index 张表的 Parquet 副本"""
+        return f"{os.path.splitext(store_path)[0]}-{index}.parquet"
 
-    def execute_query(self, sql_query: str, file_path: str) -> Tuple[bool, Any]:
+    @staticmethod
+    def _read_meta(store_path: str) -> Dict[str, str]:
+        try:
+            conn = sqlite3.connect(store_path)
+            try:
+                return dict(conn.execute("SELECT key, value FROM _meta").fetchall())
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            return {}
+
+    @staticmethod
+    def _sqlite_type(dtype: str) -> str:
+        """pandas 类型对应的 SQLite 列类型（列亲和性），与 DataFrame.to_sql 建表时一致"""
+        if dtype.startswith("int") or dtype.startswith("uint") or dtype == "bool":
+            return "INTEGER"
+        if dtype.startswith("float"):
+            return "REAL"
+        if dtype.startswith("datetime64"):
+            return "TIMESTAMP"
+        return "TEXT"
+
+    def _retype_table(self, conn: sqlite3.Connection, table_name: str, columns: List[Dict[str, Any]]) -> None:
         """
-        执行查询并返回格式化的表格数据
+        按合并后的类型重建表。表在写入第一块时按该块推断的类型建立，之后的块推断出更宽的类型时
+        （如前几块为整数、之后出现文本），同一列中会混有不同存储类型的值；
+        按新的列亲和性整表复制一次，已写入的值随之转换（整数转为文本或浮点数）。
         """
+        tmp_name = f"{table_name}__retype"
+        definitions = ", ".join(f'"{col["name"]}" {self._sqlite_type(col["type"])}' for col in columns)
+        conn.execute(f'DROP TABLE IF EXISTS "{tmp_name}"')
+        conn.execute(f'CREATE TABLE "{tmp_name}" ({definitions})')
+        conn.execute(f'INSERT INTO "{tmp_name}" SELECT * FROM "{table_name}" ORDER BY rowid')
+        conn.execute(f'DROP TABLE "{table_name}"')
+        conn.execute(f'ALTER TABLE "{tmp_name}" RENAME TO "{table_name}"')
+        conn.commit()
+
+    @staticmethod
+    def _file_format(file_path: str) -> str:
+        extension = os.path.splitext(file_path)[1].lower().lstrip(".")
+        return extension if extension in ("xlsx", "xls") else "csv"
+
+    def _sheet_table_name(self, file_path: str, sheet_name: str, sheet_count: int) -> str:
+        """单工作表沿用文件名作为表名，多工作表时为每个工作表单独建表"""
+        table_name = self._table_name(file_path)
+        if sheet_count <= 1:
+            return table_name
+        sheet = re.sub(r'[^\w]+', '_', str(sheet_name).strip().lower()).strip('_')
+        return f"{table_name}_{sheet}"
+
+    @staticmethod
+    def _rows_to_frame(header: List[Any], rows: List[tuple]) -> pd.DataFrame:
+        columns = [
+            str(name) if name is not None and str(name).strip() else f"unnamed_{i}"
+            for i, name in enumerate(header)
+        ]
+        # 工作表中的行长度可能不一致，按表头截断或补齐
+        width = len(columns)
+        rows = [tuple(row[:width]) + (None,) * (width - len(row)) for row in rows]
+        return pd.DataFrame.from_records(rows, columns=columns)
+
+    def _iter_csv_chunks(self, file_path: str, chunk_rows: int) -> Iterator[Tuple[str, pd.DataFrame, float]]:
+        total_size = max(os.path.getsize(file_path), 1)
+        table_name = self._table_name(file_path)
+        with open(file_path, "rb") as f:
+            for chunk in pd.read_csv(f, chunksize=chunk_rows):
+                yield table_name, chunk, min(f.tell() / total_size, 1.0)
+
+    def _iter_xlsx_chunks(self, file_path: str, chunk_rows: int) -> Iterator[Tuple[str, pd.DataFrame, float]]:
+        """以只读模式逐行读取 xlsx，内存占用只与块大小相关"""
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(file_path, read_only=True, data_only=True)
         try:
-            # 提取SQL查询
-            sql_pattern = r'```sql\n(.*?)\n```'
-            sql_match = re.search(sql_pattern, sql_query, re.DOTALL)
-            
-            if sql_match:
-                cleaned_sql = sql_match.group(1).strip()
+            sheets = workbook.worksheets
+            for sheet_index, sheet in enumerate(sheets):
+                table_name = self._sheet_table_name(file_path, sheet.title, len(sheets))
+                rows_iter = sheet.iter_rows(values_only=True)
+                header = next(rows_iter, None)
+                if header is None:
+                    continue
+                total_rows = max((sheet.max_row or 1) - 1, 1)
+                batch, read = [], 0
+                for row in rows_iter:
+                    batch.append(row)
+                    if len(batch) >= chunk_rows:
+                        read += len(batch)
+                        done = (sheet_index + min(read / total_rows, 1.0)) / len(sheets)
+                        yield table_name, self._rows_to_frame(list(header), batch), done
+                        batch = []
+                if batch or read == 0:
+                    yield table_name, self._rows_to_frame(list(header), batch), (sheet_index + 1) / len(sheets)
+        finally:
+            workbook.close()
+
+    def _iter_xls_chunks(self, file_path: str, chunk_rows: int) -> Iterator[Tuple[str, pd.DataFrame, float]]:
+        """旧版 xls 按需加载工作表，处理完即释放"""
+        import xlrd
+
+        workbook = xlrd.open_workbook(file_path, on_demand=True)
+        try:
+            sheet_names = workbook.sheet_names()
+            for sheet_index, sheet_name in enumerate(sheet_names):
+                sheet = workbook.sheet_by_index(sheet_index)
+                table_name = self._sheet_table_name(file_path, sheet_name, len(sheet_names))
+                if sheet.nrows == 0:
+                    workbook.unload_sheet(sheet_index)
+                    continue
+                header = sheet.row_values(0)
+                total_rows = max(sheet.nrows - 1, 1)
+                for start in range(1, max(sheet.nrows, 2), chunk_rows):
+                    stop = min(start + chunk_rows, sheet.nrows)
+                    batch = [tuple(sheet.row_values(i)) for i in range(start, stop)]
+                    done = (sheet_index + min((stop - 1) / total_rows, 1.0)) / len(sheet_names)
+                    yield table_name, self._rows_to_frame(header, batch), done
+                workbook.unload_sheet(sheet_index)
+        finally:
+            workbook.release_resources()
+
+    def _chunk_rows(self, file_path: str) -> int:
+        """按样本行在内存中的大小估算每块的行数，使每块约为 CHUNK_MB"""
+        sample = self.read_sample(file_path, nrows=CHUNK_SAMPLE_ROWS)
+        row_bytes = sample.memory_usage(index=False, deep=True).sum() / max(len(sample), 1)
+        return int(max(min(CHUNK_ROWS, CHUNK_MB * 1024 * 1024 // max(row_bytes, 1)), 100))
+
+    def iter_chunks(self, file_path: str, chunk_rows: Optional[int] = None) -> Iterator[Tuple[str, pd.DataFrame, float]]:
+        """
+        按文件格式分发的读取层，逐块产出 (表名, 数据块, 进度比例)。
+        CSV 对应一张表，Excel 每个工作表对应一张表。未指定 chunk_rows 时按行宽估算。
+        """
+        chunk_rows = chunk_rows or self._chunk_rows(file_path)
+        readers = {
+            "csv": self._iter_csv_chunks,
+            "xlsx": self._iter_xlsx_chunks,
+            "xls": self._iter_xls_chunks,
+        }
+        for table_name, chunk, done in readers[self._file_format(file_path)](file_path, chunk_rows):
+            yield table_name, self._normalize_columns(chunk), done
+
+    def read_sample(self, file_path: str, nrows: int) -> pd.DataFrame:
+        """读取第一张表的前 nrows 行（原始列名），用于校验和预览"""
+        if self._file_format(file_path) == "csv":
+            return pd.read_csv(file_path, nrows=nrows)
+        readers = {"xlsx": self._iter_xlsx_chunks, "xls": self._iter_xls_chunks}
+        for _, chunk, _ in readers[self._file_format(file_path)](file_path, nrows):
+            return chunk
+        raise pd.errors.EmptyDataError("No data found in workbook")
+
+    def _build_store(self, file_path: str, store_path: str, content_hash: str, stat,
+                     progress: Optional[Callable[[int, float], None]] = None) -> None:
+        """
+        分块读取源文件并写入磁盘上的 SQLite 库，先写临时文件再原子替换，
+        再从中导出各表的 Parquet 副本。每写完一块调用一次 progress(已写入行数, 进度比例)；
+        建索引和导出是单次耗时较长的调用，不阻塞 eventlet 的事件循环。
+        """
+        tmp_path = f"{store_path}.tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+        # 上传时一次性计算表概要，供 get_table_info 直接读取
+        profilers: Dict[str, TableProfiler] = {}
+        # 各表建表时（第一块）的列类型
+        created_types: Dict[str, Dict[str, str]] = {}
+        rows_written = 0
+
+        chunk_rows = self._chunk_rows(file_path)
+        # 建索引和导出 Parquet 在线程池中执行（见 run_blocking），连接需跨线程使用
+        conn = sqlite3.connect(tmp_path, check_same_thread=False)
+        try:
+            for table_name, chunk, done in self.iter_chunks(file_path, chunk_rows):
+                created_types.setdefault(table_name, {col: str(chunk[col].dtype) for col in chunk.columns})
+                chunk.to_sql(table_name, conn, if_exists='append', index=False)
+                profilers.setdefault(table_name, TableProfiler()).update(chunk)
+                rows_written += len(chunk)
+                if progress:
+                    progress(rows_written, done)
+
+            tables = []
+            for table_name, profiler in profilers.items():
+                profile = profiler.result()
+                profile["table_name"] = table_name
+                tables.append(profile)
+
+                # 分块推断的类型不一致时，按合并后的类型统一整列的存储类型
+                created = created_types[table_name]
+                if any(self._sqlite_type(col["type"]) != self._sqlite_type(created.get(col["name"], "object"))
+                       for col in profile["columns"]):
+                    print(f"Column types widened across chunks, rebuilding {table_name}")
+                    run_blocking(self._retype_table, conn, table_name, profile["columns"])
+
+                # 为低基数的文本列建索引，常用于 WHERE / GROUP BY
+                for col in profile["columns"]:
+                    if col["type"] == "object" and col["unique_values"] <= max(profile["row_count"] // 10, 1):
+                        index_key = f"{table_name}.{col['name']}".encode("utf-8")
+                        index_name = f"idx_{hashlib.sha1(index_key).hexdigest()[:12]}"
+                        run_blocking(
+                            conn.execute,
+                            f'CREATE INDEX IF NOT EXISTS "{index_name}" ON "{table_name}" ("{col["name"]}")',
+                        )
+
+            # 每张表导出一份 Parquet（固定类型、带行组统计），供列式引擎和预览读取；
+            # 行组不超过一个读取块，宽表的导出同样只占用一块的内存
+            for i, profile in enumerate(tables):
+                parquet_path = self._parquet_path(store_path, i)
+                run_blocking(export_table, conn, profile["table_name"], profile["columns"], parquet_path,
+                             row_group_rows=min(PARQUET_ROW_GROUP_ROWS, chunk_rows))
+                profile["parquet"] = os.path.basename(parquet_path)
+
+            # 预览在上传时生成一次（原始列名），之后直接读取
+            sample = self.read_sample(file_path, nrows=PREVIEW_ROWS)
+            preview = table_payload(
+                sample,
+                table_name=tables[0]["table_name"] if tables else None,
+                rows=len(sample),
+            )
+
+            conn.execute("CREATE TABLE _meta (key TEXT PRIMARY KEY, value TEXT)")
+            conn.executemany(
+                "INSERT INTO _meta (key, value) VALUES (?, ?)",
+                [
+                    ("source_path", os.path.abspath(file_path)),
+                    ("mtime_ns", str(stat.st_mtime_ns)),
+                    ("size", str(stat.st_size)),
+                    ("content_hash", content_hash),
+                    ("store_version", STORE_VERSION),
+                    ("profile", dumps({"tables": tables}).decode("utf-8")),
+                    ("preview", dumps(preview).decode("utf-8")),
+                ],
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+        os.replace(tmp_path, store_path)
+
+    def materialize(self, file_path: str,
+                    progress: Optional[Callable[[int, float], None]] = None) -> str:
+        """
+        将上传文件物化为持久化的 SQLite 库并返回其路径。
+        以 文件路径 + mtime + 内容哈希 作为版本标识，未变化时直接复用。
+        """
+        os.makedirs(self.store_dir, exist_ok=True)
+        store_path = self._store_path(file_path)
+
+        with _lock_for(store_path):
+            stat = os.stat(file_path)
+            meta = self._read_meta(store_path) if os.path.exists(store_path) else {}
+
+            if meta.get("store_version") != STORE_VERSION:
+                meta = {}
+
+            if meta:
+                if (meta.get("mtime_ns") == str(stat.st_mtime_ns)
+                        and meta.get("size") == str(stat.st_size)):
+                    return store_path
+
+                # mtime 变化但内容相同（例如重新上传同一文件），只更新元数据
+                content_hash = self._file_hash(file_path)
+                if meta.get("content_hash") == content_hash:
+                    conn = sqlite3.connect(store_path)
+                    try:
+                        conn.executemany(
+                            "REPLACE INTO _meta (key, value) VALUES (?, ?)",
+                            [("mtime_ns", str(stat.st_mtime_ns)), ("size", str(stat.st_size))],
+                        )
+                        conn.commit()
+                    finally:
+                        conn.close()
+                    return store_path
             else:
-                cleaned_sql = sql_query.replace('```sql', '').replace('```', '').strip()
+                content_hash = self._file_hash(file_path)
+
+            print(f"Materializing {file_path} -> {store_path}")
+            self._build_store(file_path, store_path, content_hash, stat, progress)
+            return store_path
+
+    def _current_store(self, file_path: str) -> Optional[str]:
+        """物化库存在且与源文件一致时返回其路径，不触发构建"""
+        store_path = self._store_path(file_path)
+        if not os.path.exists(store_path):
+            return None
+        stat = os.stat(file_path)
+        meta = self._read_meta(store_path)
+        if (meta.get("store_version") == STORE_VERSION
+                and meta.get("mtime_ns") == str(stat.st_mtime_ns)
+                and meta.get("size") == str(stat.st_size)):
+            return store_path
+        return None
+
+    def _load_preview(self, store_path: str) -> Dict[str, Any]:
+        key = (store_path, os.stat(store_path).st_mtime_ns)
+        preview = _preview_cache.get(key)
+        if preview is None:
+            meta = self._read_meta(store_path)
+            preview = loads(meta["preview"])
+            table = next(
+                (t for t in json.loads(meta["profile"])["tables"] if t["table_name"] == preview["table_name"]),
+                {},
+            )
+            preview["row_count"] = table.get("row_count", preview["rows"])
+            preview["parquet"] = os.path.join(os.path.dirname(store_path), table["parquet"]) \
+                if table.get("parquet") else None
+            _preview_cache.put(key, preview)
+        return preview
+
+    def get_preview(self, file_path: str, offset: int = 0, limit: int = PREVIEW_ROWS,
+                    sample: bool = False) -> Dict[str, Any]:
+        """
+        文件预览（第一张表，原始列名）。第一页直接使用上传时生成的预览，
+        其余分页和随机抽样从 Parquet 副本中只读取覆盖所需行的行组，不需要重新解析源文件。
+        数据集仍在导入时只能从文件开头读取（随机抽样退化为第一页）。
+        """
+        limit = max(1, min(limit, PREVIEW_MAX_ROWS))
+        offset = max(0, offset)
+
+        page = {"offset": 0 if sample else offset, "limit": limit, "sample": sample}
+        store_path = self._current_store(file_path)
+        if store_path is None:
+            # 导入完成前从文件开头读取到所需的位置，最多读取 PREVIEW_MAX_ROWS 行，超出部分返回空页
+            start = page["offset"]
+            end = min(start + limit, PREVIEW_MAX_ROWS)
+            df = self.read_sample(file_path, nrows=end).iloc[start:end]
+            return table_payload(df, total=None, ready=False, **page)
+
+        preview = self._load_preview(store_path)
+        total = preview["row_count"]
+        if not sample and (offset + limit <= preview["rows"] or preview["rows"] >= total):
+            return {
+                "columns": preview["columns"],
+                "data": slice_columns(preview["data"], offset, offset + limit),
+                "total": total,
+                "ready": True,
+                **page,
+            }
+        if sample:
+            df = take_rows(preview["parquet"], sorted(random.sample(range(total), min(limit, total))))
+        else:
+            df = read_rows(preview["parquet"], offset, limit)
+        # 列式副本中为标准化列名，按位置恢复为原始列名
+        df.columns = [col["dataIndex"] for col in preview["columns"]][:len(df.columns)]
+        return table_payload(df, total=total, ready=True, **page)
+
+    @staticmethod
+    def store_lock(store_path: str) -> threading.Lock:
+        """物化库的互斥锁，构建、删除和在库上建索引/汇总表时持有"""
+        return _lock_for(store_path)
+
+    def invalidate(self, file_path: str) -> None:
+        """源文件被替换时删除对应的物化库及其 Parquet 副本"""
+        store_path = self._store_path(file_path)
+        with _lock_for(store_path):
+            derived = glob.glob(glob.escape(os.path.splitext(store_path)[0]) + "-*.parquet*")
+            for path in [store_path, f"{store_path}.tmp"] + derived:
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def catalog_tables(self, files: Union[str, Sequence[Union[str, Tuple[str, str]]]]) -> "OrderedDict[str, Dict[str, Any]]":
+        """
+        会话中所有数据集的表，按上传顺序：
+        {表名: {"file_path", "store_path", "table", "parquet", "content_hash", "profile"}}。
+        files 中每项为文件路径，或 (文件路径, 表名)：按内容寻址保存的文件名是哈希，
+        表名取自会话中登记的原始文件名。
+        每个文件只物化一次（已物化时直接复用）；不同文件中的同名表依次加数字后缀区分。
+        """
+        if isinstance(files, str):
+            files = [files]
+        tables: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        for item in files:
+            file_path, display_name = (item, None) if isinstance(item, str) else item
+            store_path = self.materialize(file_path)
+            meta = self._read_meta(store_path)
+            store_name = self._table_name(file_path)
+            for table in json.loads(meta["profile"])["tables"]:
+                # Excel 多工作表的表名为 <文件名>_<工作表名>，保留工作表部分
+                base = table["table_name"]
+                if display_name and base.startswith(store_name):
+                    base = display_name + base[len(store_name):]
+                name, suffix = base, 2
+                taken = {existing.lower() for existing in tables}
+                while name.lower() in taken:
+                    name = f"{base}_{suffix}"
+                    suffix += 1
+                tables[name] = {
+                    "file_path": file_path,
+                    "store_path": store_path,
+                    "table": table["table_name"],
+                    "parquet": os.path.join(os.path.dirname(store_path), table["parquet"]),
+                    "content_hash": meta["content_hash"],
+                    "profile": table,
+                }
+        return tables
+
+    @staticmethod
+    def _tables_hash(tables: Dict[str, Dict[str, Any]]) -> str:
+        """一组表的内容版本：单个数据集时即其内容哈希，多个时由各表名和内容哈希组合"""
+        hashes = {table["content_hash"] for table in tables.values()}
+        if len(hashes) == 1 and all(name == table["table"] for name, table in tables.items()):
+            return hashes.pop()
+        key = "|".join(f"{name}={table['table']}@{table['content_hash']}" for name, table in sorted(tables.items()))
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def _dataset(self, tables: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        查询引擎所需的数据集描述（只包含查询用到的表），见 engines.QueryEngine。
+        列式引擎读取各表的 Parquet 副本（已是标准化列名），按行组统计跳过数据，Excel 表同样适用。
+        """
+        sources = {
+            name: {"path": table["parquet"], "format": "parquet", "columns": {}}
+            for name, table in tables.items()
+        }
+        return {
+            "tables": {name: {"store_path": t["store_path"], "table": t["table"]} for name, t in tables.items()},
+            "row_counts": {name: t["profile"]["row_count"] for name, t in tables.items()},
+            "sources": sources,
+        }
+
+    @staticmethod
+    def _with_rollups(dataset: Dict[str, Any], rollup_tables: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        """在数据集描述中加入汇总表（只在 SQLite 物化库中存在）"""
+        return {
+            "tables": {**dataset["tables"], **{
+                name: {"store_path": t["store_path"], "table": t["table"]} for name, t in rollup_tables.items()
+            }},
+            "row_counts": {**dataset["row_counts"], **{name: t["rows"] for name, t in rollup_tables.items()}},
+            "sources": {},
+        }
+
+    @staticmethod
+    def extract_sql(text: str) -> str:
+        """从模型回复中提取 SQL（```sql 代码块，或去掉代码块标记后的全文）"""
+        sql_match = re.search(r'```sql\n(.*?)\n```', text, re.DOTALL)
+        if sql_match:
+            return sql_match.group(1).strip()
+        return text.replace('```sql', '').replace('```', '').strip()
+
+    @staticmethod
+    def _result_columns(tables: Dict[str, Dict[str, Any]], sql: str) -> Optional[List[str]]:
+        """只编译不执行（LIMIT 0），获取查询结果的列名"""
+        catalog = QueryCatalog()
+        try:
+            catalog.bind(tables)
+            cursor = catalog.conn.execute(f"SELECT * FROM ({sql.strip().rstrip(';')}) LIMIT 0")
+            return [col[0] for col in cursor.description]
+        except sqlite3.Error:
+            return None
+        finally:
+            catalog.close()
+
+    def execute_query(self, sql_query: str, file_paths: Union[str, Sequence[str]],
+                      page_size: int = RESULT_PAGE_SIZE,
+                      runner: Optional[Callable[..., pd.DataFrame]] = None,
+                      on_batch: Optional[Callable[[pd.DataFrame], None]] = None) -> Tuple[bool, Any]:
+        """
+        执行查询并返回格式化的表格数据。file_paths 为会话中的所有数据集，
+        只挂载 SQL 中引用到的表，加载量与查询涉及的表成正比。
+        table_data 只包含第一页和总行数，完整结果通过 frame 返回，由调用方保存在服务端。
+        runner(引擎名, SQL, 数据集, on_batch, stream_rows) 用于在其他进程中执行（见 query_pool），
+        默认在当前进程执行。on_batch 在查询过程中分批收到第一页的数据，命中结果缓存时不调用。
+        """
+        try:
+            cleaned_sql = self.extract_sql(sql_query)
             
-            # 读取CSV并标准化列名
-            df = pd.read_csv(file_path)
+            # 复用已物化的数据集，只在文件变化时重新构建
+            all_tables = self.catalog_tables(file_paths)
+            names = referenced_tables(cleaned_sql, all_tables)
+            tables = OrderedDict((name, table) for name, table in all_tables.items() if name in names)
+            content_hash = self._tables_hash(tables)
+
+            # 同一数据版本上的相同 SQL 直接复用结果，跨会话共享
+            result_df = result_cache.get(content_hash, cleaned_sql)
+            if result_df is None:
+                dataset = self._dataset(tables)
+                # 所选引擎不可用（如未安装 duckdb）时退回 SQLite 物化库
+                engine = self.engine if self.engine.supports(dataset) else ENGINES["sqlite"]
+
+                def run(engine_name: str, sql: str, dataset: Dict[str, Any]) -> pd.DataFrame:
+                    if runner is not None:
+                        return runner(engine_name, sql, dataset, on_batch=on_batch, stream_rows=page_size)
+                    target = engine if engine.name == engine_name else ENGINES[engine_name]
+                    return target.execute(sql, dataset, on_batch=on_batch, stream_rows=page_size)
+
+                routed = route(cleaned_sql, tables)
+                if routed is not None:
+                    # 能由汇总表回答的聚合查询改写到汇总表上（见 advisor.QueryAdvisor），在 SQLite 中执行
+                    rollup_sql, rollup_tables = routed
+                    try:
+                        result_df = run("sqlite", rollup_sql, self._with_rollups(dataset, rollup_tables))
+                        print(f"Routed to rollup: {rollup_sql}")
+                    except Exception as e:
+                        print(f"Rollup routing failed, running the original query: {e}")
+                if result_df is None:
+                    result_df = run(engine.name, cleaned_sql, dataset)
+                result_cache.put(content_hash, cleaned_sql, result_df)
+            else:
+                print(f"Result cache hit: {cleaned_sql}")
+                # 结果列名取自 SQL 原文，命中规范化后的缓存时按本次 SQL 恢复列名
+                columns = self._result_columns(tables, cleaned_sql)
+                if columns and len(columns) == len(result_df.columns):
+                    result_df = result_df.set_axis(columns, axis=1)
             
-            # 标准化列名：转小写，替换空格为下划线，移除特殊字符
-            df.columns = df.columns.str.lower()\
-                .str.replace(' ', '_')\
-                .str.replace(r'[\(\)\$\%\:]', '', regex=True)\
-                .str.replace(r'\.', '_', regex=True)\
-                .str.replace(r'/', '_', regex=True)
-                
-            table_name = os.path.splitext(os.path.basename(file_path))[0]
-            print("df_columns", df.columns)
+            # 查询元数据，结果本身由调用方以列式格式存储
+            result_dict = {
+                "sql": cleaned_sql,
+                "columns": result_df.columns.tolist(),
+                "types": result_df.dtypes.astype(str).to_dict(),
+                "row_count": len(result_df),
+                "truncated": result_df.attrs.get("truncated", False)
+            }
+            table_data = window(result_df, limit=page_size)
+            table_data["truncated"] = result_dict["truncated"]
             
-            with sqlite3.connect(':memory:') as conn:
-                # 将DataFrame保存为临时表
-                df.to_sql(table_name, conn, if_exists='replace', index=False)
-                
-                # 执行查询
-                result_df = pd.read_sql_query(cleaned_sql, conn)
-                
-                # 存储原始查询结果
-                result_dict = {
-                    "sql": cleaned_sql,
-                    "result": result_df.to_dict('split'),
-                    "columns": result_df.columns.tolist(),
-                    "types": result_df.dtypes.astype(str).to_dict()
-                }
-                
-                return True, {
-                    "table_data": self._to_antd_format(result_df),
-                    "raw_data": result_dict
-                }
+            return True, {
+                "table_data": table_data,
+                "raw_data": result_dict,
+                "frame": result_df
+            }
                     
         except Exception as e:
             return False, f"Query error: {str(e)}"
 
     def _to_antd_format(self, df: pd.DataFrame) -> Dict:
-        """将DataFrame转换为antd Table格式"""
-        return {
-            "columns": [
-                {"title": col, "dataIndex": col, "key": col} 
-                for col in df.columns
-            ],
-            "dataSource": df.to_dict('records')
-        }
+        """将DataFrame转换为antd Table格式（按列编码，见 serialization.table_payload）"""
+        return table_payload(df)
 
-    def get_table_info(self, file_path: str) -> str:
+    def get_profile(self, file_path: str) -> Dict[str, Any]:
+        """读取物化时预先计算好的表概要，文件未变化时不再扫描数据"""
+        store_path = self.materialize(file_path)
+        return json.loads(self._read_meta(store_path)["profile"])
+
+    def get_dataset_version(self, file_paths: Union[str, Sequence[str]]) -> Dict[str, str]:
         """
-        从CSV文件获取结构信息，返回适合大模型理解的格式
+        数据集版本：内容哈希标识数据本身，表结构哈希标识表名、列名和类型，
+        用作各类缓存的键。会话有多个数据集时覆盖其中所有的表。
+        """
+        tables = self.catalog_tables(file_paths)
+        schema = [
+            [name, [[col["name"], col["type"]] for col in table["profile"]["columns"]]]
+            for name, table in tables.items()
+        ]
+        schema_hash = hashlib.sha1(json.dumps(schema).encode("utf-8")).hexdigest()
+        return {"content_hash": self._tables_hash(tables), "schema_hash": schema_hash}
+
+    def get_table_info(self, file_paths: Union[str, Sequence[str]], include_samples: bool = False) -> str:
+        """
+        从预计算的表概要获取结构信息，返回适合大模型理解的格式。
+        会话中的每个数据集（以及 Excel 的每个工作表）各占一段。
         """
         try:
-            # 读取CSV文件
-            df = pd.read_csv(file_path)
-            
-            # 使用与 execute_query 相同的列名标准化处理
-            df.columns = df.columns.str.lower()\
-                .str.replace(' ', '_')\
-                .str.replace(r'[\(\)\$\%\:]', '', regex=True)\
-                .str.replace(r'\.', '_', regex=True)\
-                .str.replace(r'/', '_', regex=True)
-                
-            table_name = os.path.splitext(os.path.basename(file_path))[0]
-            
-            # 获取基本信息
-            row_count = len(df)
-            column_info = []
-            
-            # 分析每列
-            for col in df.columns:
-                col_type = df[col].dtype
-                unique_count = df[col].nunique()
-                sample_values = df[col].dropna().head(3).tolist()
-                
-                col_info = {
-                    "name": col,  # 已经标准化过的列名，不需要再处理
-                    "type": str(col_type),
-                    "unique_values": unique_count,
-                    # "sample_values": sample_values
-                }
-                column_info.append(col_info)
+            tables = self.catalog_tables(file_paths)
+            info = ""
             
             # 构建描述性文本
-            info = f"Table '{table_name}' contains {row_count} rows with the following columns:\n\n"
-            
-            for col in column_info:
-                info += f"- {col['name']} ({col['type']})\n"
-                info += f"  * {col['unique_values']} unique values\n"
-                # info += f"  * Sample values: {', '.join(str(x) for x in col['sample_values'])}\n"
+            for name, entry in tables.items():
+                table = entry["profile"]
+                info += f"Table '{name}' contains {table['row_count']} rows with the following columns:\n\n"
+                
+                for col in table["columns"]:
+                    info += f"- {col['name']} ({col['type']})\n"
+                    if col.get("approximate"):
+                        info += f"  * approximately {col['unique_values']} unique values\n"
+                    else:
+                        info += f"  * {col['unique_values']} unique values\n"
+                    if include_samples:
+                        info += f"  * Sample values: {', '.join(str(x) for x in col['sample_values'])}\n"
+                info += "\n"
             
-            info += "\nYou can reference these columns in your SQL queries using the lowercase names with underscores."
-            print("info", info)
+            info += "You can reference these columns in your SQL queries using the lowercase names with underscores."
+            if len(tables) > 1:
+                info += "\nThe tables can be joined with each other on columns holding the same values."
             
             return info
             
         except Exception as e:
             return f"Error analyzing table: {str(e)}"
 
-    def handle_file_upload(self, file_path: str, session_id: int, db_conn) -> Tuple[bool, Dict[str, Any]]:
+    def handle_file_upload(self, file_path: str, session_id: int, db_conn,
+                           file_name: Optional[str] = None) -> Tuple[bool, Dict[str, Any]]:
         """
-        只存储文件路径
+        只存储文件路径。一个会话可以关联多个文件，同一文件重复上传时只更新记录
         """
         try:
             # 验证文件是否可读
-            pd.read_csv(file_path, nrows=1)  # 测试文件是否可读
+            self.read_sample(file_path, nrows=1)  # 测试文件是否可读
             
-            # 正确处理文件名，包括中文
-            file_name = os.path.basename(file_path)
-            table_name = os.path.splitext(file_name)[0]
+            # 正确处理文件名，包括中文；按内容寻址保存时使用原始文件名
+            table_name = file_name or os.path.splitext(os.path.basename(file_path))[0]
             
             # 验证文件名不为空
             if not table_name or table_name.lower() == "csv":
@@ -142,9 +690,10 @@ class FileProcessor:
             
             cursor = db_conn.cursor()
             cursor.execute("""
-                REPLACE INTO session_files 
+                INSERT INTO session_files 
                 (session_id, file_path, file_name) 
                 VALUES (?, ?, ?)
+                ON CONFLICT (session_id, file_path) DO UPDATE SET file_name = excluded.file_name
             """, (session_id, file_path, table_name))
             db_conn.commit()
 
@@ -0,0 +1,124 @@
+import os
+import threading
+import time
+import uuid
+from typing import Dict, Any, Optional
+
+from file_process import FileProcessor
+
+# 已完成（ready/failed）的导入任务保留的时间（秒），过期后不再能查询
+INGEST_JOB_TTL = float(os.environ.get("INGEST_JOB_TTL", 3600))
+# 最多保留的已完成任务数，超出时先移除最早完成的
+INGEST_MAX_FINISHED_JOBS = int(os.environ.get("INGEST_MAX_FINISHED_JOBS", 1000))
+FINISHED_STATUSES = ("ready", "failed")
+
+
+def session_room(session_id) -> str:
+    """同一会话的所有连接加入同一个房间，用于推送数据集状态"""
+    return f"session_{session_id}"
+
+
+class IngestionManager:
+    """
+    上传文件的后台导入任务：/upload 只登记任务并立即返回，
+    由后台任务分块物化数据集、计算表概要，并通过 Socket.IO 推送进度。
+    """
+
+    def __init__(self, socketio, processor: Optional[FileProcessor] = None,
+                 job_ttl: float = INGEST_JOB_TTL, max_finished_jobs: int = INGEST_MAX_FINISHED_JOBS):
+        self.socketio = socketio
+        self.processor = processor or FileProcessor()
+        self.job_ttl = job_ttl
+        self.max_finished_jobs = max_finished_jobs
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        # 会话中每个文件最近一次的导入任务
+        self._latest_by_file: Dict[tuple, str] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, session_id, file_path: str, file_name: str) -> Dict[str, Any]:
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "session_id": session_id,
+            "file_path": file_path,
+            "file_name": file_name,
+            "status": "pending",  # pending -> running -> ready / failed
+            "rows": 0,
+            "percent": 0,
+            "error": None,
+            "created_at": time.time(),
+            "finished_at": None,
+        }
+        with self._lock:
+            self._prune()
+            self._jobs[job["job_id"]] = job
+            self._latest_by_file[(str(session_id), file_path)] = job["job_id"]
+
+        self.socketio.start_background_task(self._run, job["job_id"])
+        return dict(job)
+
+    def _prune(self) -> None:
+        """
+        移除过期或超出数量上限的已完成任务（调用方持有锁），进行中的任务不受影响。
+        文件最近一次的任务被移除后，会话中的该文件按已就绪处理。
+        """
+        finished = sorted(
+            (job for job in self._jobs.values() if job["status"] in FINISHED_STATUSES),
+            key=lambda job: job["finished_at"],
+        )
+        expire_before = time.time() - self.job_ttl
+        excess = len(finished) - self.max_finished_jobs
+        removed = set()
+        for i, job in enumerate(finished):
+            if i >= excess and job["finished_at"] >= expire_before:
+                break
+            removed.add(job["job_id"])
+            del self._jobs[job["job_id"]]
+        if removed:
+            self._latest_by_file = {
+                key: job_id for key, job_id in self._latest_by_file.items() if job_id not in removed
+            }
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def jobs_for_session(self, session_id) -> Dict[str, Dict[str, Any]]:
+        """会话中各文件最近一次的导入任务：{文件路径: 任务}"""
+        with self._lock:
+            return {
+                file_path: dict(self._jobs[job_id])
+                for (sid, file_path), job_id in self._latest_by_file.items()
+                if sid == str(session_id)
+            }
+
+    def _update(self, job_id: str, **fields) -> Dict[str, Any]:
+        if fields.get("status") in FINISHED_STATUSES:
+            fields["finished_at"] = time.time()
+        with self._lock:
+            self._jobs[job_id].update(fields)
+            job = dict(self._jobs[job_id])
+
+        self.socketio.emit(
+            "ingestion_progress",
+            {k: job[k] for k in ("job_id", "session_id", "file_name", "status", "rows", "percent", "error")},
+            room=session_room(job["session_id"]),
+        )
+        return job
+
+    def _run(self, job_id: str) -> None:
+        job = self._update(job_id, status="running")
+
+        def on_progress(rows: int, fraction: float):
+            self._update(job_id, rows=rows, percent=round(fraction * 100, 1))
+            # 每块之间让出控制权，避免导入大文件时阻塞其他连接
+            self.socketio.sleep(0)
+
+        try:
+            self.processor.materialize(job["file_path"], progress=on_progress)
+            profile = self.processor.get_profile(job["file_path"])
+            rows = sum(table["row_count"] for table in profile["tables"])
+            self._update(job_id, status="ready", rows=rows, percent=100)
+        except Exception as e:
+            print(f"Ingestion failed for {job['file_path']}: {e}")
+            self._update(job_id, status="failed", error=str(e))
@@ -0,0 +1,85 @@
+import re
+from typing import Optional
+
+from llm_client import llm_client
+
+INTENT_MODEL = "qwen2.5-coder:3b"
+
+# 明确提到图表类型时直接采用
+EXPLICIT_CHART_PATTERNS = [
+    ("line", r"\bline\s*(chart|graph|plot)\b|折线图"),
+    ("bar", r"\bbar\s*(chart|graph|plot)\b|条形图|柱状图"),
+    ("pie", r"\bpie\s*(chart|graph)?\b|饼图"),
+    ("scatter", r"\bscatter\s*(chart|graph|plot)?\b|散点图"),
+    ("column", r"\bcolumn\s*(chart|graph)\b|分组柱状图"),
+]
+
+# 关键词对应的常见意图，只有一类命中时才认为足够可信
+KEYWORD_PATTERNS = {
+    "line": r"\btrends?\b|\bover time\b|\btime series\b|\bper (day|week|month|quarter|year)\b|"
+            r"\b(daily|weekly|monthly|quarterly|yearly)\b|\bgrowth\b|趋势|走势",
+    "pie": r"\bproportions?\b|\bpercentages?\b|\bshares?\b|\bbreakdown\b|\bcomposition\b|占比|比例",
+    "scatter": r"\bcorrelat\w*|\brelationship between\b|\bvs\.?\b|\bversus\b|相关",
+    "bar": r"\bcompare\b|\bcomparison\b|\btop \d+\b|\brank\w*\b|对比|排名",
+    "query": r"^\s*(list|show all|how many|count|find|what is|which)\b|列出|多少",
+}
+
+
+def normalize_chart_type(raw_type: str) -> str:
+    """清理和标准化模型返回的图表类型"""
+    # 移除常见的额外字符
+    cleaned = raw_type.replace('"', '').replace("'", "").replace("-", "").replace(":", "").strip()
+
+    # 查找最匹配的图表类型
+    for valid_type in ("query", "line", "bar", "pie", "scatter", "column"):
+        if valid_type in cleaned:
+            return valid_type
+
+    # 如果没有匹配到任何有效类型，返回默认值
+    return "query"
+
+
+def classify_by_keywords(text: str) -> Optional[str]:
+    """
+    基于规则的快速意图判断，足够可信时返回图表类型，
+    否则返回 None，交给小模型判断。
+    """
+    lowered = text.lower()
+
+    explicit = {chart for chart, pattern in EXPLICIT_CHART_PATTERNS if re.search(pattern, lowered)}
+    if len(explicit) == 1:
+        return explicit.pop()
+
+    matched = {chart for chart, pattern in KEYWORD_PATTERNS.items() if re.search(pattern, lowered)}
+    if len(matched) == 1:
+        return matched.pop()
+
+    return None
+
+
+def classify_with_llm(text: str) -> str:
+    """使用小模型判断用户意图和图表类型"""
+    intent_prompt = f"""Analyze the user's request and determine:
+        1. If it's a visualization request or a regular query
+        2. What type of chart would be most suitable
+
+        User request: "{text}"
+
+        Return ONLY one of these options:
+        - "query" for regular data queries
+        - "line" for time series or trend analysis
+        - "bar" for comparisons between categories
+        - "pie" for showing proportions
+        - "scatter" for correlation analysis
+        - "column" for grouped comparisons
+        """
+
+    try:
+        content = llm_client.chat(INTENT_MODEL, [{"role": "user", "content": intent_prompt}])
+        raw_type = (content or "query").strip().lower()
+        chart_type = normalize_chart_type(raw_type)
+        print(f"Raw intent: {raw_type} -> Normalized: {chart_type}")
+        return chart_type
+    except Exception as e:
+        print(f"Error in classify_with_llm: {e}")
+        return "query"
@@ -0,0 +1,79 @@
+import json
+import os
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+OLLAMA_API_URL = os.environ.get("OLLAMA_API_URL", "http://localhost:11434/api/chat")
+
+# 超时配置（秒）：连接超时要短，读取超时需覆盖大模型首个 token 的等待时间
+CONNECT_TIMEOUT = float(os.environ.get("OLLAMA_CONNECT_TIMEOUT", 5))
+READ_TIMEOUT = float(os.environ.get("OLLAMA_READ_TIMEOUT", 120))
+POOL_MAXSIZE = int(os.environ.get("OLLAMA_POOL_MAXSIZE", 16))
+# 模型常驻时间，模型保持加载才能复用相同 prompt 前缀的 KV 缓存
+KEEP_ALIVE = os.environ.get("OLLAMA_KEEP_ALIVE", "30m")
+
+
+class OllamaClient:
+    """
+    共享的 Ollama 客户端：复用 requests.Session 的 keep-alive 连接池，
+    避免每条消息都重新建立 TCP 连接。
+    在 eventlet 模式下 socket 已被 monkey patch，读取流时只会挂起当前协程。
+    """
+
+    def __init__(self, api_url: str = OLLAMA_API_URL,
+                 connect_timeout: float = CONNECT_TIMEOUT,
+                 read_timeout: float = READ_TIMEOUT,
+                 pool_maxsize: int = POOL_MAXSIZE,
+                 keep_alive: str = KEEP_ALIVE):
+        self.api_url = api_url
+        self.keep_alive = keep_alive
+        self.timeout = (connect_timeout, read_timeout)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_maxsize,
+            # 只对连接失败重试，已开始生成的请求不重发
+            max_retries=Retry(total=2, connect=2, read=0, status=0, backoff_factor=0.2),
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"Content-Type": "application/json"})
+
+    def chat(self, model: str, messages: List[Dict[str, str]], **options: Any) -> str:
+        """非流式调用，返回完整回复内容"""
+        payload = {"model": model, "messages": messages, "stream": False,
+                   "keep_alive": self.keep_alive, **options}
+        response = self.session.post(self.api_url, json=payload, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json().get("message", {}).get("content", "")
+
+    def stream_chat(self, model: str, messages: List[Dict[str, str]],
+                    yield_control: Optional[Callable[[], None]] = None,
+                    **options: Any) -> Iterator[str]:
+        """
+        流式调用，逐块产出回复内容。
+        yield_control 在每块之后调用（如 socketio.sleep(0)），让出控制权给其他连接。
+        """
+        payload = {"model": model, "messages": messages, "stream": True,
+                   "keep_alive": self.keep_alive, **options}
+        with self.session.post(self.api_url, json=payload, timeout=self.timeout, stream=True) as response:
+            response.raise_for_status()
+
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                json_data = json.loads(line.decode("utf-8"))
+                if json_data.get("done"):
+                    break
+                content = json_data.get("message", {}).get("content")
+                if content:
+                    yield content
+                if yield_control:
+                    yield_control()
+
+
+llm_client = OllamaClient()
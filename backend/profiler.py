@@ -0,0 +1,123 @@
+import numpy as np
+import pandas as pd
+from typing import Dict, Any, List
+
+# 行数超过该阈值时，用 HyperLogLog 估算不同值数量
+EXACT_DISTINCT_LIMIT = 100_000
+SAMPLE_SIZE = 3
+
+
+class HyperLogLog:
+    """
+    基于 numpy 的 HyperLogLog 近似去重计数，可按块更新、可合并。
+    precision=14 时占用 16KB，标准误差约 0.8%。
+    """
+
+    def __init__(self, precision: int = 14):
+        self.p = precision
+        self.m = 1 << precision
+        self.registers = np.zeros(self.m, dtype=np.uint8)
+
+    @staticmethod
+    def _bit_length(values: np.ndarray) -> np.ndarray:
+        """uint64 的有效位数，拆成高低 32 位以保证 float 计算精确"""
+        high = (values >> np.uint64(32)).astype(np.float64)
+        low = (values & np.uint64(0xFFFFFFFF)).astype(np.float64)
+        with np.errstate(divide="ignore"):
+            high_bits = np.where(high > 0, np.floor(np.log2(high)) + 33, 0)
+            low_bits = np.where(low > 0, np.floor(np.log2(low)) + 1, 0)
+        return np.where(high_bits > 0, high_bits, low_bits).astype(np.int64)
+
+    def update(self, series: pd.Series) -> None:
+        values = series.dropna()
+        if values.empty:
+            return
+        # 统一按字符串哈希，保证不同块、不同推断类型下同一值的哈希一致
+        hashes = pd.util.hash_array(values.astype(str).to_numpy(dtype=object))
+        index = (hashes >> np.uint64(64 - self.p)).astype(np.int64)
+        rest = hashes << np.uint64(self.p)
+        # rank = 剩余位中第一个 1 的位置（从 1 开始计）
+        rank = (64 - self.p) - self._bit_length(rest >> np.uint64(self.p)) + 1
+        rank = np.minimum(rank, 64 - self.p + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def merge(self, other: "HyperLogLog") -> None:
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def count(self) -> int:
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        estimate = alpha * self.m * self.m / np.sum(np.power(2.0, -self.registers.astype(np.float64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        # 小基数时使用线性计数修正
+        if estimate <= 2.5 * self.m and zeros:
+            estimate = self.m * np.log(self.m / zeros)
+        return int(round(estimate))
+
+
+class TableProfiler:
+    """
+    增量构建表的概要信息（类型、行数、基数、样例值），
+    既可一次性处理整个 DataFrame，也可逐块喂入。
+    """
+
+    def __init__(self, exact_limit: int = EXACT_DISTINCT_LIMIT):
+        self.exact_limit = exact_limit
+        self.row_count = 0
+        self.columns: List[str] = []
+        self.types: Dict[str, str] = {}
+        self.samples: Dict[str, list] = {}
+        self._exact: Dict[str, set] = {}
+        self._sketches: Dict[str, HyperLogLog] = {}
+
+    def update(self, df: pd.DataFrame) -> None:
+        if not self.columns:
+            self.columns = list(df.columns)
+        self.row_count += len(df)
+
+        for col in df.columns:
+            series = df[col]
+            self.types[col] = self._merge_type(self.types.get(col), str(series.dtype))
+
+            samples = self.samples.setdefault(col, [])
+            if len(samples) < SAMPLE_SIZE:
+                samples.extend(series.dropna().head(SAMPLE_SIZE - len(samples)).tolist())
+
+            # 小表精确计数，行数超过阈值后降级为 HyperLogLog
+            if col not in self._sketches and self.row_count <= self.exact_limit:
+                self._exact.setdefault(col, set()).update(series.dropna().unique().tolist())
+                continue
+
+            if col not in self._sketches:
+                sketch = HyperLogLog()
+                if col in self._exact:
+                    sketch.update(pd.Series(list(self._exact.pop(col)), dtype=object))
+                self._sketches[col] = sketch
+            self._sketches[col].update(series)
+
+    @staticmethod
+    def _merge_type(previous: str, current: str) -> str:
+        """分块读取时各块推断的类型可能不同，取更宽的类型"""
+        if previous is None or previous == current:
+            return current
+        if {previous, current} <= {"int64", "float64"}:
+            return "float64"
+        return "object"
+
+    def result(self) -> Dict[str, Any]:
+        columns = []
+        for col in self.columns:
+            approximate = col in self._sketches
+            unique_count = self._sketches[col].count() if approximate else len(self._exact.get(col, ()))
+            columns.append({
+                "name": col,
+                "type": self.types.get(col, "object"),
+                "unique_values": unique_count,
+                "approximate": approximate,
+                "sample_values": [_to_builtin(v) for v in self.samples.get(col, [])],
+            })
+        return {"row_count": self.row_count, "columns": columns}
+
+
+def _to_builtin(value):
+    """numpy 标量转为可 JSON 序列化的 Python 类型"""
+    return value.item() if isinstance(value, np.generic) else value
@@ -0,0 +1,191 @@
+import multiprocessing
+import os
+import threading
+import time
+import zlib
+from typing import Any, Callable, Dict, List, Optional
+
+import pandas as pd
+
+from sql_guard import QUERY_MEMORY_LIMIT_MB, QUERY_TIMEOUT
+
+# 查询执行方式：process（默认，在独立进程中执行）或 inline（在 Web 进程中执行）
+QUERY_ISOLATION = os.environ.get("QUERY_ISOLATION", "process").lower()
+# 查询进程数，每个进程同一时间执行一个查询
+QUERY_WORKERS = int(os.environ.get("QUERY_WORKERS", min(4, os.cpu_count() or 1)))
+# 引擎自身的超时之外，再留出的宽限时间（秒），超过后强制结束查询进程
+QUERY_KILL_GRACE = float(os.environ.get("QUERY_KILL_GRACE", 10))
+POLL_INTERVAL = 0.02
+
+
+class QueryCancelled(Exception):
+    """查询在完成前被取消（如客户端断开连接）"""
+
+
+class QueryFailed(Exception):
+    """查询进程中执行出错，只传回错误信息，避免异常对象无法序列化"""
+
+
+def _worker_main(conn) -> None:
+    """
+    查询进程的主循环。引擎保持数据集连接常驻（keep_open），
+    同一会话的后续查询无需重新打开数据集。
+    """
+    from engines import ENGINES, DuckDBEngine, SQLiteEngine
+
+    engines = {
+        "sqlite": SQLiteEngine(keep_open=True, heap_limit_mb=QUERY_MEMORY_LIMIT_MB),
+        "duckdb": DuckDBEngine(keep_open=True),
+    }
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            break
+        if request is None:
+            break
+
+        engine_name, sql, dataset, stream_rows = request
+        try:
+            engine = engines.get(engine_name, ENGINES["sqlite"])
+            # 前几行边读边发回，Pipe 写满时在此阻塞，形成背压
+            result = engine.execute(
+                sql, dataset,
+                on_batch=lambda batch: conn.send(("batch", batch)) if stream_rows else None,
+                stream_rows=stream_rows,
+            )
+            conn.send(("ok", result))
+        except Exception as e:
+            conn.send(("error", str(e)))
+
+
+class QueryWorker:
+    """一个常驻的查询进程，通过 Pipe 收发请求"""
+
+    def __init__(self, index: int, context):
+        self.index = index
+        self._context = context
+        self._lock = threading.Lock()
+        self._process = None
+        self._conn = None
+        self.queries = 0
+        self.restarts = 0
+
+    def _ensure_started(self) -> None:
+        if self._process is not None and self._process.is_alive():
+            return
+        if self._process is not None:
+            self.restarts += 1
+        parent_conn, child_conn = self._context.Pipe()
+        # eventlet 下 Pipe 底层的 socketpair 是非阻塞的，收发大结果时需要阻塞模式
+        os.set_blocking(parent_conn.fileno(), True)
+        os.set_blocking(child_conn.fileno(), True)
+        self._process = self._context.Process(
+            target=_worker_main, args=(child_conn,), name=f"query-worker-{self.index}", daemon=True
+        )
+        self._process.start()
+        child_conn.close()
+        self._conn = parent_conn
+
+    def _kill(self) -> None:
+        """结束正在执行的查询进程，下次使用时重新启动"""
+        if self._process is not None:
+            self._process.kill()
+            self._process.join(timeout=5)
+        if self._conn is not None:
+            self._conn.close()
+        self._process = None
+        self._conn = None
+        self.restarts += 1
+
+    def run(self, engine_name: str, sql: str, dataset: Dict[str, Any],
+            wait: Callable[[float], None], is_cancelled: Callable[[], bool],
+            on_batch: Optional[Callable[[pd.DataFrame], None]] = None,
+            stream_rows: int = 0) -> pd.DataFrame:
+        with self._lock:
+            self._ensure_started()
+            self.queries += 1
+            deadline = time.monotonic() + QUERY_TIMEOUT + QUERY_KILL_GRACE
+            try:
+                self._conn.send((engine_name, sql, dataset, stream_rows if on_batch else 0))
+                # 轮询结果，等待期间让出控制权，并检查客户端是否已断开
+                while True:
+                    if self._conn.poll():
+                        kind, result = self._conn.recv()
+                        if kind != "batch":
+                            break
+                        on_batch(result)
+                        continue
+                    if is_cancelled():
+                        self._kill()
+                        raise QueryCancelled("Query cancelled")
+                    if time.monotonic() > deadline:
+                        self._kill()
+                        raise QueryCancelled(f"Query exceeded the {QUERY_TIMEOUT:g}s time limit")
+                    wait(POLL_INTERVAL)
+            except (EOFError, OSError, BrokenPipeError) as e:
+                # 查询进程异常退出（如内存不足被系统结束）
+                self._kill()
+                raise RuntimeError("Query worker exited unexpectedly") from e
+
+        if kind == "error":
+            raise QueryFailed(result)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pid": self._process.pid if self._process is not None and self._process.is_alive() else None,
+            "queries": self.queries,
+            "restarts": self.restarts,
+        }
+
+
+class QueryPool:
+    """
+    查询进程池：按会话哈希固定路由到同一个进程（会话亲和），
+    使该会话的数据集连接常驻在这个进程中。
+    进程在第一次查询时才启动。
+    """
+
+    def __init__(self, size: int = QUERY_WORKERS, isolation: str = QUERY_ISOLATION,
+                 wait: Callable[[float], None] = time.sleep):
+        self.isolation = isolation
+        self.wait = wait
+        # spawn 启动的子进程不继承 Web 进程中的 eventlet 状态和连接
+        context = multiprocessing.get_context("spawn")
+        self._workers: List[QueryWorker] = [QueryWorker(i, context) for i in range(max(1, size))]
+        self.cancelled = 0
+        if isolation != "process":
+            print("QUERY_ISOLATION=inline: SQLite queries share the web process and are not "
+                  "capped by QUERY_MEMORY_LIMIT_MB")
+
+    def worker_for(self, session_id: Any) -> QueryWorker:
+        return self._workers[zlib.crc32(str(session_id).encode("utf-8")) % len(self._workers)]
+
+    def runner(self, session_id: Any, is_cancelled: Optional[Callable[[], bool]] = None):
+        """
+        返回 FileProcessor.execute_query 使用的 runner；
+        inline 模式下返回 None，即在当前进程执行。
+        """
+        if self.isolation != "process":
+            return None
+        worker = self.worker_for(session_id)
+
+        def run(engine_name: str, sql: str, dataset: Dict[str, Any],
+                on_batch: Optional[Callable[[pd.DataFrame], None]] = None,
+                stream_rows: int = 0) -> pd.DataFrame:
+            try:
+                return worker.run(engine_name, sql, dataset, self.wait, is_cancelled or (lambda: False),
+                                  on_batch=on_batch, stream_rows=stream_rows)
+            except QueryCancelled:
+                self.cancelled += 1
+                raise
+
+        return run
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "isolation": self.isolation,
+            "cancelled": self.cancelled,
+            "workers": [worker.stats() for worker in self._workers],
+        }
@@ -0,0 +1,114 @@
+import json
+import os
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from cache import LRUCache, frame_bytes
+from serialization import table_payload
+
+# 每页默认行数，以及单页允许的最大行数
+RESULT_PAGE_SIZE = int(os.environ.get("RESULT_PAGE_SIZE", 100))
+RESULT_MAX_PAGE_SIZE = int(os.environ.get("RESULT_MAX_PAGE_SIZE", 1000))
+# 结果在 query_results 中的存储格式：Parquet 列式存储 + zstd 压缩
+RESULT_FORMAT = "parquet-zstd"
+RESULT_ROW_GROUP_SIZE = 10_000
+
+# 内存中保留的结果集数量和合计占用的内存（MB），被淘汰的结果集按需从数据库重新加载
+RESULT_SET_CACHE_SIZE = int(os.environ.get("RESULT_SET_CACHE_SIZE", 64))
+RESULT_SET_CACHE_MAX_MB = int(os.environ.get("RESULT_SET_CACHE_MAX_MB", 256))
+
+
+def encode_frame(df: pd.DataFrame) -> Tuple[str, bytes]:
+    """将结果编码为压缩的 Parquet 字节，返回 (格式, 字节)"""
+    try:
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # 混合类型的 object 列无法推断 Arrow 类型，统一转为字符串
+            df = df.copy()
+            for col in df.columns[df.dtypes == object]:
+                df[col] = df[col].map(lambda v: None if v is None or v != v else str(v))
+            table = pa.Table.from_pandas(df, preserve_index=False)
+
+        sink = pa.BufferOutputStream()
+        pq.write_table(table, sink, compression="zstd", row_group_size=RESULT_ROW_GROUP_SIZE)
+        return RESULT_FORMAT, sink.getvalue().to_pybytes()
+    except ValueError:
+        # 重复列名等 Parquet 不支持的情况，退回 JSON
+        return "json", json.dumps(df.to_dict('split'), default=str).encode("utf-8")
+
+
+def decode_frame(result_format: str, blob: bytes, columns: Optional[List[str]] = None,
+                 limit: Optional[int] = None) -> pd.DataFrame:
+    """
+    解码存储的结果。columns 只读取指定列，limit 只解码前若干行，
+    用于历史消息只需要第一页的场景。
+    """
+    if result_format == "json":
+        raw = json.loads(blob)
+        df = pd.DataFrame(data=raw["data"], columns=raw["columns"])
+        if columns:
+            df = df[columns]
+        return df.head(limit) if limit is not None else df
+
+    parquet_file = pq.ParquetFile(pa.BufferReader(blob))
+    if limit is None:
+        return parquet_file.read(columns=columns).to_pandas()
+
+    batch = next(parquet_file.iter_batches(batch_size=max(limit, 1), columns=columns), None)
+    if batch is None:
+        return parquet_file.schema_arrow.empty_table().to_pandas()
+    return batch.to_pandas()
+
+
+class ResultSetStore:
+    """
+    服务端保存的查询结果集，以 message_id 作为句柄。
+    客户端按页获取数据，不再一次性下发全部行。
+    """
+
+    def __init__(self, loader: Callable[[int], Optional[pd.DataFrame]],
+                 max_size: int = RESULT_SET_CACHE_SIZE, max_mb: int = RESULT_SET_CACHE_MAX_MB):
+        self._cache = LRUCache(max_size, max_bytes=max_mb * 1024 * 1024, sizeof=frame_bytes)
+        self._loader = loader
+
+    def put(self, result_id: int, df: pd.DataFrame) -> None:
+        self._cache.put(result_id, df)
+
+    def get(self, result_id: int) -> Optional[pd.DataFrame]:
+        df = self._cache.get(result_id)
+        if df is None:
+            df = self._loader(result_id)
+            if df is not None:
+                self._cache.put(result_id, df)
+        return df
+
+    def stats(self) -> Dict[str, Any]:
+        return self._cache.stats()
+
+
+def window(df: pd.DataFrame, offset: int = 0, limit: int = RESULT_PAGE_SIZE,
+           sort: Optional[str] = None, order: str = "asc",
+           search: Optional[str] = None, search_column: Optional[str] = None) -> Dict[str, Any]:
+    """
+    对结果集做筛选、排序和分页，返回一页按列编码的数据（见 serialization.table_payload）。
+    search 为不区分大小写的包含匹配，可限定到 search_column。
+    """
+    limit = max(1, min(limit, RESULT_MAX_PAGE_SIZE))
+    offset = max(0, offset)
+
+    if search:
+        columns = [search_column] if search_column in df.columns else list(df.columns)
+        mask = pd.Series(False, index=df.index)
+        for col in columns:
+            mask |= df[col].astype(str).str.contains(search, case=False, regex=False, na=False)
+        df = df[mask]
+
+    if sort in df.columns:
+        df = df.sort_values(sort, ascending=(order != "desc"), kind="stable")
+
+    page = df.iloc[offset:offset + limit]
+    return table_payload(page, total=len(df), offset=offset, limit=limit)
@@ -0,0 +1,287 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import urllib.parse
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from cache import LRUCache
+from catalog import IDENTIFIER_PATTERN, STRING_PATTERN, quote_identifier
+
+# 物化库中记录顾问所建索引和汇总表的表
+ADVISOR_TABLE = "_advisor"
+
+IDENT = r'(?:"(?:[^"]|"")+"|`[^`]+`|\[[^\]]+\]|[^\W\d]\w*)'
+AGGREGATE_PATTERN = re.compile(rf"\b(count|sum|avg|min|max|total)\s*\(\s*(\*|{IDENT})\s*\)", re.IGNORECASE)
+SHAPE_PATTERN = re.compile(
+    rf"^\s*select\s+(?P<select>.+?)\s+from\s+(?P<table>{IDENT})"
+    r"(?:\s+where\s+(?P<where>.+?))?"
+    r"(?:\s+group\s+by\s+(?P<group>.+?))?"
+    r"(?P<tail>\s+(?:having|order\s+by|limit)\b.*?)?\s*;?\s*$",
+    re.IGNORECASE | re.DOTALL,
+)
+ITEM_PATTERN = re.compile(
+    rf"^(?:(?P<agg>{AGGREGATE_PATTERN.pattern})|(?P<col>{IDENT}))(?:\s+(?:as\s+)?(?P<alias>{IDENT}))?$",
+    re.IGNORECASE | re.DOTALL,
+)
+WHERE_PATTERN = re.compile(
+    r"\bwhere\b(?P<where>.+?)(?=\bgroup\s+by\b|\border\s+by\b|\bhaving\b|\blimit\b|\bunion\b|\)|$)",
+    re.IGNORECASE | re.DOTALL,
+)
+# 汇总表无法等价改写的写法：多表、子查询、去重、窗口函数、限定列名
+UNSUPPORTED_PATTERN = re.compile(
+    rf"\b(join|union|intersect|except|distinct|over|with)\b|\(\s*select\b|{IDENT}\s*\.\s*{IDENT}",
+    re.IGNORECASE,
+)
+
+# 汇总表定义，键为 (物化库路径, 物化库 mtime)，顾问建表后自动失效
+_rollup_cache = LRUCache(256)
+
+
+def unquote_identifier(name: str) -> str:
+    if name[:1] == '"' and name[-1:] == '"':
+        return name[1:-1].replace('""', '"')
+    if name[:1] in "`[":
+        return name[1:-1]
+    return name
+
+
+def _mask_strings(sql: str) -> Tuple[str, List[str]]:
+    """把字符串常量替换为占位符，避免其中的关键字、括号、逗号影响解析"""
+    literals: List[str] = []
+
+    def keep(match):
+        literals.append(match.group(0))
+        return f"'#{len(literals) - 1}'"
+
+    return STRING_PATTERN.sub(keep, sql), literals
+
+
+def _unmask_strings(sql: str, literals: List[str]) -> str:
+    return re.sub(r"'#(\d+)'", lambda m: literals[int(m.group(1))], sql)
+
+
+def _split_items(text: str) -> List[str]:
+    """按顶层逗号拆分 SELECT / GROUP BY 列表"""
+    items, depth, start = [], 0, 0
+    for i, char in enumerate(text):
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "," and depth == 0:
+            items.append(text[start:i].strip())
+            start = i + 1
+    items.append(text[start:].strip())
+    return items
+
+
+def _column_refs(text: str, columns: Dict[str, str]) -> Set[str]:
+    """文本中出现的列名（标准列名），columns 为 {小写列名: 列名}"""
+    found = set()
+    for match in IDENTIFIER_PATTERN.finditer(text):
+        identifier = next(group for group in match.groups() if group is not None).replace('""', '"')
+        if identifier.lower() in columns:
+            found.add(columns[identifier.lower()])
+    return found
+
+
+def filter_columns(sql: str, columns: Iterable[str]) -> Set[str]:
+    """SQL 的 WHERE 条件中用到的列，用于挑选要建索引的列"""
+    by_lower = {col.lower(): col for col in columns}
+    masked, _ = _mask_strings(sql)
+    found: Set[str] = set()
+    for match in WHERE_PATTERN.finditer(masked):
+        found |= _column_refs(match.group("where"), by_lower)
+    return found
+
+
+def parse_shape(sql: str, table_name: str, columns: Iterable[str]) -> Optional[Dict[str, Any]]:
+    """
+    识别单表聚合查询：SELECT 维度列与 COUNT/SUM/AVG/MIN/MAX/TOTAL(列)，
+    FROM 表 [WHERE 只涉及维度列] [GROUP BY 维度列] [HAVING/ORDER BY/LIMIT]。
+    返回 {"dims": 分组列和过滤列, "measures": 被聚合的列, 以及改写所需的各部分}，不是这种形式时返回 None。
+    """
+    by_lower = {col.lower(): col for col in columns}
+    masked, literals = _mask_strings(sql.strip())
+    if UNSUPPORTED_PATTERN.search(masked):
+        return None
+    match = SHAPE_PATTERN.match(masked)
+    if match is None or unquote_identifier(match.group("table")).lower() != table_name.lower():
+        return None
+
+    dims: Set[str] = set()
+    measures: Set[str] = set()
+    items = []
+    for item in _split_items(match.group("select")):
+        parsed = ITEM_PATTERN.match(item)
+        if parsed is None:
+            return None
+        if parsed.group("col"):
+            col = by_lower.get(unquote_identifier(parsed.group("col")).lower())
+            if col is None:
+                return None
+            dims.add(col)
+        items.append(parsed)
+
+    group = match.group("group")
+    if group:
+        for item in _split_items(group):
+            col = by_lower.get(unquote_identifier(item).lower()) if re.fullmatch(IDENT, item) else None
+            if col is None:
+                return None
+            dims.add(col)
+
+    where = match.group("where") or ""
+    if AGGREGATE_PATTERN.search(where):
+        return None
+    dims |= _column_refs(where, by_lower)
+
+    tail = match.group("tail") or ""
+    for agg in AGGREGATE_PATTERN.finditer(match.group("select") + " " + tail):
+        if agg.group(2) != "*":
+            col = by_lower.get(unquote_identifier(agg.group(2)).lower())
+            if col is None:
+                return None
+            measures.add(col)
+
+    if not group and not any(item.group("agg") for item in items):
+        return None
+    if not group and any(item.group("col") for item in items):
+        return None
+    return {
+        "dims": dims,
+        "measures": measures,
+        "items": items,
+        "where": where,
+        "group": group,
+        "tail": tail,
+        "literals": literals,
+        "by_lower": by_lower,
+    }
+
+
+def _measure_column(kind: str, col: str) -> str:
+    return f"__{kind}__{col}"
+
+
+def _rewrite_aggregate(match, by_lower: Dict[str, str], grouped: bool) -> str:
+    """聚合函数改写为对汇总表中预聚合列的再聚合"""
+    func, arg = match.group(1).lower(), match.group(2)
+    if arg == "*":
+        expr = 'SUM("__cnt")'
+        return expr if grouped else f"COALESCE({expr}, 0)"
+    col = by_lower[unquote_identifier(arg).lower()]
+    if func == "count":
+        expr = f"SUM({quote_identifier(_measure_column('cnt', col))})"
+        return expr if grouped else f"COALESCE({expr}, 0)"
+    if func in ("sum", "total"):
+        return f"{func.upper()}({quote_identifier(_measure_column('sum', col))})"
+    if func == "avg":
+        return (f"(SUM({quote_identifier(_measure_column('sum', col))}) * 1.0 / "
+                f"SUM({quote_identifier(_measure_column('cnt', col))}))")
+    return f"{func.upper()}({quote_identifier(_measure_column(func, col))})"
+
+
+def rewrite(shape: Dict[str, Any], view_name: str) -> str:
+    """把识别出的聚合查询改写到汇总表上，结果的列名与原查询一致"""
+    grouped = bool(shape["group"])
+    by_lower = shape["by_lower"]
+    select = []
+    for item in shape["items"]:
+        alias = item.group("alias")
+        if item.group("agg"):
+            expr = AGGREGATE_PATTERN.sub(lambda m: _rewrite_aggregate(m, by_lower, grouped), item.group("agg"))
+            # 未指定别名时结果列名为原表达式文本，用别名保持不变
+            select.append(f"{expr} AS {alias or quote_identifier(item.group('agg'))}")
+        else:
+            select.append(item.group(0))
+    sql = f"SELECT {', '.join(select)} FROM {quote_identifier(view_name)}"
+    if shape["where"]:
+        sql += f" WHERE {shape['where']}"
+    if shape["group"]:
+        sql += f" GROUP BY {shape['group']}"
+    sql += AGGREGATE_PATTERN.sub(lambda m: _rewrite_aggregate(m, by_lower, grouped), shape["tail"])
+    return _unmask_strings(sql, shape["literals"])
+
+
+def rollup_name(table: str, dims: Iterable[str]) -> str:
+    key = json.dumps([table, sorted(dims)], ensure_ascii=False).encode("utf-8")
+    return f"_rollup_{hashlib.sha1(key).hexdigest()[:12]}"
+
+
+def build_rollup(conn: sqlite3.Connection, table: str, dims: Iterable[str], measures: Iterable[str]) -> Tuple[str, int]:
+    """
+    在物化库中按维度列预聚合：每组的行数，以及每个度量列的 SUM/COUNT/MIN/MAX。
+    返回 (汇总表名, 行数)。
+    """
+    dims, measures = sorted(dims), sorted(measures)
+    name = rollup_name(table, dims)
+    columns = [quote_identifier(col) for col in dims] + ['COUNT(*) AS "__cnt"']
+    for col in measures:
+        columns += [
+            f"SUM({quote_identifier(col)}) AS {quote_identifier(_measure_column('sum', col))}",
+            f"COUNT({quote_identifier(col)}) AS {quote_identifier(_measure_column('cnt', col))}",
+            f"MIN({quote_identifier(col)}) AS {quote_identifier(_measure_column('min', col))}",
+            f"MAX({quote_identifier(col)}) AS {quote_identifier(_measure_column('max', col))}",
+        ]
+    group_by = f" GROUP BY {', '.join(quote_identifier(col) for col in dims)}" if dims else ""
+    conn.execute(f"DROP TABLE IF EXISTS {quote_identifier(name)}")
+    conn.execute(
+        f"CREATE TABLE {quote_identifier(name)} AS "
+        f"SELECT {', '.join(columns)} FROM {quote_identifier(table)}{group_by}"
+    )
+    rows = conn.execute(f"SELECT COUNT(*) FROM {quote_identifier(name)}").fetchone()[0]
+    return name, rows
+
+
+def load_rollups(store_path: str) -> List[Dict[str, Any]]:
+    """物化库中已建的汇总表：[{"name", "table", "dims", "measures", "rows"}]"""
+    key = (store_path, os.stat(store_path).st_mtime_ns)
+    rollups = _rollup_cache.get(key)
+    if rollups is None:
+        rollups = []
+        store_uri = f"file:{urllib.parse.quote(os.path.abspath(store_path))}?mode=ro"
+        try:
+            conn = sqlite3.connect(store_uri, uri=True)
+            try:
+                for name, base_table, definition in conn.execute(
+                    f"SELECT name, base_table, definition FROM {ADVISOR_TABLE} WHERE kind = 'rollup'"
+                ):
+                    rollups.append({"name": name, "table": base_table, **json.loads(definition)})
+            finally:
+                conn.close()
+        except sqlite3.OperationalError:
+            # 尚未建过汇总表
+            pass
+        _rollup_cache.put(key, rollups)
+    return rollups
+
+
+def route(sql: str, tables: Dict[str, Dict[str, Any]]) -> Optional[Tuple[str, Dict[str, Dict[str, Any]]]]:
+    """
+    查询只涉及一张表、且能由该表的某个汇总表回答时，改写到汇总表上。
+    tables 为 {表名: {"store_path", "table", "profile"}}（见 FileProcessor.catalog_tables）。
+    返回 (改写后的 SQL, {汇总表视图名: {"store_path", "table", "rows"}})，否则返回 None。
+    """
+    if len(tables) != 1:
+        return None
+    (name, entry), = tables.items()
+    rollups = [r for r in load_rollups(entry["store_path"]) if r["table"] == entry["table"]]
+    if not rollups:
+        return None
+    shape = parse_shape(sql, name, [col["name"] for col in entry["profile"]["columns"]])
+    if shape is None:
+        return None
+    candidates = [
+        r for r in rollups
+        if shape["dims"] <= set(r["dims"]) and shape["measures"] <= set(r["measures"])
+    ]
+    if not candidates:
+        return None
+    rollup = min(candidates, key=lambda r: r["rows"])
+    view_name = rollup["name"]
+    return rewrite(shape, view_name), {
+        view_name: {"store_path": entry["store_path"], "table": rollup["name"], "rows": rollup["rows"]}
+    }
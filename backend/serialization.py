@@ -0,0 +1,111 @@
+from typing import Any, Dict, List
+
+import numpy as np
+import orjson
+import pandas as pd
+from flask.json.provider import JSONProvider
+
+# NaN/±inf 由 orjson 输出为 null，datetime 与 numpy 数组、标量直接编码
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def _column_values(series: pd.Series) -> Any:
+    """单列转换为可直接编码的值：数值列保持 numpy 数组，其余列整体转换为列表"""
+    dtype = series.dtype
+    if isinstance(dtype, np.dtype) and dtype.kind in "biuf":
+        # orjson 直接编码连续的 numpy 数组，不逐个创建 Python 对象
+        return np.ascontiguousarray(series.to_numpy())
+    if isinstance(dtype, np.dtype) and dtype.kind == "M":
+        values = np.datetime_as_string(series.to_numpy(), unit="s").astype(object)
+        values[series.isna().to_numpy()] = None
+        return values.tolist()
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        # 带时区的日期
+        return series.map(lambda v: None if v is pd.NaT else v.isoformat()).tolist()
+    if isinstance(dtype, np.dtype) and dtype.kind == "m":
+        return series.astype(str).where(series.notna(), None).tolist()
+    # object、字符串、可空整数等列：缺失值统一为 None
+    return series.astype(object).where(series.notna(), None).tolist()
+
+
+def frame_columns(df: pd.DataFrame) -> Dict[str, Any]:
+    """按列编码的数据 {列名: 值数组}，即表格接口中的 data 字段"""
+    return {str(col): _column_values(df.iloc[:, i]) for i, col in enumerate(df.columns)}
+
+
+def table_payload(df: pd.DataFrame, **extra: Any) -> Dict[str, Any]:
+    """
+    表格数据的传输格式：columns 为 antd Table 的列定义，data 为按列存储的值。
+    不再逐行生成 dict，客户端收到后再展开为行（见前端 tableData.js）。
+    """
+    payload = {
+        "columns": [{"title": str(col), "dataIndex": str(col), "key": str(col)} for col in df.columns],
+        "data": frame_columns(df),
+    }
+    payload.update(extra)
+    return payload
+
+
+def slice_columns(data: Dict[str, List[Any]], start: int, stop: int) -> Dict[str, List[Any]]:
+    """截取按列存储的数据中的若干行"""
+    return {col: values[start:stop] for col, values in data.items()}
+
+
+def _default(obj: Any) -> Any:
+    """orjson 不能直接编码的类型"""
+    if isinstance(obj, pd.DataFrame):
+        return frame_columns(obj)
+    if isinstance(obj, pd.Series):
+        return _column_values(obj)
+    if isinstance(obj, np.ndarray):
+        # 非连续或 object 类型的数组
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if obj is pd.NaT:
+        return None
+    if isinstance(obj, pd.Timestamp):
+        return obj.isoformat()
+    if isinstance(obj, pd.Timedelta):
+        return str(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    # Decimal、bytes 等
+    return str(obj)
+
+
+def dumps(obj: Any) -> bytes:
+    """编码为 JSON 字节"""
+    return orjson.dumps(obj, default=_default, option=ORJSON_OPTIONS)
+
+
+def loads(data: Any) -> Any:
+    return orjson.loads(data)
+
+
+class OrjsonProvider(JSONProvider):
+    """Flask 的 JSON 实现，jsonify 及所有 JSON 响应都经由 orjson 编码"""
+
+    mimetype = "application/json"
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        return dumps(obj).decode("utf-8")
+
+    def loads(self, s: Any, **kwargs: Any) -> Any:
+        return orjson.loads(s)
+
+    def response(self, *args: Any, **kwargs: Any):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps(obj), mimetype=self.mimetype)
+
+
+class SocketJSON:
+    """供 Flask-SocketIO 使用的 json 模块，Socket.IO 事件与 HTTP 接口使用同一编码"""
+
+    @staticmethod
+    def dumps(obj: Any, **kwargs: Any) -> str:
+        return dumps(obj).decode("utf-8")
+
+    @staticmethod
+    def loads(s: Any, **kwargs: Any) -> Any:
+        return orjson.loads(s)
@@ -0,0 +1,175 @@
+import math
+import os
+import re
+import sqlite3
+import time
+from collections import defaultdict
+from typing import Dict, Optional, Set, Tuple
+
+# 单次查询最多返回的行数，超出部分截断
+QUERY_MAX_ROWS = int(os.environ.get("QUERY_MAX_ROWS", 100_000))
+# 单次查询的最长执行时间（秒）
+QUERY_TIMEOUT = float(os.environ.get("QUERY_TIMEOUT", 30))
+# EXPLAIN QUERY PLAN 估算的最大扫描行数，超过则拒绝执行
+QUERY_MAX_COST = float(os.environ.get("QUERY_MAX_COST", 1e9))
+# 单次查询可使用的内存上限（MB），排序、分组等中间结果超出时写入临时文件，仍然超出则拒绝
+QUERY_MEMORY_LIMIT_MB = int(os.environ.get("QUERY_MEMORY_LIMIT_MB", 512))
+# 列式引擎中间结果溢出到磁盘时使用的目录
+QUERY_SPILL_DIR = os.environ.get("QUERY_SPILL_DIR", os.path.join("data", "spill"))
+# 进度回调的调用间隔（SQLite 虚拟机指令数）
+PROGRESS_INTERVAL = 10_000
+
+ALLOWED_LEADING_KEYWORDS = ("select", "with", "values")
+QUOTED_PATTERN = r"""'(?:[^']|'')*'|"(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\]"""
+TABLE_REF_PATTERN = re.compile(
+    r"""\b(?:from|join)\s+("(?:[^"]|"")+"|`[^`]+`|\[[^\]]+\]|\w+)(?:\s+(?:as\s+)?(\w+))?""",
+    re.IGNORECASE,
+)
+NOT_ALIASES = {"where", "on", "join", "left", "right", "inner", "outer", "cross", "natural",
+               "group", "order", "limit", "union", "except", "intersect", "using", "having", "window"}
+
+# 只允许读取操作，其余操作（写入、ATTACH、PRAGMA 等）在编译阶段即被拒绝
+ALLOWED_ACTIONS = {sqlite3.SQLITE_SELECT, sqlite3.SQLITE_READ, sqlite3.SQLITE_FUNCTION}
+if hasattr(sqlite3, "SQLITE_RECURSIVE"):
+    ALLOWED_ACTIONS.add(sqlite3.SQLITE_RECURSIVE)
+# 系统表中有所有已挂载的库和视图的定义，不允许查询直接读取
+SCHEMA_TABLES = {"sqlite_master", "sqlite_schema", "sqlite_temp_master", "sqlite_temp_schema"}
+
+
+class QueryRejected(ValueError):
+    """SQL 未通过执行前检查"""
+
+
+def _strip_comments(sql: str) -> str:
+    """去掉引号外的注释"""
+    parts = re.split(f"({QUOTED_PATTERN})", sql)
+    for i in range(0, len(parts), 2):
+        parts[i] = re.sub(r"--[^\n]*", " ", parts[i])
+        parts[i] = re.sub(r"/\*.*?\*/", " ", parts[i], flags=re.DOTALL)
+    return "".join(parts)
+
+
+def validate_sql(sql: str) -> str:
+    """
+    检查生成的 SQL 只包含一条只读查询，返回去掉注释和结尾分号后的语句。
+    更严格的检查由 read_only_authorizer 在 SQLite 编译语句时完成。
+    """
+    statement = _strip_comments(sql).strip().rstrip(";").strip()
+    if not statement:
+        raise QueryRejected("Empty SQL statement")
+
+    unquoted = re.sub(QUOTED_PATTERN, "''", statement)
+    if ";" in unquoted:
+        raise QueryRejected("Only a single SQL statement is allowed")
+
+    keyword = unquoted.split(None, 1)[0].lower()
+    if keyword not in ALLOWED_LEADING_KEYWORDS:
+        raise QueryRejected(f"Only SELECT queries are allowed, got {keyword.upper()}")
+    return statement
+
+
+def read_only_authorizer(readable: Optional[Set[Tuple[str, str]]] = None):
+    """
+    生成 SQLite 授权回调：只放行读取相关的操作。
+    readable 不为空时只能读取其中的 (schema, 表) 和 TEMP 中的视图：常驻的查询目录上
+    还挂载着之前的查询用过的库，不能通过 schema 名直接读取（CTE 也会作为视图出现在
+    回调参数中，不能只看读取是否经过视图）。读取 CTE、子查询的结果时 db_name 为 None，
+    不涉及任何库中的表，直接放行。
+    拒绝的原因记录在回调的 denied 属性上，供 check_query 生成错误信息。
+    """
+    def authorize(action, arg1, arg2, db_name, trigger):
+        if action not in ALLOWED_ACTIONS:
+            authorize.denied = "Only read-only queries are allowed"
+            return sqlite3.SQLITE_DENY
+        if action == sqlite3.SQLITE_READ:
+            if str(arg1).lower() in SCHEMA_TABLES or (
+                    readable is not None and db_name not in (None, "temp")
+                    and (db_name, arg1) not in readable):
+                authorize.denied = "Queries may only reference the dataset tables"
+                return sqlite3.SQLITE_DENY
+        return sqlite3.SQLITE_OK
+
+    authorize.denied = None
+    return authorize
+
+
+def _table_aliases(sql: str) -> Dict[str, str]:
+    """从 FROM/JOIN 子句解析 别名 -> 表名，EXPLAIN QUERY PLAN 中显示的是别名"""
+    aliases = {}
+    for table, alias in TABLE_REF_PATTERN.findall(sql):
+        table = table.strip('"`[]')
+        aliases[table.lower()] = table
+        if alias and alias.lower() not in NOT_ALIASES:
+            aliases[alias.lower()] = table
+    return aliases
+
+
+def estimate_cost(conn: sqlite3.Connection, sql: str, row_counts: Dict[str, int]) -> float:
+    """
+    用 EXPLAIN QUERY PLAN 估算需要访问的行数。
+    同一层的各步骤是嵌套循环，代价相乘：全表扫描按表行数计，索引查找按 log2(行数) 计；
+    各层（子查询、CTE 物化）的代价相加。未知的表按最大的表估计。
+    """
+    plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+    aliases = _table_aliases(sql)
+    counts = {name.lower(): rows for name, rows in row_counts.items()}
+    default_rows = max(counts.values(), default=1)
+
+    levels: Dict[int, float] = defaultdict(lambda: 1.0)
+    for _, parent, _, detail in plan:
+        match = re.match(r"(SCAN|SEARCH) (\S+)", detail)
+        if not match or match.group(2) == "CONSTANT":
+            continue
+        name = aliases.get(match.group(2).lower(), match.group(2)).lower()
+        rows = max(counts.get(name, default_rows), 1)
+        levels[parent] *= rows if match.group(1) == "SCAN" else math.log2(rows) + 1
+    return sum(levels.values())
+
+
+def limit_rows(sql: str, max_rows: int) -> str:
+    """包一层 LIMIT，多取一行用于判断结果是否被截断"""
+    return f"SELECT * FROM (\n{sql}\n) LIMIT {max_rows + 1}"
+
+
+def install_timeout(conn: sqlite3.Connection, timeout: float) -> None:
+    """通过进度回调限制执行时间，超时后 SQLite 中断语句并抛出 OperationalError"""
+    deadline = time.monotonic() + timeout
+    conn.set_progress_handler(lambda: 1 if time.monotonic() > deadline else 0, PROGRESS_INTERVAL)
+
+
+def install_memory_limit(conn: sqlite3.Connection, limit_mb: int = QUERY_MEMORY_LIMIT_MB) -> None:
+    """
+    限制 SQLite 可使用的堆内存，超出时语句失败并抛出 MemoryError。
+    hard_heap_limit 作用于整个进程，只能在查询进程中调用：查询进程一次只执行一个查询，即为单次查询的上限。
+    """
+    conn.execute(f"PRAGMA hard_heap_limit = {int(limit_mb) * 1024 * 1024}")
+
+
+def check_query(conn: sqlite3.Connection, sql: str, row_counts: Dict[str, int],
+                max_cost: float = QUERY_MAX_COST,
+                readable: Optional[Set[Tuple[str, str]]] = None) -> str:
+    """
+    执行前检查：只读校验、授权回调编译检查和代价估算。
+    返回可直接执行的语句，不通过时抛出 QueryRejected。
+    """
+    statement = validate_sql(sql)
+
+    authorizer = read_only_authorizer(readable)
+    conn.set_authorizer(authorizer)
+    try:
+        cost = estimate_cost(conn, statement, row_counts)
+    except sqlite3.DatabaseError as e:
+        if authorizer.denied:
+            raise QueryRejected(authorizer.denied) from e
+        raise
+
+    if cost > max_cost:
+        raise QueryRejected(
+            f"Query is too expensive to run (estimated {cost:,.0f} row visits, limit {max_cost:,.0f}). "
+            "Try adding filters or aggregations."
+        )
+    return statement
+
+
+def is_timeout(error: Exception) -> bool:
+    return isinstance(error, sqlite3.OperationalError) and "interrupted" in str(error)
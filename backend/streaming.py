@@ -0,0 +1,79 @@
+import os
+import time
+from typing import Any, Dict, Optional
+
+import pandas as pd
+
+from serialization import table_payload
+
+# 未确认的数据块上限，超过后等待客户端确认再继续推送
+STREAM_WINDOW = int(os.environ.get("STREAM_WINDOW", 2))
+# 等待客户端确认的最长时间（秒），超时后认为客户端不支持确认，不再等待
+STREAM_ACK_TIMEOUT = float(os.environ.get("STREAM_ACK_TIMEOUT", 2))
+
+
+class ResultStreamer:
+    """
+    查询执行过程中，把读到的前几行分批通过 result_stream 事件推送给客户端，
+    客户端可以在查询完成前先渲染。每块需要客户端确认（ack），
+    未确认的块达到 STREAM_WINDOW 时暂停推送，形成背压。
+    最后发送 done=True 的结束标记。
+    """
+
+    def __init__(self, socketio, sid: str, message_id: int, chart_type: str,
+                 window: int = STREAM_WINDOW, ack_timeout: float = STREAM_ACK_TIMEOUT):
+        self.socketio = socketio
+        self.sid = sid
+        self.message_id = message_id
+        self.chart_type = chart_type
+        self.window = window
+        self.ack_timeout = ack_timeout
+        self.rows_sent = 0
+        self.chunks_sent = 0
+        self._unacked = 0
+        self._acks_enabled = True
+
+    def _ack(self, *args) -> None:
+        self._unacked = max(0, self._unacked - 1)
+
+    def _wait_for_window(self) -> None:
+        deadline = time.monotonic() + self.ack_timeout
+        while self._acks_enabled and self._unacked >= self.window:
+            if time.monotonic() > deadline:
+                print(f"Client {self.sid} is not acknowledging result chunks, streaming without backpressure")
+                self._acks_enabled = False
+                break
+            self.socketio.sleep(0.01)
+
+    def send(self, batch: pd.DataFrame) -> None:
+        """推送一批数据，作为 execute_query 的 on_batch 回调"""
+        self._wait_for_window()
+        self._unacked += 1
+        self.socketio.emit(
+            "result_stream",
+            table_payload(
+                batch,
+                message_id=self.message_id,
+                chart_type=self.chart_type,
+                offset=self.rows_sent,
+                done=False,
+            ),
+            to=self.sid,
+            callback=self._ack,
+        )
+        self.rows_sent += len(batch)
+        self.chunks_sent += 1
+        # 让出控制权，使数据块尽快写出
+        self.socketio.sleep(0)
+
+    def finish(self, total: Optional[int] = None, error: Optional[str] = None) -> None:
+        """发送结束标记"""
+        payload: Dict[str, Any] = {
+            "message_id": self.message_id,
+            "done": True,
+            "rows_sent": self.rows_sent,
+            "total": total,
+        }
+        if error:
+            payload["error"] = error
+        self.socketio.emit("result_stream", payload, to=self.sid)
@@ -0,0 +1,14 @@
+import os
+import sys
+
+import pytest
+
+# 后端模块以平铺方式相互导入，测试时把 backend 目录加入导入路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """在临时目录中运行，data/、uploads/ 等相对路径不会写入仓库"""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
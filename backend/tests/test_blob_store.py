@@ -0,0 +1,84 @@
+import io
+import os
+import sqlite3
+
+import pytest
+
+from blob_store import BlobStore
+
+
+@pytest.fixture
+def db(workdir):
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    conn.execute("CREATE TABLE session_files (id INTEGER PRIMARY KEY, session_id INTEGER, file_path TEXT)")
+    conn.execute("CREATE TABLE blobs (file_path TEXT PRIMARY KEY, content_hash TEXT NOT NULL, "
+                 "size INTEGER, ref_count INTEGER NOT NULL DEFAULT 0)")
+    yield conn
+    conn.close()
+
+
+def upload(store, db, session_id, content=b"a,b\n1,2\n"):
+    """与 /upload 相同的顺序：保存、登记、写入会话引用后解除锁定"""
+    blob = store.save(io.BytesIO(content), ".CSV")
+    store.register(db, blob)
+    db.execute("INSERT INTO session_files (session_id, file_path) VALUES (?, ?)", (session_id, blob["file_path"]))
+    db.commit()
+    store.unpin(blob["file_path"])
+    return blob
+
+
+def delete_session(store, db, session_id, removed):
+    paths = [row["file_path"] for row in db.execute(
+        "SELECT file_path FROM session_files WHERE session_id = ?", (session_id,))]
+    db.execute("DELETE FROM session_files WHERE session_id = ?", (session_id,))
+    unreferenced = store.sync_refs(db, paths)
+    db.commit()
+    return store.collect(db, unreferenced, on_remove=removed.append)
+
+
+def test_identical_uploads_share_one_blob(db):
+    store = BlobStore("blobs")
+    first = upload(store, db, 1)
+    second = upload(store, db, 2)
+    assert first["created"] and not second["created"]
+    assert first["file_path"] == second["file_path"]
+    assert first["file_path"].endswith(".csv")
+    assert os.path.basename(os.path.dirname(first["file_path"])) == first["content_hash"][:2]
+    assert not [name for name in os.listdir("blobs") if name.endswith(".tmp")]
+    store.sync_refs(db, [first["file_path"]])
+    assert db.execute("SELECT ref_count FROM blobs").fetchone()[0] == 2
+
+
+def test_blob_is_removed_with_its_last_reference(db):
+    store = BlobStore("blobs")
+    blob = upload(store, db, 1)
+    upload(store, db, 2)
+    removed = []
+    assert delete_session(store, db, 1, removed) == 0
+    assert os.path.exists(blob["file_path"]) and removed == []
+    assert delete_session(store, db, 2, removed) == 1
+    assert not os.path.exists(blob["file_path"])
+    assert removed == [blob["file_path"]]
+    assert db.execute("SELECT COUNT(*) FROM blobs").fetchone()[0] == 0
+
+
+def test_upload_in_progress_is_not_collected(db):
+    store = BlobStore("blobs")
+    blob = upload(store, db, 1)
+    # 相同内容的上传已找到文件，但会话引用还未写入时，另一会话被删除
+    pending = store.save(io.BytesIO(b"a,b\n1,2\n"), ".csv")
+    assert not pending["created"]
+    assert delete_session(store, db, 1, []) == 0
+    assert os.path.exists(blob["file_path"])
+
+    db.execute("INSERT INTO session_files (session_id, file_path) VALUES (2, ?)", (pending["file_path"],))
+    db.commit()
+    store.unpin(pending["file_path"])
+    assert store.collect(db, [pending["file_path"]]) == 0
+    assert os.path.exists(blob["file_path"])
+
+
+def test_files_outside_the_store_are_not_collected(db):
+    store = BlobStore("blobs")
+    assert store.sync_refs(db, ["uploads/sample.csv"]) == []
@@ -0,0 +1,67 @@
+import pandas as pd
+
+from cache import LRUCache, ResultCache, canonicalize_sql, frame_bytes
+from file_process import FileProcessor
+
+
+def frame(rows, text="x"):
+    return pd.DataFrame({"id": range(rows), "label": [text * 20] * rows})
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(3)
+    for key in "abc":
+        cache.put(key, key.upper())
+    assert cache.get("a") == "A"
+    cache.put("d", "D")
+    assert cache.get("b") is None
+    assert [key for key, _ in cache.items()] == ["c", "a", "d"]
+    assert cache.stats()["evictions"] == 1
+
+
+def test_memory_stays_within_byte_bound():
+    size = frame_bytes(frame(100))
+    cache = ResultCache(max_size=100, max_mb=1)
+    cache._memory.max_bytes = size * 3
+
+    for i in range(10):
+        cache.put("v1", f"SELECT {i}", frame(100))
+        stats = cache.stats()
+        assert stats["bytes"] <= stats["max_bytes"]
+    # 只保留最近的三个结果
+    assert cache.stats()["size"] == 3
+    assert cache.get("v1", "SELECT 9") is not None
+    assert cache.get("v1", "SELECT 6") is None
+
+    # 单个超过上限的结果不缓存，也不挤掉已有条目
+    cache.put("v1", "SELECT big", frame(1_000))
+    assert cache.get("v1", "SELECT big") is None
+    assert cache.stats()["size"] == 3
+
+
+def test_canonical_sql_shares_entry():
+    assert canonicalize_sql("select  a,b\nFROM t -- note\n;") == canonicalize_sql("SELECT a , b FROM t")
+    assert canonicalize_sql("SELECT * FROM t WHERE x = 'A'") != canonicalize_sql("SELECT * FROM t WHERE x = 'a'")
+
+    cache = ResultCache()
+    cache.put("v1", "SELECT id FROM t", frame(3))
+    assert cache.get("v1", "select id\n  from t;") is not None
+
+
+def test_key_changes_with_dataset_version(workdir):
+    path = workdir / "scores.csv"
+    path.write_text("name,score\na,1\nb,2\n")
+    processor = FileProcessor()
+    processor.materialize(str(path))
+    before = processor.get_dataset_version(str(path))
+
+    cache = ResultCache()
+    cache.put(before["content_hash"], "SELECT * FROM scores", frame(2))
+
+    path.write_text("name,score\na,1\nb,30\n")
+    processor.materialize(str(path))
+    after = processor.get_dataset_version(str(path))
+    assert after["content_hash"] != before["content_hash"]
+    assert after["schema_hash"] == before["schema_hash"]
+    assert cache.get(after["content_hash"], "SELECT * FROM scores") is None
+    assert cache.get(before["content_hash"], "SELECT * FROM scores") is not None
@@ -0,0 +1,98 @@
+import sqlite3
+
+import pytest
+
+from engines import SQLiteEngine
+from sql_guard import QueryRejected, read_only_authorizer
+
+
+def make_store(path, value):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE data (x TEXT)")
+    conn.execute("INSERT INTO data VALUES (?)", (value,))
+    conn.commit()
+    conn.close()
+
+
+def dataset(path):
+    return {"tables": {"t": {"store_path": str(path), "table": "data"}}, "row_counts": {"t": 1}}
+
+
+@pytest.fixture
+def engine(tmp_path):
+    # 常驻的目录（与查询进程中相同），先后为两个会话挂载各自的库
+    make_store(tmp_path / "a.db", "secret-a")
+    make_store(tmp_path / "b.db", "secret-b")
+    engine = SQLiteEngine(keep_open=True)
+    assert engine.execute("SELECT x FROM t", dataset(tmp_path / "a.db")).values.tolist() == [["secret-a"]]
+    yield engine
+    if engine._catalog is not None:
+        engine._catalog.close()
+
+
+def test_session_reads_its_own_tables(engine, tmp_path):
+    assert engine.execute("SELECT x FROM t", dataset(tmp_path / "b.db")).values.tolist() == [["secret-b"]]
+    df = engine.execute("WITH w AS (SELECT x FROM t) SELECT w.x FROM w JOIN t ON 1", dataset(tmp_path / "b.db"))
+    assert df.values.tolist() == [["secret-b"]]
+
+
+def test_other_sessions_stores_are_not_readable(engine, tmp_path):
+    schema = engine._catalog._schema_name(str(tmp_path / "a.db"))
+    assert str(tmp_path / "a.db") in engine._catalog._attached
+    for sql in (
+        f'SELECT x FROM "{schema}".data',
+        "SELECT x FROM data",
+        f"WITH t AS (SELECT x FROM {schema}.data) SELECT x FROM t",
+        f"SELECT name FROM {schema}.sqlite_master",
+        "SELECT sql FROM sqlite_temp_master",
+    ):
+        with pytest.raises(QueryRejected):
+            engine.execute(sql, dataset(tmp_path / "b.db"))
+
+
+def test_authorizer_limits_reads_to_readable_tables(tmp_path):
+    path = tmp_path / "store.db"
+    store = sqlite3.connect(path)
+    store.execute("CREATE TABLE a (x)")
+    store.execute("CREATE TABLE b (x)")
+    store.commit()
+    store.close()
+
+    conn = sqlite3.connect(":memory:")
+    conn.execute(f"ATTACH DATABASE '{path}' AS ds")
+    conn.set_authorizer(read_only_authorizer({("ds", "a")}))
+    conn.execute("SELECT x FROM ds.a").fetchall()
+    with pytest.raises(sqlite3.DatabaseError, match="prohibited"):
+        conn.execute("SELECT x FROM ds.b")
+    conn.close()
+
+
+def test_cte_queries_are_allowed(tmp_path):
+    conn = sqlite3.connect(tmp_path / "people.db")
+    conn.execute("CREATE TABLE data (name TEXT, city TEXT)")
+    conn.executemany("INSERT INTO data VALUES (?, ?)", [("a", "x"), ("a", "y"), ("b", "x")])
+    conn.commit()
+    conn.close()
+    people = {"tables": {"t": {"store_path": str(tmp_path / "people.db"), "table": "data"}},
+              "row_counts": {"t": 3}}
+    engine = SQLiteEngine(keep_open=True)
+    try:
+        for sql, expected in (
+            ("WITH n AS (SELECT DISTINCT name FROM t) SELECT COUNT(*) AS names FROM n", [[2]]),
+            ("WITH c AS (SELECT city, COUNT(*) AS k FROM t GROUP BY city) SELECT COUNT(*) FROM c", [[2]]),
+            ("WITH RECURSIVE r(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM r WHERE n < 3) "
+             "SELECT COUNT(*) FROM r JOIN t ON t.name = 'a'", [[6]]),
+            ("WITH c AS (SELECT city, COUNT(*) AS k FROM t GROUP BY city) "
+             "SELECT t.name, c.k FROM t JOIN c ON c.city = t.city ORDER BY t.name, c.k", [["a", 1], ["a", 2], ["b", 2]]),
+        ):
+            assert engine.execute(sql, people).values.tolist() == expected
+    finally:
+        engine._catalog.close()
+
+
+def test_rejections_report_their_reason(engine, tmp_path):
+    schema = engine._catalog._schema_name(str(tmp_path / "a.db"))
+    with pytest.raises(QueryRejected, match="dataset tables"):
+        engine.execute(f"SELECT x FROM {schema}.data", dataset(tmp_path / "b.db"))
+    with pytest.raises(QueryRejected, match="read-only"):
+        engine.execute("SELECT * FROM pragma_table_info('data')", dataset(tmp_path / "b.db"))
@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+
+from chart_data import OTHER_LABEL, build_chart_data, lttb_indices, minmax_indices, top_categories
+
+
+def wave(n):
+    rng = np.random.default_rng(0)
+    x = np.arange(n, dtype=float)
+    return x, np.sin(x / 50) * 100 + rng.normal(0, 5, n)
+
+
+def test_lttb_keeps_endpoints_and_bounds_output():
+    x, y = wave(10_000)
+    for threshold in (3, 100, 1_000):
+        indices = lttb_indices(x, y, threshold)
+        assert len(indices) == threshold
+        assert indices[0] == 0 and indices[-1] == len(x) - 1
+        assert (np.diff(indices) > 0).all()
+    assert len(lttb_indices(x[:50], y[:50], 100)) == 50
+
+
+def test_minmax_keeps_extremes_and_bounds_output():
+    x, y = wave(10_000)
+    # x 乱序：按 x 分桶，x 两端的点和 y 的极值点都应被保留
+    order = np.random.default_rng(1).permutation(len(x))
+    x, y = x[order], y[order]
+    for threshold in (2, 3, 4, 10, 100, 1_000):
+        indices = minmax_indices(x, y, threshold)
+        assert len(indices) <= threshold
+        assert len(np.unique(indices)) == len(indices)
+        kept = set(indices.tolist())
+        assert int(np.argmin(x)) in kept and int(np.argmax(x)) in kept
+        if threshold >= 4:
+            assert int(np.argmin(y)) in kept and int(np.argmax(y)) in kept
+    assert len(minmax_indices(x[:50], y[:50], 100)) == 50
+
+
+def test_top_categories_other_totals_per_series():
+    df = pd.DataFrame({
+        "city": ["a", "b", "c", "d", "a", "b", "c", "d", "e"],
+        "year": ["2023"] * 4 + ["2024"] * 5,
+        "sales": [50, 40, 3, 2, 60, 30, 4, 1, 7],
+    })
+    out = top_categories(df, "city", "sales", series="year", max_categories=3)
+    totals = {(row.city, row.year): row.sales for row in out.itertuples()}
+    assert totals == {
+        ("a", "2023"): 50, ("b", "2023"): 40, (OTHER_LABEL, "2023"): 5,
+        ("a", "2024"): 60, ("b", "2024"): 30, (OTHER_LABEL, "2024"): 12,
+    }
+    assert out["city"].iloc[-1] == OTHER_LABEL
+    assert out["sales"].sum() == df["sales"].sum()
+
+
+def test_line_chart_skips_missing_dates():
+    dates = pd.Series(pd.date_range("2024-01-01", periods=5_000, freq="h"))
+    dates[::7] = pd.NaT
+    df = pd.DataFrame({"ts": dates, "value": np.arange(5_000, dtype=float)})
+    chart = build_chart_data(df, "line", max_points=200)
+    assert chart["downsampled"] == "lttb" and chart["total"] == 5_000
+    assert len(chart["data"]["value"]) == 200
+    assert None not in chart["data"]["ts"]
+    assert chart["data"]["value"][0] == 1 and chart["data"]["value"][-1] == 4_999
@@ -0,0 +1,54 @@
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+from columnar import export_table, read_rows, take_rows
+
+ROWS = 100
+ROW_GROUP_ROWS = 7
+
+
+@pytest.fixture
+def table(tmp_path):
+    df = pd.DataFrame({
+        "id": np.arange(ROWS),
+        "score": np.arange(ROWS) / 4,
+        "name": [f"n{i}" for i in range(ROWS)],
+    })
+    conn = sqlite3.connect(tmp_path / "store.db")
+    df.to_sql("data", conn, index=False)
+    columns = [{"name": "id", "type": "int64"}, {"name": "score", "type": "float64"},
+               {"name": "name", "type": "object"}]
+    path = str(tmp_path / "store-0.parquet")
+    export_table(conn, "data", columns, path, row_group_rows=ROW_GROUP_ROWS)
+    conn.close()
+    return path, df
+
+
+def test_export_uses_row_groups(table):
+    path, _ = table
+    metadata = pq.ParquetFile(path).metadata
+    assert metadata.num_row_groups == -(-ROWS // ROW_GROUP_ROWS)
+    assert metadata.row_group(0).num_rows == ROW_GROUP_ROWS
+
+
+def test_read_rows_across_row_groups(table):
+    path, df = table
+    for offset, limit in ((0, 3), (5, 10), (6, 1), (7, 7), (13, 30), (90, 50), (0, ROWS), (ROWS, 5)):
+        expected = df.iloc[offset:offset + limit]
+        got = read_rows(path, offset, limit)
+        assert got.astype(object).values.tolist() == expected.astype(object).values.tolist()
+    got = read_rows(path, 12, 9, columns=["name"])
+    assert list(got.columns) == ["name"]
+    assert got["name"].tolist() == df["name"].iloc[12:21].tolist()
+
+
+def test_take_rows_across_row_groups(table):
+    path, df = table
+    for indices in ([0], [6, 7], [3, 20, 21, 22, 64, 99], list(range(0, ROWS, 9))):
+        got = take_rows(path, indices)
+        assert got.astype(object).values.tolist() == df.iloc[indices].astype(object).values.tolist()
+    assert take_rows(path, [], columns=["id"]).empty
@@ -0,0 +1,59 @@
+from context import build_context, compact_message, estimate_tokens
+
+SYSTEM_PROMPT = "You translate questions about the uploaded tables into SQL. " * 20
+
+
+def conversation(turns):
+    history = []
+    for i in range(turns):
+        history.append({"role": "user", "text": f"Question {i}: what is the average score by city {i}?"})
+        history.append({"role": "assistant", "text": (
+            f"Here is the result table.\n\n| city | avg |\n|---|---|\n" + "| x | 1 |\n" * 50
+            + f"```sql\nSELECT city, AVG(score) FROM t WHERE id > {i} GROUP BY city\n```"
+        )})
+    history.append({"role": "user", "text": "And the maximum?"})
+    return history
+
+
+def total_tokens(messages):
+    return sum(estimate_tokens(m["content"]) for m in messages)
+
+
+def test_keeps_newest_turns_within_budget():
+    history = conversation(60)
+    for budget in (400, 1_000, 4_096):
+        messages = build_context(SYSTEM_PROMPT, history, budget=budget)
+        assert total_tokens(messages) <= budget
+        assert messages[0] == {"role": "system", "content": SYSTEM_PROMPT}
+
+        recent = [m for m in messages[1:] if m["role"] != "system"]
+        assert recent[-1] == {"role": "user", "content": "And the maximum?"}
+        assert recent[0]["role"] == "user"
+        # 保留的是紧挨着当前问题的连续若干条
+        kept = history[len(history) - len(recent):]
+        assert [m["role"] for m in recent] == [m["role"] for m in kept]
+        assert recent[:-1] == [{"role": m["role"], "content": compact_message(m["role"], m["text"])}
+                               for m in kept[:-1]]
+
+
+def test_older_questions_are_summarized():
+    history = conversation(60)
+    messages = build_context(SYSTEM_PROMPT, history, budget=1_000)
+    summary = messages[1]
+    assert summary["role"] == "system" and summary["content"].startswith("Earlier questions")
+    # 摘要从紧挨着保留部分的问题往前取，放不下的最早问题被舍弃
+    recent = messages[2:]
+    dropped = [m["text"] for m in history[:len(history) - len(recent)] if m["role"] == "user"]
+    assert summary["content"].endswith(dropped[-1])
+    assert dropped[0] not in summary["content"]
+
+
+def test_assistant_answers_keep_only_sql():
+    compacted = compact_message("assistant", conversation(1)[1]["text"])
+    assert compacted.startswith("```sql") and "| city |" not in compacted
+
+
+def test_short_history_is_sent_whole():
+    history = conversation(2)
+    messages = build_context(SYSTEM_PROMPT, history, budget=10_000)
+    assert len(messages) == 1 + len(history)
@@ -0,0 +1,47 @@
+import pandas as pd
+import pytest
+
+from sql_guard import QueryRejected
+
+duckdb = pytest.importorskip("duckdb")
+from engines import DuckDBEngine  # noqa: E402
+
+
+@pytest.fixture
+def files(workdir):
+    pd.DataFrame({"a": [1, 2, 3]}).to_parquet(workdir / "t.parquet")
+    (workdir / "secret.csv").write_text("x\nSECRET\n")
+    return workdir
+
+
+def dataset(files):
+    return {"sources": {"t": {"path": str(files / "t.parquet"), "format": "parquet", "columns": {}}}}
+
+
+def test_dataset_views_are_readable(files):
+    df = DuckDBEngine().execute("SELECT SUM(a) AS s FROM t", dataset(files))
+    assert df["s"].tolist() == [6]
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT * FROM t JOIN '{secret}' ON true",
+    'SELECT * FROM "{secret}"',
+    "SELECT * FROM t, '{secret}' s",
+    'SELECT CAST(a AS VARCHAR) FROM t UNION ALL SELECT * FROM "{secret}"',
+    "SELECT * FROM read_csv_auto('{secret}')",
+    "SELECT * FROM read_text('{secret}')",
+    "SELECT * FROM read_parquet('{parquet}') UNION ALL SELECT * FROM glob('{glob}')",
+])
+def test_other_files_are_not_readable(files, sql):
+    sql = sql.format(secret=files / "secret.csv", parquet=files / "t.parquet", glob=files / "*")
+    with pytest.raises(QueryRejected):
+        DuckDBEngine().execute(sql, dataset(files))
+
+
+def test_configuration_is_locked(files):
+    engine = DuckDBEngine(keep_open=True)
+    engine.execute("SELECT 1", dataset(files))
+    conn = next(iter(engine._handles.values()))
+    with pytest.raises(duckdb.Error):
+        conn.execute("SET enable_external_access = true")
+    conn.close()
@@ -0,0 +1,97 @@
+import os
+import sqlite3
+
+import pytest
+
+from file_process import STORE_VERSION, FileProcessor
+
+
+@pytest.fixture
+def processor(workdir, monkeypatch):
+    processor = FileProcessor()
+    builds = []
+    build_store = processor._build_store
+
+    def counting_build(file_path, *args, **kwargs):
+        builds.append(file_path)
+        return build_store(file_path, *args, **kwargs)
+
+    monkeypatch.setattr(processor, "_build_store", counting_build)
+    processor.builds = builds
+    return processor
+
+
+def write_csv(path, rows):
+    path.write_text("name,score\n" + "".join(f"{name},{score}\n" for name, score in rows))
+    return str(path)
+
+
+def test_unchanged_file_reuses_store(processor, workdir):
+    path = write_csv(workdir / "scores.csv", [("a", 1), ("b", 2)])
+    store = processor.materialize(path)
+    assert processor.materialize(path) == store
+    assert len(processor.builds) == 1
+
+    # 只改 mtime、内容相同时不重建，只更新元数据
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert processor.materialize(path) == store
+    assert len(processor.builds) == 1
+    assert processor._read_meta(store)["mtime_ns"] == str(stat.st_mtime_ns + 10**9)
+
+
+def test_changed_file_rebuilds_store(processor, workdir):
+    path = write_csv(workdir / "scores.csv", [("a", 1), ("b", 2)])
+    store = processor.materialize(path)
+    hash_before = processor._read_meta(store)["content_hash"]
+
+    write_csv(workdir / "scores.csv", [("a", 1), ("b", 2), ("c", 3)])
+    assert processor.materialize(path) == store
+    assert len(processor.builds) == 2
+    assert processor._read_meta(store)["content_hash"] != hash_before
+    conn = sqlite3.connect(store)
+    assert conn.execute('SELECT COUNT(*) FROM "scores"').fetchone() == (3,)
+    conn.close()
+
+
+def test_store_version_bump_forces_rebuild(processor, workdir):
+    path = write_csv(workdir / "scores.csv", [("a", 1), ("b", 2)])
+    store = processor.materialize(path)
+
+    conn = sqlite3.connect(store)
+    conn.execute("UPDATE _meta SET value = ? WHERE key = 'store_version'", (f"{STORE_VERSION}-old",))
+    conn.commit()
+    conn.close()
+    assert processor._current_store(path) is None
+
+    assert processor.materialize(path) == store
+    assert len(processor.builds) == 2
+    assert processor._read_meta(store)["store_version"] == STORE_VERSION
+
+
+def column_types(store, table, column):
+    conn = sqlite3.connect(store)
+    try:
+        return {row[0] for row in conn.execute(f'SELECT DISTINCT typeof("{column}") FROM "{table}"')}
+    finally:
+        conn.close()
+
+
+def test_chunks_with_different_dtypes_share_one_storage_type(processor, workdir, monkeypatch):
+    monkeypatch.setattr(processor, "_chunk_rows", lambda file_path: 100)
+    path = workdir / "codes.csv"
+    rows = [f"{i},{i},{i}" for i in range(150)] + [f"A{i},{i}.5,{i}" for i in range(150)]
+    path.write_text("code,amount,n\n" + "\n".join(rows) + "\n")
+
+    store = processor.materialize(str(path))
+    profile = {col["name"]: col["type"] for col in processor.get_profile(str(path))["tables"][0]["columns"]}
+    assert profile == {"code": "object", "amount": "float64", "n": "int64"}
+    assert column_types(store, "codes", "code") == {"text"}
+    assert column_types(store, "codes", "amount") == {"real"}
+    assert column_types(store, "codes", "n") == {"integer"}
+
+    conn = sqlite3.connect(store)
+    assert conn.execute("SELECT code FROM codes ORDER BY rowid LIMIT 1").fetchone() == ("0",)
+    assert conn.execute("SELECT COUNT(*) FROM codes WHERE code = '42'").fetchone() == (1,)
+    assert conn.execute("SELECT COUNT(*) FROM codes").fetchone() == (300,)
+    conn.close()
@@ -0,0 +1,62 @@
+import time
+
+from ingest import IngestionManager
+
+
+class FakeSocketIO:
+    """后台任务同步执行，事件只记录不发送"""
+
+    def __init__(self):
+        self.events = []
+
+    def start_background_task(self, target, *args):
+        target(*args)
+
+    def emit(self, event, data, room=None):
+        self.events.append((event, data))
+
+    def sleep(self, seconds):
+        pass
+
+
+class FakeProcessor:
+    def materialize(self, file_path, progress=None):
+        if "bad" in file_path:
+            raise ValueError("unreadable file")
+
+    def get_profile(self, file_path):
+        return {"tables": [{"row_count": 3}]}
+
+
+def manager(**kwargs):
+    return IngestionManager(FakeSocketIO(), FakeProcessor(), **kwargs)
+
+
+def test_finished_jobs_are_capped():
+    ingestion = manager(max_finished_jobs=3)
+    jobs = [ingestion.submit(1, f"uploads/{i}.csv", f"{i}.csv") for i in range(6)]
+    # 提交时先清理，再登记新任务：此时最多 3 个已完成的任务加上刚提交的一个
+    assert len(ingestion._jobs) == 4
+    assert ingestion.get(jobs[0]["job_id"]) is None
+    assert ingestion.get(jobs[-1]["job_id"])["status"] == "ready"
+    assert set(ingestion.jobs_for_session(1)) == {f"uploads/{i}.csv" for i in range(2, 6)}
+
+
+def test_finished_jobs_expire():
+    ingestion = manager(job_ttl=60)
+    old = ingestion.submit(1, "uploads/bad.csv", "bad.csv")
+    assert ingestion.get(old["job_id"])["status"] == "failed"
+    ingestion._jobs[old["job_id"]]["finished_at"] = time.time() - 120
+
+    new = ingestion.submit(1, "uploads/good.csv", "good.csv")
+    assert ingestion.get(old["job_id"]) is None
+    assert list(ingestion.jobs_for_session(1)) == ["uploads/good.csv"]
+    assert ingestion.get(new["job_id"])["rows"] == 3
+
+
+def test_running_jobs_are_kept():
+    ingestion = manager(job_ttl=0, max_finished_jobs=0)
+    running = ingestion.submit(1, "uploads/a.csv", "a.csv")
+    ingestion._jobs[running["job_id"]].update(status="running", finished_at=None)
+    ingestion.submit(1, "uploads/b.csv", "b.csv")
+    assert ingestion.get(running["job_id"])["status"] == "running"
@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+
+from profiler import HyperLogLog, TableProfiler
+
+
+def column(profile, name):
+    return next(col for col in profile["columns"] if col["name"] == name)
+
+
+def test_hyperloglog_estimate_within_error_bound():
+    # precision=14 的标准误差约 0.8%，按 4 倍标准误差检查
+    for cardinality in (1_000, 50_000, 300_000):
+        sketch = HyperLogLog()
+        values = pd.Series(np.arange(cardinality))
+        for start in range(0, cardinality, 100_000):
+            sketch.update(values.iloc[start:start + 100_000])
+        assert abs(sketch.count() - cardinality) <= 0.033 * cardinality
+
+
+def test_hyperloglog_merge_matches_single_sketch():
+    left, right, whole = HyperLogLog(), HyperLogLog(), HyperLogLog()
+    values = pd.Series([f"v{i}" for i in range(20_000)])
+    left.update(values.iloc[:12_000])
+    right.update(values.iloc[8_000:])
+    whole.update(values)
+    left.merge(right)
+    assert left.count() == whole.count()
+
+
+def test_exact_count_below_limit():
+    profiler = TableProfiler(exact_limit=1_000)
+    for start in range(0, 900, 300):
+        profiler.update(pd.DataFrame({"id": range(start, start + 300), "kind": ["a", "b", None] * 100}))
+    profile = profiler.result()
+    assert profile["row_count"] == 900
+    assert column(profile, "id")["unique_values"] == 900
+    assert column(profile, "id")["approximate"] is False
+    assert column(profile, "kind")["unique_values"] == 2
+
+
+def test_switches_to_estimate_above_limit():
+    profiler = TableProfiler(exact_limit=1_000)
+    # 同一值在阈值前后都出现：精确集合并入草图后不应重复计数
+    for start in range(0, 3_000, 500):
+        profiler.update(pd.DataFrame({"id": np.arange(start, start + 500) % 2_000}))
+    col = column(profiler.result(), "id")
+    assert col["approximate"] is True
+    assert abs(col["unique_values"] - 2_000) <= 0.033 * 2_000
@@ -0,0 +1,103 @@
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import advisor
+import file_process
+from advisor import QueryAdvisor
+from cache import ResultCache
+from file_process import FileProcessor
+from rollups import route
+
+QUERIES = [
+    "SELECT city, COUNT(*) AS n FROM sales GROUP BY city ORDER BY city",
+    "SELECT city, grp, SUM(v) AS total_v, AVG(q) AS avg_q FROM sales WHERE grp < 3 GROUP BY city, grp ORDER BY city, grp",
+    "SELECT grp, MIN(v), MAX(v), COUNT(v) AS n FROM sales WHERE city = 'ams' GROUP BY grp HAVING SUM(q) > 10 ORDER BY grp",
+    "SELECT COUNT(*) AS n, SUM(q) FROM sales WHERE city IN ('ams', 'ber')",
+]
+
+
+@pytest.fixture
+def processor(workdir, monkeypatch):
+    rng = np.random.default_rng(0)
+    n = 5000
+    pd.DataFrame({
+        "city": rng.choice(["ams", "ber", "cph"], n),
+        "grp": rng.integers(0, 5, n),
+        "v": np.where(rng.random(n) < 0.1, np.nan, rng.random(n) * 100),
+        "q": rng.integers(1, 10, n),
+    }).to_csv(workdir / "sales.csv", index=False)
+    # 关闭结果缓存，每次都真正执行查询
+    monkeypatch.setattr(file_process, "result_cache", ResultCache(max_size=0, disk=False))
+    return FileProcessor(store_dir=str(workdir / "datasets"))
+
+
+def run(processor, sql):
+    success, result = processor.execute_query(sql, "sales.csv")
+    assert success, result
+    return result["frame"]
+
+
+def test_rollup_routing_matches_base_table(processor):
+    before = [run(processor, sql) for sql in QUERIES]
+
+    tables = processor.catalog_tables("sales.csv")
+    entry = tables["sales"]
+    created = QueryAdvisor._apply(
+        entry["store_path"], entry["table"], entry["profile"]["row_count"], ["city", "grp"],
+        [(frozenset({"city", "grp"}), {"v", "q"})],
+    )
+    # 文本列 city 在物化时已建索引
+    assert created["indexes"] == ["grp"]
+    assert created["rollups"][0]["rows"] == 15
+
+    for sql, expected in zip(QUERIES, before):
+        assert route(sql, tables) is not None, sql
+        actual = run(processor, sql)
+        assert list(actual.columns) == list(expected.columns)
+        pd.testing.assert_frame_equal(actual, expected, check_dtype=False)
+
+
+def test_unsupported_shapes_are_not_routed(processor):
+    tables = processor.catalog_tables("sales.csv")
+    entry = tables["sales"]
+    QueryAdvisor._apply(entry["store_path"], entry["table"], entry["profile"]["row_count"], [],
+                        [(frozenset({"city"}), {"v"})])
+    assert route("SELECT city, SUM(v) FROM sales GROUP BY city", tables) is not None
+    # 过滤列不在汇总表的维度中、度量列不在汇总表中、非聚合查询
+    assert route("SELECT city, SUM(v) FROM sales WHERE grp = 1 GROUP BY city", tables) is None
+    assert route("SELECT city, SUM(q) FROM sales GROUP BY city", tables) is None
+    assert route("SELECT * FROM sales WHERE city = 'ams'", tables) is None
+
+
+def test_apply_without_new_objects_keeps_store(processor):
+    entry = processor.catalog_tables("sales.csv")["sales"]
+    args = (entry["store_path"], entry["table"], entry["profile"]["row_count"], ["grp"], [])
+    QueryAdvisor._apply(*args)
+    mtime = os.stat(entry["store_path"]).st_mtime_ns
+    assert QueryAdvisor._apply(*args) == {"indexes": [], "rollups": []}
+    assert os.stat(entry["store_path"]).st_mtime_ns == mtime
+
+
+def test_apply_builds_in_place(processor, monkeypatch):
+    entry = processor.catalog_tables("sales.csv")["sales"]
+    store_path, table, rows = entry["store_path"], entry["table"], entry["profile"]["row_count"]
+    inode = os.stat(store_path).st_ino
+    assert QueryAdvisor._apply(store_path, table, rows, ["grp"], [])["indexes"] == ["grp"]
+    assert os.stat(store_path).st_ino == inode
+    assert not os.path.exists(f"{store_path}.tmp")
+
+    # 建汇总表失败时整个事务回滚，同一批的索引也不保留
+    def fail(*args):
+        raise sqlite3.OperationalError("disk I/O error")
+
+    monkeypatch.setattr(advisor, "build_rollup", fail)
+    with pytest.raises(sqlite3.OperationalError):
+        QueryAdvisor._apply(store_path, table, rows, ["q"], [(frozenset({"city"}), {"v"})])
+    conn = sqlite3.connect(store_path)
+    names = [row[0] for row in conn.execute(f'PRAGMA index_list("{table}")') if row[1].startswith("idx_adv_")]
+    conn.close()
+    assert len(names) == 1
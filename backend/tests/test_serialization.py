@@ -0,0 +1,54 @@
+import datetime
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+
+from serialization import dumps, loads, table_payload
+
+
+def round_trip(obj):
+    return loads(dumps(obj))
+
+
+def test_numeric_columns_with_missing_values():
+    df = pd.DataFrame({
+        "f": [1.5, np.nan, np.inf],
+        "i": [1, 2, 3],
+        "n": pd.array([1, None, 3], dtype="Int64"),
+        "b": [True, False, True],
+    })
+    data = round_trip(table_payload(df, total=3))["data"]
+    assert data == {"f": [1.5, None, None], "i": [1, 2, 3], "n": [1, None, 3], "b": [True, False, True]}
+
+
+def test_datetime_columns():
+    df = pd.DataFrame({
+        "ts": pd.to_datetime(["2024-01-02 03:04:05", None]),
+        "tz": pd.to_datetime(["2024-01-02 03:04:05", None]).tz_localize("UTC"),
+        "td": pd.to_timedelta(["1 days", None]),
+        "d": [datetime.date(2024, 1, 2), None],
+    })
+    data = round_trip(table_payload(df))["data"]
+    assert data["ts"] == ["2024-01-02T03:04:05", None]
+    assert data["tz"] == ["2024-01-02T03:04:05+00:00", None]
+    assert pd.Timedelta(data["td"][0]) == pd.Timedelta("1 days") and data["td"][1] is None
+    assert data["d"] == ["2024-01-02", None]
+
+
+def test_decimal_and_object_values():
+    df = pd.DataFrame({"price": [Decimal("1.10"), None, Decimal("-0.005")], "name": ["a", None, "c"]})
+    data = round_trip(table_payload(df))["data"]
+    assert data == {"price": ["1.10", None, "-0.005"], "name": ["a", None, "c"]}
+
+
+def test_scalars_outside_frames():
+    payload = {"n": np.int64(7), "x": np.float32(0.5), "nat": pd.NaT,
+               "at": pd.Timestamp("2024-01-02 03:04:05"), "arr": np.arange(3)[::2], "ids": {1}}
+    assert round_trip(payload) == {"n": 7, "x": 0.5, "nat": None, "at": "2024-01-02T03:04:05",
+                                   "arr": [0, 2], "ids": [1]}
+
+
+def test_column_slices_match_frame():
+    df = pd.DataFrame(np.arange(12, dtype=float).reshape(4, 3), columns=["a", "b", "c"])
+    assert round_trip(table_payload(df[["c", "a"]].iloc[1:3]))["data"] == {"c": [5.0, 8.0], "a": [3.0, 6.0]}
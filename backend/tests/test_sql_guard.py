@@ -0,0 +1,56 @@
+import sqlite3
+
+import pytest
+
+from sql_guard import QueryRejected, check_query, validate_sql
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE t (x INTEGER, y TEXT)")
+    conn.executemany("INSERT INTO t VALUES (?, ?)", [(i, str(i)) for i in range(10)])
+    yield conn
+    conn.close()
+
+
+def test_validate_sql_strips_comments_and_semicolon():
+    assert validate_sql("-- note\nSELECT 1; ") == "SELECT 1"
+    assert validate_sql("SELECT ';' AS s") == "SELECT ';' AS s"
+
+
+@pytest.mark.parametrize("sql", [
+    "",
+    "SELECT 1; SELECT 2",
+    "DELETE FROM t",
+    "DROP TABLE t",
+    "PRAGMA table_info(t)",
+    "ATTACH DATABASE 'x.db' AS x",
+])
+def test_validate_sql_rejects_non_queries(sql):
+    with pytest.raises(QueryRejected):
+        validate_sql(sql)
+
+
+def test_check_query_allows_reads(conn):
+    assert check_query(conn, "SELECT y, COUNT(*) FROM t GROUP BY y", {"t": 10}) \
+        == "SELECT y, COUNT(*) FROM t GROUP BY y"
+    conn.set_authorizer(None)
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT * FROM pragma_database_list",
+    "SELECT * FROM pragma_table_info('t')",
+    "SELECT name FROM sqlite_master",
+    "SELECT sql FROM sqlite_temp_master",
+])
+def test_check_query_denies_pragmas_and_schema_tables(conn, sql):
+    with pytest.raises(QueryRejected):
+        check_query(conn, sql, {"t": 10})
+    conn.set_authorizer(None)
+
+
+def test_check_query_rejects_expensive_queries(conn):
+    with pytest.raises(QueryRejected, match="too expensive"):
+        check_query(conn, "SELECT * FROM t a, t b, t c", {"t": 10_000}, max_cost=1e6)
+    conn.set_authorizer(None)
@@ -2,6 +2,22 @@ import time
 from functools import wraps
 from datetime import datetime
 
+try:
+    from eventlet import patcher, tpool
+except ImportError:  # 未安装 eventlet 时阻塞调用直接在当前线程执行
+    patcher = tpool = None
+
+
+def run_blocking(func, *args, **kwargs):
+    """
+    执行长时间不让出控制权的调用（建索引、导出 Parquet 等单条耗时的操作）。
+    eventlet 下交给系统线程池执行，事件循环在等待期间继续处理其他连接；否则直接调用。
+    func 中使用的 SQLite 连接需以 check_same_thread=False 打开。
+    """
+    if tpool is not None and patcher.is_monkey_patched("thread"):
+        return tpool.execute(func, *args, **kwargs)
+    return func(*args, **kwargs)
+
 def log_time(logger=print):
     def decorator(func):
         @wraps(func)
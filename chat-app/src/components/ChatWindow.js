@@ -1,18 +1,33 @@
 import React, { useState, useEffect, useRef } from 'react';
-import { List, Avatar, Input, Empty, Button, message, Typography, Table } from 'antd';
+import { List, Avatar, Input, Empty, Button, message, Typography } from 'antd';
 import { RobotFilled, UserOutlined, WifiOutlined, LoadingOutlined, DownloadOutlined } from '@ant-design/icons';
 import ReactMarkdown from 'react-markdown';
 import { io } from 'socket.io-client';
 import { API_BASE_URL, SOCKET_URL } from '../config';
+import { toRows, withRows } from '../tableData';
 import FileUploader from './FileUploader';
 import { Prism as SyntaxHighlighter } from 'react-syntax-highlighter';
 import { oneDark } from 'react-syntax-highlighter/dist/esm/styles/prism';
 import remarkGfm from 'remark-gfm';
 import ChartContainer from './ChartContainer';
+import ResultTable from './ResultTable';
 import jsPDF from 'jspdf';
 import 'jspdf-autotable';
 
 const { Text } = Typography;
+
+// 每次加载的历史消息条数
+const HISTORY_PAGE_SIZE = 50;
+
+// 历史消息中的查询结果只是引用，表格数据在渲染时再按需获取
+const toChatMessage = msg => ({
+    message: msg.text,
+    role: msg.role,
+    message_id: msg.id,
+    tableRef: msg.table_ref,
+    chart_type: msg.type
+});
+
 const ChatWindow = ({ session }) => {
     const [messages, setMessages] = useState([]);
     const [socket, setSocket] = useState(null);
@@ -20,26 +35,98 @@ const ChatWindow = ({ session }) => {
 
     const [isLoading, setIsLoading] = useState(false);
     const messagesEndRef = useRef(null);
-    const [uploadedFile, setUploadedFile] = useState(null);
+    // 会话中的数据集，一个会话可以上传多个文件并在查询中 JOIN
+    const [uploadedFiles, setUploadedFiles] = useState([]);
     const [showInitializing, setShowInitializing] = useState(false);
     const [initializingText, setInitializingText] = useState('');
     const chartRef = useRef(null);
+    const ingestionRef = useRef({});
+    const [hasMoreHistory, setHasMoreHistory] = useState(false);
+    const [nextBeforeId, setNextBeforeId] = useState(null);
+    const [loadingHistory, setLoadingHistory] = useState(false);
+    const requestedResultsRef = useRef(new Set());
+    const lastMessageRef = useRef(null);
 
     useEffect(() => {
-        messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' });
+        // 只在末尾有新消息时滚动到底部，加载更早的消息时保持位置
+        const last = messages[messages.length - 1];
+        if (last !== lastMessageRef.current) {
+            lastMessageRef.current = last;
+            messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' });
+        }
     }, [messages]);
 
+    // 按需获取历史消息引用的查询结果
+    useEffect(() => {
+        messages.forEach(msg => {
+            const ref = msg.tableRef;
+            if (!ref || msg.tableData || msg.chartData || requestedResultsRef.current.has(ref.result_id)) {
+                return;
+            }
+            requestedResultsRef.current.add(ref.result_id);
+
+            // 图表数据由服务端聚合/降采样，表格只取第一页
+            const isChart = msg.chart_type && msg.chart_type !== 'query';
+            const url = isChart
+                ? `${API_BASE_URL}/results/${ref.result_id}/chart?type=${msg.chart_type}`
+                : `${API_BASE_URL}/results/${ref.result_id}?limit=10`;
+            fetch(url)
+                .then(response => {
+                    if (!response.ok) {
+                        throw new Error('Failed to load result');
+                    }
+                    return response.json();
+                })
+                .then(page => {
+                    const payload = { ...withRows(page), result_id: ref.result_id };
+                    setMessages(prevMessages => prevMessages.map(m =>
+                        m.tableRef && m.tableRef.result_id === ref.result_id
+                            ? { ...m, [isChart ? 'chartData' : 'tableData']: payload }
+                            : m
+                    ));
+                })
+                .catch(error => {
+                    console.error('Error loading result:', error);
+                    requestedResultsRef.current.delete(ref.result_id);
+                });
+        });
+    }, [messages]);
+
+    const loadEarlierMessages = async () => {
+        if (!nextBeforeId || loadingHistory) {
+            return;
+        }
+        setLoadingHistory(true);
+        try {
+            const response = await fetch(
+                `${API_BASE_URL}/sessions/${session.id}/messages?before_id=${nextBeforeId}&limit=${HISTORY_PAGE_SIZE}`
+            );
+            if (!response.ok) {
+                throw new Error('Failed to fetch messages');
+            }
+            const data = await response.json();
+            setMessages(prevMessages => [...data.messages.map(toChatMessage), ...prevMessages]);
+            setHasMoreHistory(data.has_more);
+            setNextBeforeId(data.next_before_id);
+        } catch (error) {
+            console.error('Failed to load earlier messages:', error);
+            message.error(error.message);
+        } finally {
+            setLoadingHistory(false);
+        }
+    };
+
 
     useEffect(() => {
         if (session.id) {
             const fetchSessionData = async () => {
                 try {
-                    const [messagesResponse, fileResponse] = await Promise.all([
-                        fetch(`${API_BASE_URL}/sessions/${session.id}/messages`, {
+                    const [messagesResponse, filesResponse] = await Promise.all([
+                        fetch(`${API_BASE_URL}/sessions/${session.id}/messages?limit=${HISTORY_PAGE_SIZE}`, {
                             method: 'GET',
                             headers: { 'Content-Type': 'application/json' },
                         }),
-                        fetch(`${API_BASE_URL}/sessions/${session.id}/file`, {
+                        fetch(`${API_BASE_URL}/sessions/${session.id}/files`, {
                             method: 'GET',
                             headers: { 'Content-Type': 'application/json' },
                         })
@@ -49,28 +136,23 @@ const ChatWindow = ({ session }) => {
                     if (messagesResponse.ok) {
                         const data = await messagesResponse.json();
                         console.log("data:", data);
-                        setMessages(
-                            data.messages.map(msg => ({
-                                message: msg.text,
-                                role: msg.role,
-                                message_id: msg.id,
-                                tableData: msg.table_data,
-                                chart_type: msg.type
-                            }))
-                        );
+                        setMessages(data.messages.map(toChatMessage));
+                        setHasMoreHistory(data.has_more);
+                        setNextBeforeId(data.next_before_id);
                     } else {
                         console.error('Failed to fetch messages');
                     }
 
                     // 处理文件数据
-                    if (fileResponse.ok) {
-                        const data = await fileResponse.json();
-                        if (data.file) {
-                            setUploadedFile({
-                                name: data.file.file_name,
-                                filePath: data.file.file_path
-                            });
-                        }
+                    if (filesResponse.ok) {
+                        const data = await filesResponse.json();
+                        setUploadedFiles(data.files.map(file => ({
+                            name: file.file_name,
+                            filePath: file.file_path,
+                            jobId: file.job_id,
+                            status: file.status,
+                            percent: file.percent
+                        })));
                     }
                 } catch (error) {
                     console.error('Failed to fetch session data:', error);
@@ -84,6 +166,22 @@ const ChatWindow = ({ session }) => {
     const initializeSocket = () => {
         const newSocket = io(SOCKET_URL);
 
+        newSocket.on('ingestion_progress', progress => {
+            // 进度事件可能早于上传响应到达，先记录下来
+            ingestionRef.current[progress.job_id] = progress;
+            setUploadedFiles(prevFiles => prevFiles.map(prevFile => {
+                if (prevFile.jobId !== progress.job_id) {
+                    return prevFile;
+                }
+                if (progress.status === 'ready' && prevFile.status !== 'ready') {
+                    message.success(`${prevFile.name} is ready for questions`);
+                } else if (progress.status === 'failed' && prevFile.status !== 'failed') {
+                    message.error(`Failed to process ${prevFile.name}: ${progress.error}`);
+                }
+                return { ...prevFile, status: progress.status, percent: progress.percent };
+            }));
+        });
+
         newSocket.on('message_received', () => {
             console.log('Message received confirmation from server');
             setInitializingText('analyzing');
@@ -100,7 +198,9 @@ const ChatWindow = ({ session }) => {
                     if (lastMessage && lastMessage.role === 'assistant') {
                         updatedMessages[updatedMessages.length - 1] = {
                             ...lastMessage,
-                            tableData: message.table_data,
+                            tableData: withRows(message.table_data),
+                            // 图表数据（降采样/聚合后）单独下发，不覆盖表格的第一页
+                            chartData: withRows(message.chart_data),
                             chart_type: message.chart_type
                         };
                         console.log("chart_type:", message.chart_type);
@@ -130,8 +230,42 @@ const ChatWindow = ({ session }) => {
             });
         });
 
+        // 查询过程中服务端分批推送第一页数据，收到后立即渲染并确认（ack），
+        // 查询完成后由 receive_message 中的 table_data 替换为完整的第一页
+        newSocket.on('result_stream', (chunk, ack) => {
+            if (ack) {
+                ack();
+            }
+            if (chunk.done) {
+                return;
+            }
+            setShowInitializing(false);
+            setMessages(prevMessages => {
+                const updatedMessages = [...prevMessages];
+                const lastMessage = updatedMessages[updatedMessages.length - 1];
+                if (!lastMessage || lastMessage.role !== 'assistant') {
+                    return prevMessages;
+                }
+                const previousRows = lastMessage.tableData?.streaming && chunk.offset > 0
+                    ? lastMessage.tableData.dataSource
+                    : [];
+                updatedMessages[updatedMessages.length - 1] = {
+                    ...lastMessage,
+                    chart_type: chunk.chart_type,
+                    tableData: {
+                        columns: chunk.columns,
+                        dataSource: [...previousRows, ...toRows(chunk.columns, chunk.data)],
+                        streaming: true
+                    }
+                };
+                return updatedMessages;
+            });
+        });
+
         newSocket.on('connect', () => {
             console.log('Socket connected');
+            // 加入会话房间（重连后也需重新加入），接收数据集导入进度
+            newSocket.emit('join_session', { session_id: session.id });
         });
 
         newSocket.on('connect_error', (error) => {
@@ -142,16 +276,58 @@ const ChatWindow = ({ session }) => {
         return newSocket;
     };
 
+    // 每个会话建立一次连接，以便上传后立即接收导入进度
+    useEffect(() => {
+        if (session.id) {
+            initializeSocket();
+        }
+        // eslint-disable-next-line react-hooks/exhaustive-deps
+    }, [session.id]);
+
+    // 上传完成后加入会话的数据集列表，同一文件重新上传时替换原记录
     const handleFileChange = (fileInfo) => {
-        setUploadedFile(fileInfo);
+        const progress = fileInfo.jobId && ingestionRef.current[fileInfo.jobId];
+        const file = progress
+            ? { ...fileInfo, status: progress.status, percent: progress.percent }
+            : fileInfo;
+        setUploadedFiles(prevFiles => [
+            ...prevFiles.filter(prevFile => prevFile.filePath !== file.filePath),
+            file
+        ]);
+    };
+
+    const handleFileRemove = async (filePath) => {
+        try {
+            const response = await fetch(`${API_BASE_URL}/sessions/${session.id}/files`, {
+                method: 'DELETE',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ file_path: filePath })
+            });
+            if (!response.ok && response.status !== 404) {
+                throw new Error('Failed to remove file');
+            }
+            setUploadedFiles(prevFiles => prevFiles.filter(file => file.filePath !== filePath));
+        } catch (error) {
+            console.error('Error removing file:', error);
+            message.error(error.message);
+        }
     };
 
+    const preparingFile = uploadedFiles.find(file =>
+        file.status === 'pending' || file.status === 'running');
+    const isDatasetPreparing = Boolean(preparingFile);
+
     const handleSendMessage = () => {
-        if (!uploadedFile) {
+        if (!uploadedFiles.length) {
             message.warning('Please upload a CSV or PDF file before sending messages');
             return;
         }
 
+        if (isDatasetPreparing) {
+            message.info('The dataset is still being prepared, please wait a moment');
+            return;
+        }
+
         if (newMessage.trim()) {
             const userMessage = { role: 'user', message: newMessage };
             setMessages(prevMessages => [...prevMessages, userMessage]);
@@ -201,7 +377,10 @@ const ChatWindow = ({ session }) => {
     );
 
     const handleTableExport = (data, type) => {
-        if (type === 'csv') {
+        if (type === 'csv' && data.result_id !== undefined) {
+            // 完整结果保存在服务端，直接下载
+            window.open(`${API_BASE_URL}/results/${data.result_id}/csv`, '_blank');
+        } else if (type === 'csv') {
             const headers = data.columns.map(col => col.title).join(',');
             const rows = data.dataSource.map(row =>
                 data.columns.map(col => row[col.dataIndex]).join(',')
@@ -344,22 +523,7 @@ const ChatWindow = ({ session }) => {
             {msg.tableData && (!msg.chart_type || msg.chart_type === 'query') && (
                 <div style={{ marginTop: msg.message ? '16px' : 0 }}>
 
-                    <Table
-                        columns={msg.tableData.columns.map(col => ({
-                            ...col,
-                            key: col.dataIndex || col.key || col.title,
-                        }))}
-                        dataSource={msg.tableData.dataSource.map((item, idx) => ({
-                            ...item,
-                            key: item.key || `row-${idx}`,
-                        }))}
-                        scroll={{ x: true }}
-                        size="large"
-                        pagination={{
-                            hideOnSinglePage: true,    // 只有一页时隐藏分页器
-                            pageSize: 10               // 每页显示的条数，可以根据需要调整
-                        }}
-                    />
+                    <ResultTable tableData={msg.tableData} />
                     <div style={{ display: 'flex', justifyContent: 'flex-end', marginBottom: '8px' }}>
                         <Button.Group size="large">
                             <Button
@@ -384,6 +548,13 @@ const ChatWindow = ({ session }) => {
     return (
         <div className="chat-container">
             <div className="messages-container">
+                {hasMoreHistory && (
+                    <div style={{ textAlign: 'center', margin: '8px 0' }}>
+                        <Button type="link" loading={loadingHistory} onClick={loadEarlierMessages}>
+                            Load earlier messages
+                        </Button>
+                    </div>
+                )}
                 <List
                     dataSource={messages}
                     renderItem={(msg, index) => (
@@ -404,7 +575,7 @@ const ChatWindow = ({ session }) => {
                                 )}
                             </div>
 
-                            {msg.role === 'assistant' && msg.tableData && msg.chart_type && msg.chart_type !== 'query' && (
+                            {msg.role === 'assistant' && msg.chartData && msg.chart_type && msg.chart_type !== 'query' && (
                                 <div className="chart-wrapper" style={{
                                     marginLeft: '48px',
                                     marginRight: '48px',
@@ -412,8 +583,8 @@ const ChatWindow = ({ session }) => {
                                 }}>
                                     <ChartContainer
                                         type={msg.chart_type}
-                                        data={msg.tableData.dataSource}
-                                        columns={msg.tableData.columns}
+                                        data={msg.chartData.dataSource}
+                                        columns={msg.chartData.columns}
                                         ref={chartRef}
                                     />
                                 </div>
@@ -459,13 +630,16 @@ const ChatWindow = ({ session }) => {
                 <div className="chat-input-container">
                     <FileUploader
                         sessionId={session.id}
-                        onFileChange={setUploadedFile}
-                        uploadedFile={uploadedFile}
+                        onFileChange={handleFileChange}
+                        onFileRemove={handleFileRemove}
+                        uploadedFiles={uploadedFiles}
                     />
                     <Input
-                        placeholder={uploadedFile
-                            ? "Type your question here..."
-                            : "Please upload a file first"}
+                        placeholder={!uploadedFiles.length
+                            ? "Please upload a file first"
+                            : isDatasetPreparing
+                                ? `Preparing ${preparingFile.name}... ${preparingFile.percent || 0}%`
+                                : "Type your question here..."}
                         value={newMessage}
                         onChange={e => setNewMessage(e.target.value)}
                         onPressEnter={handleSendMessage}
@@ -2,26 +2,31 @@ import React, { useState, useEffect } from 'react';
 import { UploadOutlined } from '@ant-design/icons';
 import { Button, message, Upload, Modal, Table, Tooltip } from 'antd';
 import { API_BASE_URL } from '../config';
+import { withRows } from '../tableData';
 import '../styles/FileUploader.css';
 
-const FileUploader = ({ sessionId, onFileChange, uploadedFile }) => {
+const PREVIEW_PAGE_SIZE = 50;
+
+const FileUploader = ({ sessionId, onFileChange, onFileRemove, uploadedFiles }) => {
     const [fileList, setFileList] = useState([]);
     const [previewVisible, setPreviewVisible] = useState(false);
     const [previewData, setPreviewData] = useState(null);
+    const [previewFile, setPreviewFile] = useState(null);
+    const [previewLoading, setPreviewLoading] = useState(false);
     const [isMobile, setIsMobile] = useState(window.innerWidth <= 768);
 
+    // 会话中的数据集，保留正在上传的文件
     useEffect(() => {
-        if (uploadedFile) {
-            setFileList([{
-                uid: '-1',
-                name: uploadedFile.name,
+        setFileList(prevList => [
+            ...uploadedFiles.map(file => ({
+                uid: file.filePath,
+                name: file.name,
                 status: 'done',
-                url: uploadedFile.filePath
-            }]);
-        } else {
-            setFileList([]);
-        }
-    }, [uploadedFile]);
+                url: file.filePath
+            })),
+            ...prevList.filter(file => file.status === 'uploading')
+        ]);
+    }, [uploadedFiles]);
 
     useEffect(() => {
         const handleResize = () => {
@@ -32,9 +37,10 @@ const FileUploader = ({ sessionId, onFileChange, uploadedFile }) => {
         return () => window.removeEventListener('resize', handleResize);
     }, []);
 
-    const handlePreview = async (file) => {
+    // 预览在上传时生成，翻页和随机抽样由服务端按行号读取
+    const loadPreview = async (filePath, { offset = 0, sample = false } = {}) => {
         try {
-            setPreviewData(null);
+            setPreviewLoading(true);
             
             const response = await fetch(`${API_BASE_URL}/preview_csv`, {
                 method: 'POST',
@@ -42,7 +48,10 @@ const FileUploader = ({ sessionId, onFileChange, uploadedFile }) => {
                     'Content-Type': 'application/json',
                 },
                 body: JSON.stringify({
-                    file_path: file.url || uploadedFile?.filePath
+                    file_path: filePath,
+                    offset,
+                    limit: PREVIEW_PAGE_SIZE,
+                    sample
                 })
             });
 
@@ -51,13 +60,14 @@ const FileUploader = ({ sessionId, onFileChange, uploadedFile }) => {
                 throw new Error(errorData.error || 'Failed to load preview');
             }
 
-            const data = await response.json();
+            const data = withRows(await response.json());
             
             if (!data.columns || !data.dataSource) {
                 throw new Error('Invalid preview data format');
             }
 
             const processedData = {
+                ...data,
                 columns: data.columns,
                 dataSource: data.dataSource.map(row => {
                     const processedRow = {};
@@ -73,13 +83,25 @@ const FileUploader = ({ sessionId, onFileChange, uploadedFile }) => {
         } catch (error) {
             console.error('Error loading preview:', error);
             message.error(error.message || 'Error loading file preview');
+        } finally {
+            setPreviewLoading(false);
+        }
+    };
+
+    const handlePreview = (file) => {
+        const filePath = file.url || file.response?.file_path;
+        if (!filePath) {
+            return;
         }
+        setPreviewData(null);
+        setPreviewFile({ name: file.name, filePath });
+        loadPreview(filePath);
     };
 
     const props = {
         name: 'file',
         action: `${API_BASE_URL}/upload`,
-        maxCount: 1,    
+        multiple: true,
         accept: '.csv,.xlsx,.xls',
         fileList: fileList,
         data: (file) => {
@@ -110,17 +132,19 @@ const FileUploader = ({ sessionId, onFileChange, uploadedFile }) => {
             if (info.file.status === 'done') {
                 const filePath = info.file.response?.file_path;
                 if (filePath) {
-                    message.success(`${info.file.name} file uploaded successfully`);
+                    message.success(`${info.file.name} file uploaded, preparing dataset...`);
                     onFileChange({
                         name: info.file.name,
-                        filePath: filePath
+                        filePath: filePath,
+                        jobId: info.file.response?.job_id,
+                        status: info.file.response?.status,
+                        percent: 0
                     });
                 }
             } else if (info.file.status === 'error') {
                 message.error(`${info.file.name} file upload failed.`);
-                onFileChange(null);
-            } else if (info.file.status === 'removed') {
-                onFileChange(null);
+            } else if (info.file.status === 'removed' && info.file.url) {
+                onFileRemove(info.file.url);
             }
             setFileList(info.fileList);
         },
@@ -164,10 +188,17 @@ const FileUploader = ({ sessionId, onFileChange, uploadedFile }) => {
             </Upload>
             
             <Modal
-                title={`Preview: ${uploadedFile?.name}`}
+                title={`Preview: ${previewFile?.name}`}
                 open={previewVisible}
                 onCancel={() => setPreviewVisible(false)}
-                footer={null}
+                footer={previewData?.ready ? [
+                    <Button key="sample" loading={previewLoading} onClick={() => loadPreview(previewFile.filePath, { sample: true })}>
+                        Random Sample
+                    </Button>,
+                    <Button key="first" disabled={!previewData.sample} onClick={() => loadPreview(previewFile.filePath)}>
+                        First Rows
+                    </Button>
+                ] : null}
                 width={1200}
                 centered
                 style={{ 
@@ -187,7 +218,14 @@ const FileUploader = ({ sessionId, onFileChange, uploadedFile }) => {
                             y: 500
                         }}
                         size="large"
-                        pagination={false}
+                        loading={previewLoading}
+                        pagination={previewData.total && !previewData.sample ? {
+                            current: Math.floor(previewData.offset / PREVIEW_PAGE_SIZE) + 1,
+                            pageSize: PREVIEW_PAGE_SIZE,
+                            total: previewData.total,
+                            showSizeChanger: false,
+                            onChange: page => loadPreview(previewFile.filePath, { offset: (page - 1) * PREVIEW_PAGE_SIZE })
+                        } : false}
                     />
                 )}
             </Modal>
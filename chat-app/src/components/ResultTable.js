@@ -0,0 +1,95 @@
+import React, { useState, useEffect } from 'react';
+import { Table, Typography, message } from 'antd';
+import { API_BASE_URL } from '../config';
+import { withRows } from '../tableData';
+
+const PAGE_SIZE = 10;
+const { Text } = Typography;
+
+// 结果表格：完整结果保存在服务端，按页、排序条件向 /results 请求数据
+const ResultTable = ({ tableData }) => {
+    const [rows, setRows] = useState(tableData.dataSource);
+    const [total, setTotal] = useState(tableData.total ?? tableData.dataSource.length);
+    const [loading, setLoading] = useState(false);
+    const [query, setQuery] = useState({ current: 1, pageSize: PAGE_SIZE, sort: null, order: null });
+
+    // 第一页已随消息一起下发，数据不足时才请求服务端
+    const isRemote = tableData.result_id !== undefined && total > tableData.dataSource.length;
+
+    useEffect(() => {
+        setRows(tableData.dataSource);
+        setTotal(tableData.total ?? tableData.dataSource.length);
+    }, [tableData]);
+
+    const fetchPage = async ({ current, pageSize, sort, order }) => {
+        const params = new URLSearchParams({
+            offset: (current - 1) * pageSize,
+            limit: pageSize,
+        });
+        if (sort) {
+            params.append('sort', sort);
+            params.append('order', order);
+        }
+
+        setLoading(true);
+        try {
+            const response = await fetch(`${API_BASE_URL}/results/${tableData.result_id}?${params}`);
+            if (!response.ok) {
+                throw new Error('Failed to load result page');
+            }
+            const data = withRows(await response.json());
+            setRows(data.dataSource);
+            setTotal(data.total);
+        } catch (error) {
+            console.error('Error loading result page:', error);
+            message.error(error.message);
+        } finally {
+            setLoading(false);
+        }
+    };
+
+    const handleChange = (pagination, filters, sorter) => {
+        const next = {
+            current: pagination.current,
+            pageSize: pagination.pageSize,
+            sort: sorter.order ? sorter.field : null,
+            order: sorter.order === 'descend' ? 'desc' : 'asc',
+        };
+        setQuery(next);
+        if (isRemote) {
+            fetchPage(next);
+        }
+    };
+
+    const dataSource = rows.map((item, idx) => ({
+        ...item,
+        key: item.key || `row-${idx}`,
+    }));
+
+    return (
+        <Table
+            columns={tableData.columns.map(col => ({
+                ...col,
+                key: col.dataIndex || col.key || col.title,
+                sorter: isRemote ? true : undefined,
+            }))}
+            dataSource={dataSource}
+            loading={loading}
+            onChange={handleChange}
+            scroll={{ x: true }}
+            size="large"
+            footer={tableData.truncated ? () => (
+                // 服务端限制了单次查询返回的行数
+                <Text type="secondary">Result truncated to the first {total} rows.</Text>
+            ) : undefined}
+            pagination={{
+                hideOnSinglePage: true,    // 只有一页时隐藏分页器
+                pageSize: query.pageSize,  // 每页显示的条数，可以根据需要调整
+                current: query.current,
+                total: isRemote ? total : undefined,
+            }}
+        />
+    );
+};
+
+export default ResultTable;
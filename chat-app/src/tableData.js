@@ -0,0 +1,26 @@
+// 服务端的表格数据按列编码：{ columns, data: { 列名: [值...] } }，
+// 在客户端展开为 antd Table / 图表使用的行数组 dataSource
+export const toRows = (columns, data) => {
+    if (!data) {
+        return [];
+    }
+    const keys = columns.map(col => col.dataIndex);
+    const length = keys.length ? (data[keys[0]] || []).length : 0;
+    const rows = new Array(length);
+    for (let i = 0; i < length; i++) {
+        const row = {};
+        for (const key of keys) {
+            row[key] = data[key][i];
+        }
+        rows[i] = row;
+    }
+    return rows;
+};
+
+export const withRows = (payload) => {
+    if (!payload || payload.dataSource || !payload.data) {
+        return payload;
+    }
+    const { data, ...rest } = payload;
+    return { ...rest, dataSource: toRows(payload.columns, data) };
+};